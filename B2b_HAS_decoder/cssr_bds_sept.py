@@ -7,7 +7,7 @@ Precise Point Positioning Service Signal PPP-B2b (Version 1.0), 2020
 
 import numpy as np
 import bitstruct as bs
-from B2b_HAS_decoder.cssrlib import cssr, sCSSR, sCSSRTYPE, sGNSS, prn2sat, sCType
+from B2b_HAS_decoder.cssrlib import cssr, sCSSR, sCSSRTYPE, sGNSS, prn2sat, sCType, bs_unpack, bs_unpack_blocks
 from B2b_HAS_decoder.gnss import bdt2time, bdt2gpst, uGNSS, uSIG, uTYP, rSigRnx,sat2prn,time2str,sat2id,time2epoch,timediff,vnorm,rCST
 from B2b_HAS_decoder.ephemeris import eph2pos, findeph,eph2rel
 from B2b_HAS_decoder.peph import peph,peph_t
@@ -101,8 +101,7 @@ class cssr_bds(cssr):
         return sys, prn
 
     def decode_head(self, msg, i, st=-1):
-        self.tod, _, iodssr = bs.unpack_from('u17u4u2', msg, i)
-        i += 23
+        (self.tod, _, iodssr), i = bs_unpack('u17u4u2', msg, i)
 
         if st == sCSSR.MASK:
             self.iodssr = iodssr
@@ -190,23 +189,16 @@ class cssr_bds(cssr):
         self.log_msg("decode_ssr_mask: iodp= "+str(self.iodp))
         return i
 
-    def decode_cssr_orb_sat(self, msg, i, inet, sat_n):
-        slot, iodn, iodc = bs.unpack_from('u9u10u3', msg, i)
-        i += 22
-
-        dx, dy, dz = bs.unpack_from('s{:d}s{:d}s{:d}'.format(
-            self.dorb_blen[0], self.dorb_blen[1], self.dorb_blen[2]), msg, i)
-        i += self.dorb_blen[0] + self.dorb_blen[1] + self.dorb_blen[2]
-
-        ucls, uval = bs.unpack_from('u3u3', msg, i)
-        i += 6
+    def set_cssr_orb_sat(self, v, inet, sat_n):
+        """ set orbit correction for satellite from unpacked block """
+        slot, iodn, iodc, dx, dy, dz, ucls, uval = v
 
         sys, prn = self.slot2prn(slot)
         if sys == uGNSS.NONE:
-            return i
+            return
         sat = prn2sat(sys, prn)
         if sat not in sat_n:
-            return i
+            return
 
         if (sys == uGNSS.GPS) or (sys == uGNSS.BDS):
             iodn = iodn & 0xff  # IODC -> IODE
@@ -226,15 +218,22 @@ class cssr_bds(cssr):
 
         self.lc[inet].t0[sat][sCType.ORBIT] = self.time
 
-        str_cssr_orb_sat = 'cssr_orb_sat: %s %s %d %.3f %.3f %.3f ' %(sat2id(sat), time2str(self.time), iodc, dorb[0], dorb[1], dorb[2])
-        self.log_msg(str_cssr_orb_sat)
-
+        if self.monlevel > 0 and self.fh is not None:
+            str_cssr_orb_sat = 'cssr_orb_sat: %s %s %d %.3f %.3f %.3f ' %(sat2id(sat), time2str(self.time), iodc, dorb[0], dorb[1], dorb[2])
+            self.log_msg(str_cssr_orb_sat)
+
+    def decode_cssr_orb_sat(self, msg, i, inet, sat_n, nsat=1):
+        """ decode orbit corrections for nsat satellites """
+        fmt = 'u9u10u3s{:d}s{:d}s{:d}u3u3'.format(*self.dorb_blen)
+        v, i = bs_unpack_blocks(fmt, nsat, msg, i, self.bit_gather)
+        for vs in v:
+            self.set_cssr_orb_sat(vs, inet, sat_n)
         return i
 
     def decode_cssr_orb(self, msg, i, inet=0):
         """decode MT2 orbit + URA message """
         head, i = self.decode_head(msg, i)
-        sat_n = np.array(self.sat_n)
+        sat_n = set(self.sat_n)
 
         if self.iodssr != head['iodssr']:
             return -1
@@ -245,8 +244,7 @@ class cssr_bds(cssr):
         # self.lc[inet].dorb[sat] = dorb
         # self.iodssr_c[sCType.ORBIT]
         # self.lc[inet].t0[sat][sCType.ORBIT] = self.time
-        for k in range(6):
-            i = self.decode_cssr_orb_sat(msg, i, inet, sat_n)
+        i = self.decode_cssr_orb_sat(msg, i, inet, sat_n, 6)
 
         self.iodssr_c[sCType.ORBIT] = head['iodssr']
         self.lc[inet].cstat |= (1 << sCType.ORBIT)
@@ -262,13 +260,11 @@ class cssr_bds(cssr):
         if self.iodssr != head['iodssr']:
             return -1
 
-        sat_n = np.array(self.sat_n)
-        nsat = bs.unpack_from('u5', msg, i)[0]
-        i += 5
+        sat_n = set(self.sat_n)
+        (nsat,), i = bs_unpack('u5', msg, i)
 
         for k in range(nsat):
-            slot, nsig = bs.unpack_from('u9u4', msg, i)
-            i += 13
+            (slot, nsig), i = bs_unpack('u9u4', msg, i)
             sys, prn = self.slot2prn(slot)
             sat = prn2sat(sys, prn)
             if sat not in sat_n:
@@ -278,10 +274,9 @@ class cssr_bds(cssr):
             self.lc[inet].t0[sat][sCType.CBIAS] = self.time
 
             self.lc[inet].cbias[sat] = {}
-            for j in range(0, nsig):
-                sig, cb = bs.unpack_from(
-                    'u4s{:d}'.format(self.cb_blen), msg, i)
-                i += 4+self.cb_blen
+            v, i = bs_unpack_blocks('u4s{:d}'.format(self.cb_blen), nsig, msg,
+                                    i, self.bit_gather)
+            for sig, cb in v:
                 sig_ = self.ssig2rsig(sys, uTYP.C, sig)
                 self.lc[inet].cbias[sat][sig_] = self.sval(
                     cb, self.cb_blen, self.cb_scl)
@@ -291,11 +286,8 @@ class cssr_bds(cssr):
 
         return i
 
-    def decode_cssr_clk_sat(self, msg, i, inet, sat):
-        """ decode clock correction for satellite """
-        iodc, dclk = bs.unpack_from('u3s{:d}'.format(self.dclk_blen), msg, i)
-        i += 3+self.dclk_blen
-
+    def set_cssr_clk_sat(self, inet, sat, iodc, dclk):
+        """ set clock correction for satellite from unpacked fields """
         if sat in self.lc[inet].iodc_c.keys() and \
                 iodc != self.lc[inet].iodc_c[sat]:
             self.lc[inet].iodc_c_p[sat] = self.lc[inet].iodc_c[sat]
@@ -304,9 +296,15 @@ class cssr_bds(cssr):
         # note: the sign of the clock correction reversed
         self.lc[inet].dclk[sat] = - \
             self.sval(dclk, self.dclk_blen, self.dclk_scl)
-        if ~np.isnan(self.lc[inet].dclk[sat]):
+        if self.monlevel > 0 and self.fh is not None and \
+                ~np.isnan(self.lc[inet].dclk[sat]):
             str_cssr_clk_sat = 'cssr_clk_sat: %s %s %d %.3f ' % (sat2id(sat), time2str(self.time), iodc, self.lc[inet].dclk[sat])
             self.log_msg(str_cssr_clk_sat)
+
+    def decode_cssr_clk_sat(self, msg, i, inet, sat):
+        """ decode clock correction for satellite """
+        (iodc, dclk), i = bs_unpack('u3s{:d}'.format(self.dclk_blen), msg, i)
+        self.set_cssr_clk_sat(inet, sat, iodc, dclk)
         return i
 
     def decode_cssr_clk(self, msg, i, inet=0):
@@ -315,8 +313,7 @@ class cssr_bds(cssr):
         if self.iodssr != head['iodssr']:
             return -1
 
-        iodp, st1 = bs.unpack_from('u4u5', msg, i)
-        i += 9
+        (iodp, st1), i = bs_unpack('u4u5', msg, i)
         # self.iodp here is decoded from the mask. If it doesn't match, skip decoding the corresponding content
         if iodp != self.iodp:
             i += 23*18+10
@@ -327,11 +324,13 @@ class cssr_bds(cssr):
         # Satellite clock bias correction:     self.lc[inet].dclk[sat] =
         # The time for this satellite:   self.lc[inet].t0[sat][sCType.CLOCK] = self.time (this stores the time for each parameter)
         # Clock bias IOD SSR:   self.iodssr_c[sCType.CLOCK] = head['iodssr']
+        v, i = bs_unpack_blocks('u3s{:d}'.format(self.dclk_blen), 23, msg, i,
+                                self.bit_gather)
         for k in range(23):
             idx = st1*23+k
             if idx < self.nsat_n:
                 sat = self.sat_n[idx]
-                i = self.decode_cssr_clk_sat(msg, i, inet, sat)
+                self.set_cssr_clk_sat(inet, sat, *v[k])
                 if sat not in self.lc[inet].t0:
                     self.lc[inet].t0[sat] = {}
                 self.lc[inet].t0[sat][sCType.CLOCK] = self.time
@@ -348,16 +347,14 @@ class cssr_bds(cssr):
         if self.iodssr != head['iodssr']:
             return -1
 
-        iodp, st2 = bs.unpack_from('u4u3', msg, i)
-        i += 7
+        (iodp, st2), i = bs_unpack('u4u3', msg, i)
 
+        v, i = bs_unpack_blocks('u3u3', 70, msg, i, self.bit_gather)
         for k in range(70):
-            v = bs.unpack_from_dict('u3u3', ['class', 'val'], msg, i)
-            i += 6
             idx = st2*70+k
             if idx < self.nsat_n:
                 sat = self.sat_n[idx]
-                self.ura[sat] = self.quality_idx(v['class'], v['val'])
+                self.ura[sat] = self.quality_idx(v[k][0], v[k][1])
 
         self.lc[0].cstat |= (1 << sCType.URA)
         # self.lc[0].t0[0][sCType.URA] = self.time
@@ -366,7 +363,7 @@ class cssr_bds(cssr):
     def decode_cssr_comb1(self, msg, i, inet=0):
         """decode MT6 combined message #1 """
         numc, numo = bs.unpack_from('u5u3', msg, i)
-        sat_n = np.array(self.sat_n)
+        sat_n = set(self.sat_n)
 
         if numc > 0:
             tod, _, iodssr, iodp, slot_s = \
@@ -380,15 +377,14 @@ class cssr_bds(cssr):
         if numo > 0:
             tod, _, iodssr = bs.unpack_from('u17u4u2', msg, i)
             i += 23
-            for k in range(numo):
-                i = self.decode_cssr_orb_sat(msg, i, inet, sat_n)
+            i = self.decode_cssr_orb_sat(msg, i, inet, sat_n, numo)
 
         return i
 
     def decode_cssr_comb2(self, msg, i, inet=0):
         """decode MT7 combined message #2 """
         numc, numo = bs.unpack_from('u5u3', msg, i)
-        sat_n = np.array(self.sat_n)
+        sat_n = set(self.sat_n)
 
         if numc > 0:
             tod, _, iodssr = bs.unpack_from('u17u4u2', msg, i)
@@ -403,14 +399,13 @@ class cssr_bds(cssr):
         if numo > 0:
             tod, _, iodssr = bs.unpack_from('u17u4u2', msg, i)
             i += 23
-            for k in range(numo):
-                i = self.decode_cssr_orb_sat(msg, i, inet, sat_n)
+            i = self.decode_cssr_orb_sat(msg, i, inet, sat_n, numo)
 
         return i
 
     def decode_cssr(self, msg, i=0):
-        mt = bs.unpack_from('u6', msg, i)[0]
-        i += 6
+        self.unshare()  # copy corrections held by snapshot before update
+        (mt,), i = bs_unpack('u6', msg, i)
 
         if mt == 1:
             self.subtype = sCSSR.MASK
@@ -610,6 +605,7 @@ class cssr_bds(cssr):
         encodeRTCM=1
         orbit_data = {}
         clock_data = {}
+        ssr_data = {}  # sat: (iode, dclk, dorb) for SSR product server
         ns = len(B2BData0.sat_n)
         rs = np.ones((ns, 3))*np.nan
         vs = np.ones((ns, 3))*np.nan
@@ -706,6 +702,7 @@ class cssr_bds(cssr):
             str_clock = ('{}  {:6d} {:11.4f} {:11.4f} {:11.4f} \n'.format(sat_id, iode, dclk, 0.0, 0.0))
             clock_data[sat_id] = str_clock
             orbit_data[sat_id] = str_orbit
+            ssr_data[sat] = (iode, dclk, dorb)
 
         nav_out.peph.append(peph)
         nav_out.ne+=1
@@ -722,6 +719,7 @@ class cssr_bds(cssr):
                 fp.write('> ORBIT {} {}  {:4d} {} \n'.format(str_time, 0, nsat_orbit, "B2B"))
                 for sat_id, data in orbit_data.items():
                     fp.write(data)
+            self.publish_ssr(epoch_time, "B2B", ssr_data, B2BData0)
             if nsat_orbit != nsat_clock or nsat_clock<15:
                 str_error=">>>>error_time={} nsat_orbit={:4d} nsat_clock={:4d}".format(time2str(epoch_time),nsat_orbit,nsat_clock)
                 self.log_msg(str_error)
@@ -384,6 +384,7 @@ class cssr_bdsC(cssr):
         return i
 
     def decode_cssr(self, v):
+        self.unshare()  # copy corrections held by snapshot before update
         if 'BDS' in v.dtype.names:
             self.subtype = sCSSR.MASK
             self.decode_cssr_mask(v)
@@ -411,6 +412,7 @@ class cssr_bdsC(cssr):
         encodeRTCM=1
         orbit_data = {}
         clock_data = {}
+        ssr_data = {}  # sat: (iode, dclk, dorb) for SSR product server
         ns = len(B2BData0.sat_n)
         rs = np.ones((ns, 3))*np.nan
         vs = np.ones((ns, 3))*np.nan
@@ -507,6 +509,7 @@ class cssr_bdsC(cssr):
             str_clock = ('{}  {:6d} {:11.4f} {:11.4f} {:11.4f} \n'.format(sat_id, iode, dclk, 0.0, 0.0))
             clock_data[sat_id] = str_clock
             orbit_data[sat_id] = str_orbit
+            ssr_data[sat] = (iode, dclk, dorb)
 
         nav_out.peph.append(peph)
         nav_out.ne+=1
@@ -523,6 +526,7 @@ class cssr_bdsC(cssr):
                 fp.write('> ORBIT {} {}  {:4d} {} \n'.format(str_time, 0, nsat_orbit, "B2B"))
                 for sat_id, data in orbit_data.items():
                     fp.write(data)
+            self.publish_ssr(epoch_time, "B2B", ssr_data, B2BData0)
             if nsat_orbit != nsat_clock or nsat_clock<15:
                 str_error=">>>>error_time={} nsat_orbit={:4d} nsat_clock={:4d}".format(time2str(epoch_time),nsat_orbit,nsat_clock)
                 self.log_msg(str_error)
@@ -6,14 +6,296 @@ Galileo HAS correction data decoder
 
 """
 
+import os
+from collections import OrderedDict
 import numpy as np
 import bitstruct as bs
-import galois
 from B2b_HAS_decoder.cssrlib import cssr, sCSSR, sCSSRTYPE
 from B2b_HAS_decoder.peph import peph,peph_t
 from B2b_HAS_decoder.gnss import *
 from B2b_HAS_decoder.ephemeris import eph2pos, findeph,eph2rel
-from B2b_HAS_decoder.cssrlib import cssr, sCSSR, sCSSRTYPE, sCType
+from B2b_HAS_decoder.cssrlib import cssr, sCSSR, sCSSRTYPE, sCType, bs_unpack, bs_unpack_blocks
+
+# GF(256) log/antilog tables of HAS RS code (p(x)=x^8+x^4+x^3+x^2+1, alpha=2)
+GF_EXP = np.zeros(510, dtype=np.uint8)
+GF_LOG = np.zeros(256, dtype=np.int32)
+x = 1
+for i in range(255):
+    GF_EXP[i] = GF_EXP[i+255] = x
+    GF_LOG[x] = i
+    x = (x << 1) ^ (0x11d if x & 0x80 else 0)
+GF_MUL = GF_EXP[GF_LOG[:, None] + GF_LOG[None, :]]  # multiplication table
+GF_MUL[0, :] = GF_MUL[:, 0] = 0
+GF_INV = GF_EXP[(255 - GF_LOG) % 255]  # multiplicative inverse (GF_INV[0]: n/a)
+del x, i
+
+
+def gf_matmul(A, B):
+    """ matrix product over GF(256) """
+    return np.bitwise_xor.reduce(GF_MUL[A[:, :, None], B[None, :, :]], axis=1)
+
+
+def gf_inv(A):
+    """ inverse matrix over GF(256) by Gauss-Jordan elimination """
+    n = len(A)
+    M = np.hstack([np.asarray(A, dtype=np.uint8), np.eye(n, dtype=np.uint8)])
+    for c in range(n):
+        r = c + np.flatnonzero(M[c:, c])
+        if len(r) == 0:
+            raise np.linalg.LinAlgError("singular matrix over GF(256)")
+        if r[0] != c:
+            M[[c, r[0]]] = M[[r[0], c]]
+        M[c] = GF_MUL[GF_INV[M[c, c]], M[c]]
+        f = M[:, c].copy()
+        f[c] = 0
+        M ^= GF_MUL[f[:, None], M[c][None, :]]
+    return M[:, n:]
+
+
+class rs_inv_cache:
+    """ LRU cache of inverse RS generator sub-matrices for HAS pages
+
+    The key is (received page indices, message size), with the indices
+    sorted so that a repeated set of pages hits the cache regardless of
+    the order of reception.
+    """
+    # record of cache file (page indices padded with 0xff)
+    dtype = [('ms', 'u1'), ('k', 'u1'), ('pid', 'u1', (32,)),
+             ('Dinv', 'u1', (32, 32))]
+
+    def __init__(self, size=256):
+        self.size = size
+        self.cache = OrderedDict()
+        self.nhit = 0
+        self.nmiss = 0
+
+    def get(self, idx, ms, gMat):
+        """ inverse matrix of gMat[idx,:k] (idx: sorted page indices) """
+        key = (tuple(idx), ms)
+        if key in self.cache:
+            self.cache.move_to_end(key)
+            self.nhit += 1
+            return self.cache[key]
+        self.nmiss += 1
+        Dinv = gf_inv(gMat[list(idx), :len(idx)])
+        if self.size > 0:
+            self.cache[key] = Dinv
+            if len(self.cache) > self.size:
+                self.cache.popitem(last=False)
+        return Dinv
+
+    def stat(self):
+        """ hit/miss statistics as string """
+        n = self.nhit + self.nmiss
+        return "RS cache: size={:d}/{:d} hit={:d} miss={:d} ratio={:.1f}%".format(
+            len(self.cache), self.size, self.nhit, self.nmiss,
+            100.0 * self.nhit / n if n > 0 else 0.0)
+
+    def save(self, file):
+        """ save cached matrices by np.save (oldest first) """
+        rec = np.zeros(len(self.cache), dtype=self.dtype)
+        rec['pid'] = 0xff
+        for j, ((idx, ms), Dinv) in enumerate(self.cache.items()):
+            k = len(idx)
+            rec['ms'][j], rec['k'][j] = ms, k
+            rec['pid'][j, :k] = idx
+            rec['Dinv'][j, :k, :k] = Dinv
+        np.save(file, rec)
+
+    def load(self, file):
+        """ load cached matrices saved by save() """
+        if not os.path.exists(file):
+            return 0
+        rec = np.load(file)
+        for r in rec[-self.size:] if self.size > 0 else []:
+            k = int(r['k'])
+            key = (tuple(int(p) for p in r['pid'][:k]), int(r['ms']))
+            self.cache[key] = r['Dinv'][:k, :k].copy()
+            self.cache.move_to_end(key)
+        while len(self.cache) > self.size:
+            self.cache.popitem(last=False)
+        return len(rec)
+
+
+# hex character -> value
+HEX_VAL = np.zeros(256, dtype=np.uint8)
+for c in b'0123456789':
+    HEX_VAL[c] = c - ord('0')
+for c in b'abcdef':
+    HEX_VAL[c] = HEX_VAL[c - 32] = c - ord('a') + 10
+del c
+
+# record of HAS pages by decode_has_pages()
+HAS_PAGE_DTYPE = [('tow', 'f8'), ('valid', '?'), ('hass', 'u1'), ('mt', 'u1'),
+                  ('mid', 'u1'), ('ms', 'u1'), ('pid', 'u1'),
+                  ('page', 'u1', (53,))]
+
+
+def decode_has_pages(nav, tow=None, i=14):
+    """ decode HAS pages of hex strings at once
+
+    nav: hex strings of raw Galileo E6-B pages {N} (bytes array) or raw
+         pages as bytes {N, nbyte} (uint8 array)
+    tow: time of week of pages {N}
+    i  : bit offset of HAS page header in raw pages
+    return HAS pages as HAS_PAGE_DTYPE records {N} (valid: not a dummy page
+    and hass < 2, ms: message size in pages, page: 424-bit payload)
+    """
+    N, nb = len(nav), (i + 24 + 424 + 7) // 8 + 1
+    pg = np.zeros(N, dtype=HAS_PAGE_DTYPE)
+    if tow is not None:
+        pg['tow'] = tow
+
+    # hex strings -> bytes {N, nb}
+    if nav.dtype == np.uint8:
+        B = np.zeros((N, nb), dtype=np.uint8)
+        B[:, :min(nav.shape[1], nb)] = nav[:, :nb]
+    else:
+        nav = np.ascontiguousarray(nav, dtype='S')
+        hx = np.zeros((N, nb*2), dtype=np.uint8)
+        c = nav.view(np.uint8).reshape(N, nav.itemsize)[:, :nb*2]
+        hx[:, :c.shape[1]] = HEX_VAL[c]
+        B = (hx[:, 0::2] << 4) | hx[:, 1::2]
+
+    # 24-bit header and 53 bytes payload at bit i and i+24
+    k, sh = divmod(i, 8)
+    w = np.zeros(N, dtype=np.uint32)
+    for j in range(4):
+        w = (w << 8) | B[:, k+j]
+    h = (w >> (8 - sh)) & 0xffffff
+    k, sh = divmod(i + 24, 8)
+    pg['page'] = (B[:, k:k+53] << sh) | (B[:, k+1:k+54] >> (8 - sh))
+    pg['hass'] = h >> 22 & 3
+    pg['mt'] = h >> 18 & 3
+    pg['mid'] = h >> 13 & 31
+    pg['ms'] = (h >> 8 & 31) + 1
+    pg['pid'] = h & 255
+    pg['valid'] = (h != 0xaf3bc3) & (pg['hass'] < 2)
+    return pg
+
+
+class HASMessageBuffer:
+    """ buffer of an in-flight HAS message """
+
+    def __init__(self, mt, mid, ms, tmo):
+        self.mt = mt
+        self.mid = mid
+        self.ms = ms
+        self.tmo = tmo  # timeout (epochs)
+        self.age = 0  # epochs since the first page
+        self.n = 0  # number of received pages
+        self.pid = np.zeros(ms, dtype=int)  # page indices (pid-1)
+        self.page = np.zeros((ms, 53), dtype=np.uint8)
+        self.mask = 0  # bitset of received page indices
+
+    def add(self, pid, page):
+        """ add a page, return False for a duplicated page """
+        if self.mask >> pid & 1:
+            return False
+        self.mask |= 1 << pid
+        self.pid[self.n] = pid
+        self.page[self.n, :] = page
+        self.n += 1
+        return True
+
+
+class HASPageAssembler:
+    """ streaming assembler of HAS encoded pages into messages
+
+    Pages are consumed in arrival order and collected per message ID in a
+    bounded table of in-flight messages, so that interleaved messages are
+    assembled concurrently. A message is emitted as soon as ms distinct
+    pages of it are received. Messages completed, timed out and duplicated
+    pages are counted per hour of the week. Pages of invalid page ID (0)
+    are ignored.
+    """
+
+    def __init__(self, maxmsg=8, ndecoded=10, ntmo=2):
+        self.maxmsg = maxmsg  # max number of in-flight messages
+        self.ndecoded = ndecoded  # number of decoded mids to be ignored
+        self.ntmo = ntmo  # timeout of message (epochs per page of ms)
+        self.msg = {}  # in-flight messages: mid -> HASMessageBuffer
+        self.mid_decoded = []
+        self.has_pages = np.zeros((255, 53), dtype=np.uint8)
+        self.stat = {}  # hour of week -> [completed, timed out, duplicated]
+
+    @staticmethod
+    def group_by_tow(v):
+        """ generate (tow, records) of raw pages grouped by tow in one pass """
+        if len(v) == 0:
+            return
+        v = v[np.argsort(v['tow'], kind='stable')]
+        ofs = np.r_[0, np.flatnonzero(np.diff(v['tow'])) + 1, len(v)]
+        for j in range(len(ofs) - 1):
+            yield v['tow'][ofs[j]], v[ofs[j]:ofs[j+1]]
+
+    def count(self, tow, k):
+        """ count metrics (k: 0:completed, 1:timed out, 2:duplicated) """
+        hour = int(tow // 3600)
+        if hour not in self.stat:
+            self.stat[hour] = [0, 0, 0]
+        self.stat[hour][k] += 1
+
+    def add_page(self, buff, tow=0, i=14):
+        """ add a raw page, return completed messages as
+            [(mt, mid, ms, rec, has_pages), ...] (rec: page indices of
+            rows in has_pages, valid until the next call) """
+        if bs.unpack_from('u24', buff, i)[0] == 0xaf3bc3:  # dummy page
+            return []
+        hass, res, mt, mid, ms, pid = bs.unpack_from('u2u2u2u5u5u8', buff, i)
+        if hass >= 2:  # 0:test,1:operational,2:res,3:dnu
+            return []
+        return self.add_fields(mt, mid, ms + 1, pid,
+                               bs.unpack_from('u8'*53, buff, i+24), tow)
+
+    def add_fields(self, mt, mid, ms, pid, page, tow=0):
+        """ add a page by header fields and payload (ms: message size in
+            pages, page: 53 bytes), return completed messages as add_page() """
+        mid, ms, pid = int(mid), int(ms), int(pid)
+        if pid < 1 or pid > 255:  # invalid page ID
+            return []
+        if mid in self.mid_decoded:
+            return []
+        if mid not in self.msg:
+            if len(self.msg) >= self.maxmsg:  # drop the oldest message
+                old = max(self.msg, key=lambda m: self.msg[m].age)
+                del self.msg[old]
+                self.count(tow, 1)
+            self.msg[mid] = HASMessageBuffer(mt, mid, ms, self.ntmo * ms)
+        m = self.msg[mid]
+        if not m.add(pid-1, page):
+            self.count(tow, 2)
+            return []
+        if m.n < m.ms:
+            return []
+
+        # complete message
+        del self.msg[mid]
+        self.count(tow, 0)
+        self.mid_decoded += [mid]
+        if len(self.mid_decoded) > self.ndecoded:
+            self.mid_decoded = self.mid_decoded[1:]
+        self.has_pages[m.pid, :] = m.page
+        return [(m.mt, mid, m.ms, list(m.pid), self.has_pages)]
+
+    def end_epoch(self, tow=0):
+        """ age in-flight messages and return the mids timed out """
+        tmo = []
+        for mid in list(self.msg):
+            self.msg[mid].age += 1
+            if self.msg[mid].age > self.msg[mid].tmo:
+                del self.msg[mid]
+                self.count(tow, 1)
+                tmo += [mid]
+        return tmo
+
+    def stat_str(self):
+        """ hourly metrics as strings (day: day of week) """
+        return ["HAS messages day={:d} hour={:02d}: completed={:d} "
+                "timeout={:d} duplicated pages={:d}".format(
+                    h // 24, h % 24, *self.stat[h])
+                for h in sorted(self.stat)]
+
 
 class cssr_has(cssr):
     def __init__(self, foutname=None):  # Initialize attributes
@@ -29,7 +311,7 @@ class cssr_has(cssr):
         self.pb_blen = 11
         self.pb_scl = 0.01  # cycles
 
-        self.GF = galois.GF(256)
+        self.rs_cache = rs_inv_cache()  # cache of inverse RS sub-matrices
 
     """
     Calculate the signed value for a given n-bit integer
@@ -57,22 +339,21 @@ class cssr_has(cssr):
         if self.iodssr != head['iodssr']:  # Check if the iodssr field in the message header matches the stored iodssr in the object
             return -1
 
-        nclk_sub = bs.unpack_from('u4', msg, i)[0]  # Unpack a 4-byte unsigned integer from the byte stream starting at i to get the clock subset type
-        i += 4
+        (nclk_sub,), i = bs_unpack('u4', msg, i)  # Unpack a 4-bit unsigned integer from the byte stream starting at i to get the number of clock subsets
         for j in range(nclk_sub):
-            gnss, dcm = bs.unpack_from('u4u2', msg, i)  # Unpack gnss (GPS, Galileo) and dcm (Delta Clock Multipliers) values
+            (gnss, dcm), i = bs_unpack('u4u2', msg, i)  # Unpack gnss (GPS, Galileo) and dcm (Delta Clock Multipliers) values
             # These values are the parameters for the full clock correction block in the HAS message. 
             # It indicates the multipliers for clock corrections for different GNSS.
-            i += 6
-            idx_s = np.where(np.array(self.gnss_n) == gnss)  # Find the index of gnss in self.gnss_n
-            mask_s = bs.unpack_from('u' + str(self.nsat_g[gnss]), msg, i)[0]  # Decode the satellite mask from the byte stream
-            i += self.nsat_g[gnss]  # Move to the next satellite
-            idx, nclk = self.decode_mask(mask_s, self.nsat_g[gnss])  # Decode the mask and get the indices of the valid satellites
+            idx_s = np.where(np.array(self.gnss_n) == gnss)[0]  # Find the index of gnss in self.gnss_n
+            (mask_s,), i = bs_unpack('u' + str(self.nsat_g[gnss]), msg, i)  # Decode the satellite mask from the byte stream
+            idx, nclk = self.decode_mask(mask_s, self.nsat_g[gnss])  # Decode the mask and get the indices (1,2,...) of the valid satellites
+            v, i = bs_unpack_blocks('s' + str(self.dclk_blen), nclk, msg, i,
+                                    self.bit_gather)  # Decode the clock correction values of the subset in one call
             for k in range(nclk):  # Loop for the number of available satellites
-                dclk = bs.unpack_from('s' + str(self.dclk_blen), msg, i) \
-                       * self.dclk_scl * (dcm + 1)  # Decode the clock correction value
-                self.lc[0].dclk[idx_s[idx[k]]] = dclk  # Store the clock correction value
-                i += self.dclk_blen
+                sat = self.sat_n[idx_s[idx[k]-1]]
+                self.lc[0].dclk[sat] = self.sval(
+                    v[k][0], self.dclk_blen, self.dclk_scl) * (dcm + 1)  # Store the clock correction value
+                self.set_t0(0, sat, sCType.CLOCK, self.time)
         return i
 
     # Decode the header information for each message
@@ -81,8 +362,7 @@ class cssr_has(cssr):
         if st == sCSSR.MASK:
             ui = 0
         else:
-            ui = bs.unpack_from('u4', msg, i)[0]  # Decode the first element and assign to ui
-            i += 4
+            (ui,), i = bs_unpack('u4', msg, i)  # Decode the first element and assign to ui
 
         if self.tow0 >= 0:
             self.tow = self.tow0 + self.toh
@@ -92,14 +372,14 @@ class cssr_has(cssr):
         head = {'uint': ui, 'mi': 0, 'iodssr': self.iodssr}  # Information type SSR version
         return head, i
     def decode_cssr(self, msg, i=0):
+        self.unshare()  # copy corrections held by snapshot before update
         if self.msgtype != 1:  # Only MT=1 is defined, check message type. If not 1, decoding fails
             print(f"invalid MT={self.msgtype}")
             return False
         # Time of hour
         # Flags: mask, orbit, clock, clock subset, cbias, pbias, mask_id, iodset_id
-        self.toh, flags, res, mask_id, self.iodssr = \
-            bs.unpack_from('u12u6u4u5u5', msg, i)  # The decoded values are assigned to time of hour, flags, res, mask ID, and iodssr.
-        i += 32
+        (self.toh, flags, res, mask_id, self.iodssr), i = \
+            bs_unpack('u12u6u4u5u5', msg, i)  # The decoded values are assigned to time of hour, flags, res, mask ID, and iodssr.
 
         if self.monlevel > 0 and self.fh is not None:
             self.fh.write("##### Galileo HAS SSR: TOH{:6d} flags={:12s} mask_id={:2d} iod_s={:1d}\n"
@@ -180,10 +460,11 @@ class cssr_has(cssr):
         At the same time, extract the corresponding part from the generator matrix, then perform an inverse matrix operation on it to get the inverse matrix Dinv with dimensions k x k.
         Next, multiply Dinv by Wd to get the decoded message Md with dimensions k x 53. Finally, convert Md to a byte object and assign it to HASmsg.'''
         if k >= ms:
-            Wd = self.GF(has_pages[idx, :])  # kx53
-            Dinv = np.linalg.inv(self.GF(gMat[idx, :k]))  # kxk
-            Md = Dinv @ Wd  # decoded message (kx53)
-            HASmsg = np.array(Md).tobytes()
+            idx = sorted(idx)  # order of pages does not change the message
+            Wd = np.asarray(has_pages[idx, :], dtype=np.uint8)  # kx53
+            Dinv = self.rs_cache.get(idx, ms, gMat)  # kxk
+            Md = gf_matmul(Dinv, Wd)  # decoded message (kx53)
+            HASmsg = Md.tobytes()
 
         return HASmsg
 
@@ -197,6 +478,7 @@ class cssr_has(cssr):
         encodeRTCM=1
         orbit_data = {}
         clock_data = {}
+        ssr_data = {}  # sat: (iode, dclk, dorb) for SSR product server
         ns = len(HASData0.sat_n)
         rs = np.ones((ns, 3))*np.nan
         vs = np.ones((ns, 3))*np.nan
@@ -290,6 +572,7 @@ class cssr_has(cssr):
             str_clock = ('{}  {:6d} {:11.4f} {:11.4f} {:11.4f} \n'.format(sat_id, iode, dclk, 0.0, 0.0))
             clock_data[sat_id] = str_clock
             orbit_data[sat_id] = str_orbit
+            ssr_data[sat] = (iode, dclk, dorb)
 
         nsat_clock = len(clock_data)
         nsat_orbit = len(orbit_data)
@@ -311,3 +594,4 @@ class cssr_has(cssr):
                 fp.write('> ORBIT {} {}  {:4d} {} \n'.format(str_time, 0, nsat_orbit, "HAS"))
                 for sat_id, data in orbit_data.items():
                     fp.write(data)
+            self.publish_ssr(epoch_time, "HAS", ssr_data, HASData0)
@@ -2,10 +2,101 @@
 module for Compact SSR processing
 """
 
+import re
+from collections.abc import MutableMapping
+from itertools import groupby
+from types import MappingProxyType
 import bitstruct as bs
 import numpy as np
 from enum import IntEnum
 from B2b_HAS_decoder.gnss import *
+try:
+    import bitstruct.c as bsc  # C implementation of bitstruct
+except ImportError:
+    bsc = bs
+
+BS_FMT = {}    # cache of compiled formats: fmt -> (compiled format, bits)
+BS_FIELD = {}  # cache of fields for bit-gather: fmt -> (signed, bits, offset)
+
+
+def bs_compile(fmt):
+    """ compile bitstruct format (cached)
+
+    fmt : bitstruct format (e.g. 'u9u10u3')
+    returns (compiled format, number of bits)
+    """
+    cf = BS_FMT.get(fmt)
+    if cf is None:
+        c = bsc.compile(fmt)
+        cf = BS_FMT[fmt] = (c, c.calcsize())
+    return cf
+
+
+def bs_unpack(fmt, msg, i):
+    """ unpack fields at bit offset i by compiled format
+
+    returns (field values, bit offset after the fields)
+    """
+    c, n = bs_compile(fmt)
+    return c.unpack_from(msg, i), i + n
+
+
+def bs_fields(fmt):
+    """ signed flags, bit lengths and bit offsets of u/s fields in format """
+    v = BS_FIELD.get(fmt)
+    if v is None:
+        f = re.findall(r'([a-zA-Z])(\d+)', fmt)
+        if any(t not in 'us' or not 0 < int(b) < 64 for t, b in f):
+            raise ValueError('bit-gather supports u1-u63/s1-s63: ' + fmt)
+        blen = np.array([int(b) for _, b in f], dtype=np.int64)
+        sgn = np.array([t == 's' for t, _ in f])
+        v = BS_FIELD[fmt] = (sgn, blen, np.cumsum(blen) - blen)
+    return v
+
+
+def bs_gather(fmt, n, msg, i):
+    """ unpack n repeated blocks of format by numpy bit-gather
+
+    fmt : format of a block (u/s fields only)
+    n   : number of blocks
+    msg : message
+    i   : bit offset of the first block
+    returns field values as int64 array {n, number of fields}
+    """
+    sgn, blen, ofs = bs_fields(fmt)
+    nb = int(blen.sum())
+    bits = np.unpackbits(np.frombuffer(msg, dtype=np.uint8))
+    if i + n*nb > len(bits):
+        raise bs.Error('unpack requires at least {} bits to unpack (got {})'
+                       .format(i + n*nb, len(bits)))
+    k = np.arange(blen.max())
+    valid = k < blen[:, None]  # {nfield, maxbits}
+    w = np.where(valid, np.left_shift(1, np.maximum(blen[:, None]-1-k, 0)),
+                 0)
+    pos = i + nb*np.arange(n)[:, None, None] + ofs[:, None] + k
+    v = (bits[np.minimum(pos, len(bits)-1)] * w).sum(axis=2)
+    return np.where(sgn & ((v >> (blen-1)) & 1 == 1),
+                    v - np.left_shift(1, blen), v)
+
+
+def bs_unpack_blocks(fmt, n, msg, i, gather=False):
+    """ unpack n repeated blocks of format in one call
+
+    fmt    : format of a block
+    n      : number of blocks
+    msg    : message
+    i      : bit offset of the first block
+    gather : unpack by numpy bit-gather instead of compiled format
+    returns (field values of blocks, bit offset after the blocks)
+    """
+    if n <= 0:
+        return [], i
+    if gather:
+        v = bs_gather(fmt, n, msg, i)
+        return v.tolist(), i + n*bs_compile(fmt)[1]
+    v, i = bs_unpack(fmt*n, msg, i)
+    nf = len(v)//n
+    return [v[k*nf:(k+1)*nf] for k in range(n)], i
 
 
 class sCSSRTYPE(IntEnum):
@@ -227,6 +318,272 @@ class local_corr:
         self.cstat = 0            # status for receiving CSSR message
 
 
+class corr_table:
+    """ class for corrections of satellites in arrays (index: sat-1)
+
+    dorb   : orbit corrections {MAXSAT, 3} (radial, along, cross) (m)
+    dclk   : clock corrections {MAXSAT} (m)
+    iode   : IODE of orbit corrections {MAXSAT}
+    iodc   : IODC of orbit corrections {MAXSAT}
+    iodc_c : IODC of clock corrections {MAXSAT}
+    t0     : reference time of corrections {MAXSAT, sCType.MAX} (s, integer
+             part of gtime_t)
+    t0s    : reference time of corrections {MAXSAT, sCType.MAX} (s, fraction
+             part of gtime_t, nan: n/a)
+    cbias  : code biases {MAXSAT, number of signals} (m), signals: sig
+    valid  : bitmask of fields set (bit FIELD[name])
+
+    view() returns a local_corr whose fields are dict-compatible views of
+    the table ({sat: value}, t0: {sat: {sCType: gtime_t}}, cbias:
+    {sat: {rSigRnx: value}}) for the code handling local_corr. an empty
+    dorb (e.g. dorb[sat] = []) or a t0 of None is stored as not available
+    (nan).
+    """
+    FIELD = {'iode': 0, 'iodc': 1, 'dorb': 2, 'dclk': 3, 'iodc_c': 4,
+             't0': 5, 'cbias': 6}
+
+    def __init__(self, nmax=uGNSS.MAXSAT, nsig=8):
+        self.dorb = np.full((nmax, 3), np.nan)
+        self.dclk = np.full(nmax, np.nan)
+        self.iode = np.full(nmax, -1, dtype=np.int32)
+        self.iodc = np.full(nmax, -1, dtype=np.int32)
+        self.iodc_c = np.full(nmax, -1, dtype=np.int32)
+        self.t0 = np.zeros((nmax, sCType.MAX), dtype=np.int64)
+        self.t0s = np.full((nmax, sCType.MAX), np.nan)
+        self.cbias = np.full((nmax, nsig), np.nan)
+        self.cbias_m = np.zeros((nmax, nsig), dtype=bool)  # cbias set
+        self.sig = []      # signals of cbias columns
+        self.sig_idx = {}  # signal -> cbias column
+        self.valid = np.zeros(nmax, dtype=np.uint8)
+
+    def copy(self):
+        """ snapshot of the table """
+        tbl = corr_table.__new__(corr_table)
+        for k, v in self.__dict__.items():
+            tbl.__dict__[k] = v.copy()
+        return tbl
+
+    def sats(self, name):
+        """ satellites with field set """
+        return np.flatnonzero(self.valid & (1 << self.FIELD[name])) + 1
+
+    def isset(self, name, sat):
+        """ check if field of satellite is set """
+        return 0 < sat <= len(self.valid) and \
+            (self.valid[sat-1] >> self.FIELD[name]) & 1 == 1
+
+    def age(self, ctype, t):
+        """ time difference t - t0 of corrections for all satellites (s) """
+        return (t.time - self.t0[:, ctype]) + (t.sec - self.t0s[:, ctype])
+
+    def sig_col(self, sig):
+        """ column of cbias for signal (added if new) """
+        j = self.sig_idx.get(sig)
+        if j is None:
+            j = self.sig_idx[sig] = len(self.sig)
+            self.sig.append(sig)
+            if j >= self.cbias.shape[1]:
+                n = self.cbias.shape[1]
+                self.cbias = np.hstack((self.cbias,
+                                        np.full(self.cbias.shape, np.nan)))
+                self.cbias_m = np.hstack((self.cbias_m,
+                                          np.zeros((len(self.valid), n),
+                                                   dtype=bool)))
+        return j
+
+    def get(self, name, sat):
+        """ get field of satellite (KeyError if not set) """
+        if not self.isset(name, sat):
+            raise KeyError(sat)
+        k = sat-1
+        if name == 'dorb':
+            return self.dorb[k]
+        if name == 'dclk':
+            return float(self.dclk[k])
+        if name in ('t0', 'cbias'):
+            return corr_subview(self, name, sat)
+        return int(getattr(self, name)[k])
+
+    def set(self, name, sat, v):
+        """ set field of satellite """
+        k = sat-1
+        if name == 'dorb':
+            v = np.asarray(v, dtype=float)
+            if v.size == 0:
+                v = np.nan
+            elif v.shape != (3,):
+                raise ValueError('dorb of sat {} is not 3 values'.format(sat))
+            self.dorb[k] = v
+        elif name == 't0':
+            self.t0s[k] = np.nan
+            for ctype, t in v.items():
+                self.set_t0(sat, ctype, t)
+        elif name == 'cbias':
+            self.cbias[k] = np.nan
+            self.cbias_m[k] = False
+            for sig, cb in v.items():
+                self.set_cbias(sat, sig, cb)
+        else:
+            getattr(self, name)[k] = v
+        self.valid[k] |= 1 << self.FIELD[name]
+
+    def set_t0(self, sat, ctype, t):
+        """ set reference time of correction (t: gtime_t, None: clear) """
+        if t is None:
+            self.t0s[sat-1, ctype] = np.nan
+        else:
+            self.t0[sat-1, ctype] = t.time
+            self.t0s[sat-1, ctype] = t.sec
+        self.valid[sat-1] |= 1 << self.FIELD['t0']
+
+    def set_cbias(self, sat, sig, cb):
+        """ set code bias of signal """
+        j = self.sig_col(sig)
+        self.cbias[sat-1, j] = cb
+        self.cbias_m[sat-1, j] = True
+        self.valid[sat-1] |= 1 << self.FIELD['cbias']
+
+    def clear(self, name, sat=None):
+        """ clear field of satellite (None: all satellites) """
+        k = slice(None) if sat is None else sat-1
+        if name == 't0':
+            self.t0s[k] = np.nan
+        elif name == 'cbias':
+            self.cbias[k] = np.nan
+            self.cbias_m[k] = False
+        self.valid[k] &= ~np.uint8(1 << self.FIELD[name])
+
+    def update_from(self, lc):
+        """ set fields from local_corr with dict fields """
+        for name in self.FIELD:
+            d = getattr(lc, name, None)
+            if not isinstance(d, dict):
+                continue
+            for sat, v in d.items():
+                if 0 < sat <= len(self.valid):
+                    self.set(name, sat, v)
+        return self
+
+    def view(self):
+        """ local_corr with dict-compatible views of the table """
+        lc = local_corr()
+        for name in self.FIELD:
+            setattr(lc, name, corr_view(self, name))
+        return lc
+
+
+class corr_view(MutableMapping):
+    """ dict-compatible view {sat: value} of a field of corr_table """
+
+    def __init__(self, tbl, name):
+        self.tbl = tbl
+        self.name = name
+
+    def __getitem__(self, sat):
+        return self.tbl.get(self.name, sat)
+
+    def __setitem__(self, sat, v):
+        self.tbl.set(self.name, sat, v)
+
+    def __delitem__(self, sat):
+        if not self.tbl.isset(self.name, sat):
+            raise KeyError(sat)
+        self.tbl.clear(self.name, sat)
+
+    def __contains__(self, sat):
+        return self.tbl.isset(self.name, sat)
+
+    def __iter__(self):
+        return iter(self.tbl.sats(self.name).tolist())
+
+    def __len__(self):
+        return len(self.tbl.sats(self.name))
+
+
+class corr_subview(MutableMapping):
+    """ dict-compatible view of t0 {sCType: gtime_t} or cbias
+    {rSigRnx: value} of a satellite in corr_table """
+
+    def __init__(self, tbl, name, sat):
+        self.tbl = tbl
+        self.name = name
+        self.k = sat-1
+
+    def keys_set(self):
+        if self.name == 't0':
+            return [sCType(c) for c in
+                    np.flatnonzero(~np.isnan(self.tbl.t0s[self.k]))]
+        return [self.tbl.sig[j] for j in
+                np.flatnonzero(self.tbl.cbias_m[self.k, :len(self.tbl.sig)])]
+
+    def __getitem__(self, key):
+        if self.name == 't0':
+            sec = self.tbl.t0s[self.k, key]
+            if np.isnan(sec):
+                raise KeyError(key)
+            return gtime_t(int(self.tbl.t0[self.k, key]), float(sec))
+        j = self.tbl.sig_idx.get(key)
+        if j is None or not self.tbl.cbias_m[self.k, j]:
+            raise KeyError(key)
+        return float(self.tbl.cbias[self.k, j])
+
+    def __setitem__(self, key, v):
+        if self.name == 't0':
+            self.tbl.set_t0(self.k+1, key, v)
+        else:
+            self.tbl.set_cbias(self.k+1, key, v)
+
+    def __delitem__(self, key):
+        if key not in self:
+            raise KeyError(key)
+        if self.name == 't0':
+            self.tbl.t0s[self.k, key] = np.nan
+        else:
+            j = self.tbl.sig_idx[key]
+            self.tbl.cbias[self.k, j] = np.nan
+            self.tbl.cbias_m[self.k, j] = False
+
+    def __iter__(self):
+        return iter(self.keys_set())
+
+    def __len__(self):
+        return len(self.keys_set())
+
+
+class corr_epoch:
+    """ read-only snapshot of corrections of cssr (see cssr.snapshot())
+
+    The snapshot refers to the containers of corrections of the decoder
+    (network 0) instead of copying them. The decoder copies the containers
+    before it updates them by the next message (copy-on-write), so that the
+    snapshot does not change and can be held by reference. Corrections of
+    satellites (dorb arrays, gtime_t) are shared and must not be modified.
+
+    version : version of corrections (number of messages decoded)
+    lc      : [local_corr] with read-only dict fields
+    """
+    LC_FIELD = ('iode', 'iodc', 'iodc_c', 'dorb', 'dclk', 'cbias', 't0',
+                'dclk_p', 'iodc_c_p')
+    ATTR = ('cssrmode', 'subtype', 'time', 'iodssr', 'iodssr_p', 'sat_n',
+            'sat_n_p', 'sys_n', 'mask_id', 'mask_id_clk', 'ura', 'nav_mode')
+
+    def __init__(self, cs):
+        self.version = cs.version
+        for name in self.ATTR:
+            v = getattr(cs, name, None)
+            setattr(self, name, MappingProxyType(v) if isinstance(v, dict)
+                    else v)
+        self.iodssr_c = cs.iodssr_c.view()
+        self.iodssr_c.flags.writeable = False
+        lc = local_corr()
+        lc.cstat = cs.lc[0].cstat
+        for name in self.LC_FIELD:
+            v = getattr(cs.lc[0], name, None)
+            setattr(lc, name, MappingProxyType(v) if isinstance(v, dict)
+                    else v)
+        self.lc = [lc]
+
+
 class cssr:
     """ class to process Compact SSR messages """
     CSSR_MSGTYPE = 4073
@@ -282,6 +639,11 @@ class cssr:
         self.grid_weight = []
         self.rngmin = 0
         self.inet_ref = -1
+        self.ssr_out = []  # SSR outputs (publish() per epoch), e.g.
+                           # ssr_server, rtcm3_file
+        self.bit_gather = False  # unpack satellite blocks by numpy
+        self.version = 0    # version of corrections (see snapshot())
+        self.epoch = None   # snapshot of current version
         self.netmask = np.zeros(self.MAXNET+1, dtype=np.dtype('u8'))
         for inet in range(self.MAXNET+1):
             self.lc.append(local_corr())
@@ -430,6 +792,53 @@ class cssr:
         usig_tbl = usig_tbl_[sys]
         return rSigRnx(sys, utyp, usig_tbl[ssig])
 
+    def snapshot(self):
+        """ snapshot of corrections (corr_epoch)
+
+        The snapshot shares the corrections with the decoder, so the cost
+        does not depend on the number of satellites. It is reused until the
+        next message is decoded.
+        """
+        if self.epoch is None:
+            self.epoch = corr_epoch(self)
+        return self.epoch
+
+    def publish_ssr(self, t, src, corr, data):
+        """ publish corrections of an epoch to ssr_out
+
+        t    : epoch time (gtime_t)
+        src  : source of corrections ('B2B' or 'HAS')
+        corr : {sat: (iode, dclk, dorb)}
+        data : merged corrections of the epoch, code biases of satellites of
+               corr are taken from data.lc[0].cbias
+        """
+        if len(self.ssr_out) == 0:
+            return
+        cb = getattr(data.lc[0], 'cbias', None) or {}
+        cbias = {sat: cb[sat] for sat in corr if sat in cb}
+        for out in self.ssr_out:
+            out.publish(t, src, corr, cbias)
+
+    def unshare(self):
+        """ start update of corrections by a message: increment version and
+        copy the containers referred by the snapshot (copy-on-write) """
+        self.version += 1
+        if self.epoch is None:
+            return
+        self.epoch = None
+        lc = self.lc[0]
+        for name in corr_epoch.LC_FIELD:
+            v = getattr(lc, name, None)
+            if name == 't0' and isinstance(v, dict):
+                setattr(lc, name, {sat: (t.copy() if isinstance(t, dict)
+                                         else t) for sat, t in v.items()})
+            elif isinstance(v, dict):
+                setattr(lc, name, v.copy())
+        self.iodssr_c = self.iodssr_c.copy()
+        if isinstance(self.ura, dict):
+            self.ura = self.ura.copy()
+        self.nav_mode = self.nav_mode.copy()
+
     def sval(self, u, n, scl):
         """ calculate signed value based on n-bit int, lsb """
         invalid = -2**(n-1)
@@ -586,13 +995,13 @@ class cssr:
         self.set_t0(ctype=sCType.MASK, t=self.time)
         return i
 
-    def decode_orb_sat(self, msg, i, sat, sys=uGNSS.NONE, inet=0):
-        """ decoder orbit correction of cssr """
-        n = 10 if sys == uGNSS.GAL else 8
-        fmt = 'u{:d}s{:d}s{:d}s{:d}'\
-            .format(n, self.dorb_blen[0], self.dorb_blen[1], self.dorb_blen[2])
-        iode, dx, dy, dz = bs.unpack_from(fmt, msg, i)
+    def orb_fmt(self, sys=uGNSS.NONE):
+        """ format of orbit correction block of cssr """
+        return 'u{:d}s{:d}s{:d}s{:d}'.format(
+            10 if sys == uGNSS.GAL else 8, *self.dorb_blen)
 
+    def set_orb_sat(self, sat, iode, dx, dy, dz, inet=0):
+        """ set orbit correction of cssr from unpacked fields """
         dorb = np.zeros(3)
         dorb[0] = self.sval(dx, self.dorb_blen[0], self.dorb_scl[0])
         dorb[1] = self.sval(dy, self.dorb_blen[1], self.dorb_scl[1])
@@ -604,13 +1013,14 @@ class cssr:
         if self.cssrmode == sCSSRTYPE.GAL_HAS_SIS:  # HAS SIS
             self.lc[inet].dorb[sat] *= -1.0
 
-        i += n + self.dorb_blen[0]+self.dorb_blen[1]+self.dorb_blen[2]
+    def decode_orb_sat(self, msg, i, sat, sys=uGNSS.NONE, inet=0):
+        """ decoder orbit correction of cssr """
+        v, i = bs_unpack(self.orb_fmt(sys), msg, i)
+        self.set_orb_sat(sat, *v, inet=inet)
         return i
 
-    def decode_clk_sat(self, msg, i, sat, inet=0):
-        """ decoder clock correction of cssr """
-        dclk = bs.unpack_from('s'+str(self.dclk_blen), msg, i)[0]
-
+    def set_clk_sat(self, sat, dclk, inet=0):
+        """ set clock correction of cssr from unpacked field """
         self.lc[inet].dclk[sat] = self.sval(
             dclk, self.dclk_blen, self.dclk_scl)
 
@@ -618,15 +1028,17 @@ class cssr:
             sys, _ = sat2prn(sat)
             self.lc[inet].dclk[sat] *= self.dcm[sys]
 
-        i += self.dclk_blen
+    def decode_clk_sat(self, msg, i, sat, inet=0):
+        """ decoder clock correction of cssr """
+        v, i = bs_unpack('s'+str(self.dclk_blen), msg, i)
+        self.set_clk_sat(sat, v[0], inet)
         return i
 
     def decode_cbias_sat(self, msg, i, sat, rsig, inet=0):
         """ decoder code bias correction of cssr """
-        cb = bs.unpack_from('s'+str(self.cb_blen), msg, i)[0]
+        v, i = bs_unpack('s'+str(self.cb_blen), msg, i)
         self.lc[inet].cbias[sat][rsig] = self.sval(
-            cb, self.cb_blen, self.cb_scl)
-        i += self.cb_blen
+            v[0], self.cb_blen, self.cb_scl)
         return i
 
     def decode_pbias_sat(self, msg, i, sat, rsig, inet=0):
@@ -645,9 +1057,14 @@ class cssr:
         self.lc[inet].dorb = {}
         self.lc[inet].iode = {}
 
-        for k in range(self.nsat_n):
-            i = self.decode_orb_sat(msg, i, self.sat_n[k], self.sys_n[k], inet)
-            self.set_t0(inet, self.sat_n[k], sCType.ORBIT, self.time)
+        k = 0
+        for sys, g in groupby(self.sys_n[:self.nsat_n]):  # blocks of system
+            v, i = bs_unpack_blocks(self.orb_fmt(sys), len(list(g)), msg, i,
+                                    self.bit_gather)
+            for iode, dx, dy, dz in v:
+                self.set_orb_sat(self.sat_n[k], iode, dx, dy, dz, inet)
+                self.set_t0(inet, self.sat_n[k], sCType.ORBIT, self.time)
+                k += 1
 
         self.iodssr_c[sCType.ORBIT] = head['iodssr']
         self.lc[inet].cstat |= (1 << sCType.ORBIT)
@@ -666,14 +1083,15 @@ class cssr:
 
         if self.cssrmode == sCSSRTYPE.GAL_HAS_SIS:  # HAS only
             self.dcm = {}
+            v, i = bs_unpack('u2'*self.ngnss, msg, i)
             for k in range(self.ngnss):
-                self.dcm[self.gnss_idx[k]] = bs.unpack_from('u2', msg, i)[
-                    0]+1.0
-                i += 2
+                self.dcm[self.gnss_idx[k]] = v[k]+1.0
 
         self.lc[inet].dclk = {}
+        v, i = bs_unpack_blocks('s'+str(self.dclk_blen), self.nsat_n, msg, i,
+                                self.bit_gather)
         for k in range(self.nsat_n):
-            i = self.decode_clk_sat(msg, i, self.sat_n[k], inet)
+            self.set_clk_sat(self.sat_n[k], v[k][0], inet)
             self.set_t0(inet, self.sat_n[k], sCType.CLOCK, self.time)
 
         if self.cssrmode == sCSSRTYPE.GAL_HAS_SIS:  # HAS only
@@ -689,14 +1107,20 @@ class cssr:
         nsat = self.nsat_n
         self.flg_net = False
         self.lc[inet].cbias = {}
+        nsig = sum(len(self.sig_n[sat]) for sat in self.sat_n[:nsat])
+        v, i = bs_unpack_blocks('s'+str(self.cb_blen), nsig, msg, i,
+                                self.bit_gather)
+        n = 0
         for k in range(nsat):
             sat = self.sat_n[k]
-            sys, _ = sat2prn(sat)
             self.lc[inet].cbias[sat] = {}
             for j in range(len(self.sig_n[sat])):
                 rsig = self.sig_n[sat][j].toTyp(uTYP.C)
-                i = self.decode_cbias_sat(msg, i, sat, rsig, inet)
-                self.set_t0(inet, self.sat_n[k], sCType.CBIAS, self.time)
+                self.lc[inet].cbias[sat][rsig] = self.sval(
+                    v[n][0], self.cb_blen, self.cb_scl)
+                n += 1
+            if len(self.sig_n[sat]) > 0:
+                self.set_t0(inet, sat, sCType.CBIAS, self.time)
 
         self.iodssr_c[sCType.CBIAS] = head['iodssr']
         self.lc[inet].cstat |= (1 << sCType.CBIAS)
@@ -785,11 +1209,9 @@ class cssr:
         if self.iodssr != head['iodssr']:
             return -1
         self.ura = {}
+        v, i = bs_unpack_blocks('u3u3', self.nsat_n, msg, i, self.bit_gather)
         for k in range(self.nsat_n):
-            sat = self.sat_n[k]
-            v = bs.unpack_from_dict('u3u3', ['class', 'val'], msg, i)
-            self.ura[sat] = self.quality_idx(v['class'], v['val'])
-            i += 6
+            self.ura[self.sat_n[k]] = self.quality_idx(v[k][0], v[k][1])
         self.lc[0].cstat |= (1 << sCType.URA)
         self.set_t0(ctype=sCType.URA, t=self.time)
 
@@ -1052,6 +1474,7 @@ class cssr:
 
     def decode_cssr(self, msg, i=0):
         """decode Compact SSR message """
+        self.unshare()
         df = {'msgtype': 4073}
         while df['msgtype'] == 4073:
             df = bs.unpack_from_dict('u12u4', ['msgtype', 'subtype'], msg, i)
@@ -0,0 +1,758 @@
+"""
+module for decoding pipeline of B2b/HAS corrections
+
+A pipeline decodes the corrections of a day in stages connected by
+generators:
+
+  source    : input records (SBF frames, UM982 PPPB2BINFO rows, stream)
+  fec       : records -> (message, attributes of decoder) (LDPC, HAS RS)
+  decoder   : CSSR decoder (cssr_bds, cssr_has, cssr_bdsC)
+  scheduler : decoded messages -> output epochs
+  sinks     : output epochs -> products (SP3/SSR files)
+
+A stage can be replaced by any object with the same interface, and
+records(), messages() and epochs() can be consumed alone to profile the
+stages. b2b_sept_pipeline(), b2b_um982_pipeline() and has_sept_pipeline()
+build the pipelines of the decode_*.py drivers. They only take file names
+and options, so that the days can be processed in separate processes.
+"""
+
+import os
+import pickle
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from B2b_HAS_decoder.gnss import Nav, epoch2time, time2gpst, time2str, \
+    timeadd, timediff
+from B2b_HAS_decoder.peph import peph
+from B2b_HAS_decoder.rinex import rnxdec
+from B2b_HAS_decoder.sbf import iter_sbf_file
+from B2b_HAS_decoder.cssrlib import sCSSR, sCType, local_corr
+from B2b_HAS_decoder.rtcm3_ssr import rtcm3_file
+from B2b_HAS_decoder.cssr_bds_sept import cssr_bds
+from B2b_HAS_decoder.cssr_bds_um982 import cssr_bdsC
+from B2b_HAS_decoder.cssr_has_sept import cssr_has, HASPageAssembler, \
+    decode_has_pages
+from B2b_HAS_decoder.sdr_ldpc_test import decode_LDPC_batch, \
+    decode_LDPC_parallel, ldpc_stat_t
+
+FILE_GMAT = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                         "Galileo-HAS-SIS-ICD_1.0_Annex_B_Reed_Solomon_"
+                         "Generator_Matrix.txt")
+INTERVAL = 5            # interval of output epochs (s)
+MAX_ORBIT_DELAY = 300   # max age of orbit corrections at output epoch (s)
+MAX_CLOCK_DELAY = 30    # max age of clock corrections at output epoch (s)
+
+
+class B2BData:
+    """ B2b corrections merged for output (orbit and clock of same IOD) """
+
+    def __init__(self):
+        self.init_empty()
+
+    def init_empty(self):
+        self.cssrmode = None
+        self.sat_n = []
+        self.iodssr = None
+        self.iodssr_c = {}
+        self.lc = []
+        self.nav_mode = {}
+        self.subtype = None
+
+    def update_value_from(self, source_object):
+        # snapshot of corrections shared with the decoder (no copy)
+        source_object = source_object.snapshot()
+        self.cssrmode = getattr(source_object, 'cssrmode', None)
+        self.sat_n = getattr(source_object, 'sat_n', [])
+        self.iodssr = getattr(source_object, 'iodssr', None)
+        self.iodssr_c = getattr(source_object, 'iodssr_c', [])
+        self.nav_mode = getattr(source_object, 'nav_mode', [])
+        self.subtype = getattr(source_object, 'subtype', None)
+
+        if len(self.lc) == 0:
+            self.lc.append(local_corr())
+            inet = 0
+            self.lc[inet].dclk = {}
+            self.lc[inet].dorb = {}
+            self.lc[inet].iode = {}
+            self.lc[inet].iodc = {}
+            self.lc[inet].iodc_c = {}
+            self.lc[inet].cbias = {}
+            self.lc[inet].t0 = {}
+        self.lc[0].iode = dict(getattr(source_object.lc[0], 'iode', {}))
+        # code biases of the last message (read-only, shared)
+        self.lc[0].cbias = getattr(source_object.lc[0], 'cbias', None) or {}
+        for j, sat in enumerate(source_object.sat_n):
+            if source_object.iodssr >= 0 and source_object.iodssr_c[sCType.ORBIT] == source_object.iodssr:
+                if sat not in source_object.sat_n:
+                    continue
+            if sat not in source_object.lc[0].iode.keys():
+                continue
+            if source_object.lc[0].dorb[sat] is None:
+                continue
+            if sat not in self.lc[0].t0:
+                self.lc[0].t0[sat] = {}
+            # Matching IOD for satellite and orbit
+            if source_object.lc[0].iodc[sat] == source_object.lc[0].iodc_c[sat]:
+                self.lc[0].iode[sat] = source_object.lc[0].iode[sat]
+                self.lc[0].dorb[sat] = source_object.lc[0].dorb[sat]
+                self.lc[0].iodc[sat] = source_object.lc[0].iodc[sat]
+                self.lc[0].t0[sat][sCType.ORBIT] = source_object.lc[0].t0[sat][sCType.ORBIT]
+
+                self.lc[0].dclk[sat] = source_object.lc[0].dclk[sat]
+                self.lc[0].iodc_c[sat] = source_object.lc[0].iodc_c[sat]
+                self.lc[0].t0[sat][sCType.CLOCK] = source_object.lc[0].t0[sat][sCType.CLOCK]
+            else:
+                self.lc[0].iode[sat] = source_object.lc[0].iode[sat]
+                self.lc[0].dorb[sat] = source_object.lc[0].dorb[sat]
+                self.lc[0].iodc[sat] = source_object.lc[0].iodc[sat]
+                self.lc[0].t0[sat][sCType.ORBIT] = source_object.lc[0].t0[sat][sCType.ORBIT]
+
+    def deletePRN(self, sat):
+        self.lc[0].iode[sat] = 0
+        self.lc[0].dorb[sat] = []
+        self.lc[0].iodc[sat] = 0
+        self.lc[0].t0[sat][sCType.ORBIT] = None
+
+        self.lc[0].dclk[sat] = np.nan
+        self.lc[0].iodc_c[sat] = 0
+        self.lc[0].t0[sat][sCType.CLOCK] = None
+
+
+class HASData:
+    """ HAS corrections merged for output """
+
+    def __init__(self):
+        self.init_empty()
+
+    def init_empty(self):
+        self.cssrmode = None
+        self.sat_n = []
+        self.iodssr = None
+        self.iodssr_c = {}
+        self.lc = []
+        self.nav_mode = {}
+        self.subtype = None
+
+    def update_value_from(self, source_object):
+        # snapshot of corrections shared with the decoder (no copy)
+        cs, source_object = source_object, source_object.snapshot()
+        self.cssrmode = getattr(source_object, 'cssrmode', None)
+        self.sat_n = getattr(source_object, 'sat_n', [])
+        self.iodssr = getattr(source_object, 'iodssr', None)
+        self.iodssr_c = getattr(source_object, 'iodssr_c', [])
+        self.nav_mode = getattr(source_object, 'nav_mode', [])
+        self.subtype = getattr(source_object, 'subtype', None)
+        self.mask_id = getattr(source_object, 'mask_id', None)
+        self.mask_id_clk = getattr(source_object, 'mask_id_clk', None)
+        self.sat_n_p = getattr(source_object, 'sat_n_p', None)
+
+        if len(self.lc) == 0:
+            self.lc.append(local_corr())
+            inet = 0
+            self.lc[inet].dclk = {}
+            self.lc[inet].dorb = {}
+            self.lc[inet].iode = {}
+            self.lc[inet].iodc = {}
+            self.lc[inet].iodc_c = {}
+            self.lc[inet].cbias = {}
+            self.lc[inet].t0 = {}
+        self.lc[0].iode = dict(getattr(source_object.lc[0], 'iode', {}))
+        # code biases of the last message (read-only, shared)
+        self.lc[0].cbias = getattr(source_object.lc[0], 'cbias', None) or {}
+        for j, sat in enumerate(source_object.sat_n):
+            if source_object.iodssr >= 0 and source_object.iodssr_c[sCType.ORBIT] == source_object.iodssr:
+                if sat not in source_object.sat_n:
+                    continue
+            if sat not in source_object.lc[0].iode.keys():
+                continue
+            if source_object.lc[0].dorb[sat] is None:
+                continue
+            if sat not in self.lc[0].t0:
+                self.lc[0].t0[sat] = {}
+            self.lc[0].iode[sat] = source_object.lc[0].iode[sat]
+            self.lc[0].dorb[sat] = source_object.lc[0].dorb[sat]
+            self.lc[0].t0[sat][sCType.ORBIT] = source_object.lc[0].t0[sat][sCType.ORBIT]
+            if sat not in source_object.sat_n_p:
+                cs.log_msg("missing clock corrections for sat="+str(sat))
+                continue
+            else:
+                self.lc[0].dclk[sat] = source_object.lc[0].dclk[sat]
+            self.lc[0].t0[sat][sCType.CLOCK] = source_object.lc[0].t0[sat][sCType.CLOCK]
+
+    def deletePRN(self, sat):
+        self.lc[0].iode[sat] = 0
+        self.lc[0].dorb[sat] = []
+        self.lc[0].t0[sat][sCType.ORBIT] = None
+
+        self.lc[0].dclk[sat] = np.nan
+        self.lc[0].t0[sat][sCType.CLOCK] = None
+
+
+class LDPCFec:
+    """ LDPC decoding of PPP-B2b frames (SBF BDSRawB2b records)
+
+    The process pool of nproc > 1 is created once per run of the pipeline
+    and shut down at the end of the records. Statistics are kept per
+    instance (stat).
+
+    nproc    : number of processes (>1: process pool)
+    max_iter : max number of LDPC iterations (None: default)
+    es_tol   : early-stop threshold of LDPC decoder (None: default)
+    nchunk   : number of records decoded at once if records are not an
+               array (e.g. stream)
+    """
+
+    def __init__(self, nproc=1, max_iter=None, es_tol=None, nchunk=2048):
+        self.nproc = nproc
+        self.max_iter = max_iter
+        self.es_tol = es_tol
+        self.nchunk = nchunk
+        self.stat = ldpc_stat_t()
+        self.executor = None
+
+    def decode(self, rows):
+        """ decode LDPC of records, returns messages {N, 61} """
+        if self.executor is not None:
+            msgs, nerr = decode_LDPC_parallel(rows, self.executor,
+                                              max_iter=self.max_iter,
+                                              es_tol=self.es_tol,
+                                              stat=self.stat)
+        else:
+            msgs, nerr = decode_LDPC_batch(rows, max_iter=self.max_iter,
+                                           es_tol=self.es_tol,
+                                           stat=self.stat)
+        return msgs
+
+    def __call__(self, records):
+        """ generate (message, {}) of records """
+        self.stat.reset()
+        if isinstance(records, np.ndarray):
+            chunks = [records]
+        else:
+            chunks = iter_chunks(records, self.nchunk)
+        if self.nproc > 1:
+            self.executor = ProcessPoolExecutor(max_workers=self.nproc)
+        try:
+            for rows in chunks:
+                for msg in self.decode(rows):
+                    yield msg.tobytes(), {}
+        finally:
+            if self.executor is not None:
+                self.executor.shutdown()
+                self.executor = None
+
+    def stat_str(self):
+        """ statistics of LDPC decoding """
+        return self.stat.summary()
+
+
+class HASFec:
+    """ HAS page assembly and RS decoding (SBF GALRawCNAV records)
+
+    Records are decoded in chunks as they are read (e.g. iter_sbf_file() or
+    iter_stream()), with the assembler kept across chunks. An epoch of
+    pages split by chunks is continued in the next chunk.
+
+    cs       : HAS decoder (decode_has_page(), rs_cache)
+    gMat     : RS generator matrix {255, 32}
+    progress : wrapper of the iterator of epochs to show progress
+               (e.g. tqdm, None: not shown)
+    """
+
+    def __init__(self, cs, gMat, progress=None):
+        self.cs = cs
+        self.gMat = gMat
+        self.progress = progress
+        self.asm = HASPageAssembler()
+
+    def pages(self, records):
+        """ generate (tow, HAS pages) of records grouped by tow per chunk """
+        chunks = [records] if isinstance(records, np.ndarray) else \
+            iter_chunks(records)
+        for v in chunks:
+            pg = decode_has_pages(v['nav'], v['tow'])
+            yield from self.asm.group_by_tow(pg)
+
+    def __call__(self, records):
+        """ generate (HAS message, {'msgtype'}) of records """
+        cs, asm = self.cs, self.asm
+        tows = self.pages(records)
+        if self.progress is not None:
+            tows = self.progress(tows, total=len(np.unique(records['tow']))
+                                 if isinstance(records, np.ndarray) else None)
+        tow0 = None  # time of the current epoch
+        for tow, pi in tows:
+            if tow0 is not None and tow != tow0:
+                for mid in asm.end_epoch(tow0):
+                    if cs.monlevel >= 2:
+                        print(f"reset mid={mid} tow={tow0}")
+            tow0 = tow
+            cs.tow0 = tow // 3600 * 3600
+            HASmsgs = []
+            for p in pi[pi['valid']]:
+                for mt, mid, ms, rec, has_pages in asm.add_fields(
+                        p['mt'], p['mid'], p['ms'], p['pid'], p['page'], tow):
+                    if cs.monlevel >= 2:
+                        print("data collected mid={:2d} ms={:2d} tow={:.0f}"
+                              .format(mid, ms, tow))
+                    HASmsgs += [(mt, cs.decode_has_page(rec, has_pages,
+                                                        self.gMat, ms))]
+            for mt, HASmsg in HASmsgs:
+                yield HASmsg, {'msgtype': mt}
+
+    def stat_str(self):
+        """ statistics of page assembly and RS decoding """
+        return self.asm.stat_str() + [self.cs.rs_cache.stat()]
+
+
+class B2BScheduler:
+    """ output epochs of B2b corrections
+
+    Products are output at epochs of interval up to a new clock update, with
+    the corrections merged before it. Orbit updates and clock updates of the
+    same epoch are merged to data (B2BData).
+
+    t        : first output epoch (gtime_t)
+    cstat    : status of decoder (lc[0].cstat) required to output (0: none)
+    interval : interval of output epochs (s)
+    delay    : delay of corrections to output epochs (s)
+    """
+
+    def __init__(self, t, cstat=0xf, interval=INTERVAL, delay=0,
+                 max_orbit_delay=MAX_ORBIT_DELAY,
+                 max_clock_delay=MAX_CLOCK_DELAY):
+        self.data = B2BData()
+        self.current_time = t
+        self.cstat = cstat
+        self.interval = interval
+        self.delay = delay
+        self.max_orbit_delay = max_orbit_delay
+        self.max_clock_delay = max_clock_delay
+        self.torb = None  # time of orbit update
+        self.tclk = None  # time of clock update
+
+    def update(self, cs):
+        """ generate output epochs (t, time of clock update) after a message
+            decoded (data are valid until the next epoch) """
+        if (cs.lc[0].cstat & self.cstat) != self.cstat:
+            return
+        if cs.subtype == sCSSR.CLOCK:
+            if self.tclk is None:
+                self.tclk = cs.time
+            time_clock_sat = cs.time
+            if timediff(time_clock_sat, self.tclk) >= 1:
+                while timediff(self.current_time, time_clock_sat) < 0:
+                    time_corr = timeadd(self.current_time, -self.delay)
+                    self.current_time = timeadd(time_corr, self.interval)
+                    if timediff(time_corr, self.tclk) < 0:
+                        continue
+                    if timediff(time_corr, self.tclk) > self.max_clock_delay:
+                        cs.log_msg(">>>>ERROR: large clock difference[obst-clkt] : " + time2str(
+                            time_corr) + " " + time2str(self.tclk))
+                        continue
+                    if timediff(time_corr, self.torb) < 0 or timediff(
+                            time_corr, self.torb) > self.max_orbit_delay:
+                        cs.log_msg(">>>>ERROR: large orbit difference [obst-orbt]: " + time2str(
+                            time_corr) + " " + time2str(self.torb))
+                        continue
+                    yield timeadd(time_corr, self.delay), self.tclk
+                self.tclk = time_clock_sat
+            else:
+                self.data.update_value_from(cs)
+
+        if cs.subtype == sCSSR.ORBIT:
+            if self.torb is None:
+                self.torb = cs.time
+            time_orbit_sat = cs.time
+            if abs(timediff(time_orbit_sat, self.torb)) > 1:
+                self.torb = time_orbit_sat
+                self.data.update_value_from(cs)
+
+
+class HASScheduler:
+    """ output epochs of HAS corrections
+
+    Products are output at epochs of interval up to a new orbit or clock
+    update, then the corrections are merged to data (HASData).
+
+    t        : first output epoch (gtime_t)
+    interval : interval of output epochs (s)
+    delay    : delay of corrections to output epochs (s)
+    """
+
+    def __init__(self, t, interval=INTERVAL, delay=0,
+                 max_orbit_delay=MAX_ORBIT_DELAY,
+                 max_clock_delay=MAX_CLOCK_DELAY):
+        self.data = HASData()
+        self.current_time = t
+        self.interval = interval
+        self.delay = delay
+        self.max_orbit_delay = max_orbit_delay
+        self.max_clock_delay = max_clock_delay
+        self.torb = None  # time of orbit update
+        self.tclk = None  # time of clock update
+
+    def update(self, cs):
+        """ generate output epochs (t,) after a message decoded """
+        update_Orbssr = False
+        update_Clkssr = False
+        if cs.subtype == sCSSR.ORBIT or cs.subtype == sCSSR.CBIAS:
+            if self.torb is None:
+                self.torb = cs.time
+            time_orbit_sat = cs.time
+            if abs(timediff(time_orbit_sat, self.torb)) > 1:  # new orbit
+                update_Orbssr = True
+                newssr_time = time_orbit_sat
+                lastssr_time = self.torb
+        if cs.subtype == sCSSR.CLOCK:
+            if self.tclk is None:
+                self.tclk = cs.time
+            time_clock_sat = cs.time
+            if timediff(time_clock_sat, self.tclk) >= 1:  # new clock
+                update_Clkssr = True
+                newssr_time = time_clock_sat
+                lastssr_time = self.tclk
+        if not update_Clkssr and not update_Orbssr:
+            return
+        while timediff(self.current_time, newssr_time) < 0:
+            time_corr = timeadd(self.current_time, -self.delay)
+            self.current_time = timeadd(time_corr, self.interval)
+            if timediff(time_corr, lastssr_time) <= 0:
+                continue
+            if update_Clkssr and timediff(time_corr, lastssr_time) > self.max_clock_delay:
+                cs.log_msg(">>>>ERROR: large clock difference[obst-clkt] : " + time2str(time_corr) + " " + time2str(lastssr_time))
+                continue
+            if update_Orbssr and (timediff(time_corr, self.torb) < 0 or
+                                  timediff(time_corr, self.torb) >
+                                  self.max_orbit_delay):
+                cs.log_msg(">>>>ERROR: large orbit difference [obst-orbt]: " + time2str(time_corr) + " " + time2str(self.torb))
+                continue
+            yield (timeadd(time_corr, self.delay),)
+        if update_Clkssr:
+            self.tclk = time_clock_sat
+        if update_Orbssr:
+            self.torb = time_orbit_sat
+        if cs.mask_id == cs.mask_id_clk:
+            self.data.update_value_from(cs)
+
+
+class SP3Sink:
+    """ SP3 and SSR files of products by encode_SP3() of decoder
+
+    nav      : navigation data (Nav)
+    file_sp3 : SP3 file written at close
+    file_ssr : SSR file (BNC text) appended per epoch
+    """
+
+    def __init__(self, nav, file_sp3, file_ssr):
+        self.nav = nav
+        self.file_sp3 = file_sp3
+        self.file_ssr = file_ssr
+        self.orb = peph()
+        self.sp_out = peph()
+        self.nav_out = Nav()
+
+    def put(self, cs, data, epoch):
+        """ output products of an epoch (epoch: output of scheduler) """
+        cs.encode_SP3(data, self.orb, self.nav, *epoch, self.sp_out,
+                      self.nav_out, self.file_ssr)
+
+    def close(self, cs):
+        self.sp_out.write_sp3(self.file_sp3, self.nav_out)
+
+
+class Pipeline:
+    """ decoding pipeline of corrections
+
+    source       : input records (iterable, e.g. array or generator)
+    fec          : callable of records to generate (message, attributes set
+                   to decoder before decoding) (None: records are messages)
+    cssr_decoder : CSSR decoder (decode_cssr(), log_msg())
+    scheduler    : update(decoder) to generate output epochs after a message
+                   decoded, merged corrections as data
+    sinks        : outputs of products of epochs (put(decoder, data, epoch),
+                   close(decoder))
+    """
+
+    def __init__(self, source, fec, cssr_decoder, scheduler, sinks=()):
+        self.source = source
+        self.fec = fec
+        self.cs = cssr_decoder
+        self.scheduler = scheduler
+        self.sinks = list(sinks)
+
+    def records(self):
+        """ generate input records """
+        yield from self.source
+
+    def messages(self):
+        """ generate (message, attributes of decoder) of input records """
+        if self.fec is None:
+            for rec in self.source:
+                yield rec, {}
+        else:
+            yield from self.fec(self.source)
+
+    def epochs(self):
+        """ decode messages and generate output epochs """
+        cs = self.cs
+        for msg, attr in self.messages():
+            for key, val in attr.items():
+                setattr(cs, key, val)
+            cs.decode_cssr(msg)
+            yield from self.scheduler.update(cs)
+
+    def run(self):
+        """ output products of all epochs to sinks """
+        for epoch in self.epochs():
+            for sink in self.sinks:
+                sink.put(self.cs, self.scheduler.data, epoch)
+        self.close()
+        return self
+
+    def close(self):
+        """ log statistics of stages and close sinks """
+        for line in getattr(self.fec, 'stat_str', lambda: [])():
+            self.cs.log_msg(line)
+        for sink in self.sinks:
+            sink.close(self.cs)
+
+
+def iter_chunks(records, nchunk=2048):
+    """ generate arrays of up to nchunk records (records: iterable of
+        records or arrays of records) """
+    buff = []
+    for rec in records:
+        if isinstance(rec, np.ndarray) and rec.ndim > 0:
+            if len(buff) > 0:
+                yield np.array(buff, dtype=buff[0].dtype)
+                buff = []
+            if len(rec) > 0:
+                yield rec
+            continue
+        buff.append(rec)
+        if len(buff) >= nchunk:
+            yield np.array(buff, dtype=buff[0].dtype)
+            buff = []
+    if len(buff) > 0:
+        yield np.array(buff, dtype=buff[0].dtype)
+
+
+class nav_cache:
+    """ cache of RINEX navigation files parsed once and shared by days
+
+    A file is parsed to its own Nav with the header fields set to unset
+    values (nan, STO_UNSET, None), and nav() merges the files in order as
+    decode_nav() with append: ephemerides are concatenated and the header
+    fields set by a file override the preceding ones. The parsed files are
+    kept in memory (LRU) and, if path is set, as pickle files in path to be
+    shared by processes and runs. The cached Nav must not be modified.
+    """
+    HDR_FIELD = ('ion', 'ion_gim', 'sto', 'eop')
+    STO_UNSET = -2
+
+    def __init__(self, path=None, size=8):
+        self.path = path
+        self.size = size
+        self.cache = OrderedDict()
+        self.nhit = 0
+        self.nmiss = 0
+
+    def file_key(self, file):
+        """ key of file to detect updates (size, mtime) """
+        st = os.stat(file)
+        return (st.st_size, st.st_mtime_ns)
+
+    def cache_file(self, file):
+        return os.path.join(self.path, os.path.basename(file) + '.pkl')
+
+    def parse(self, file):
+        """ parse a navigation file to a Nav with unset header fields """
+        nav = Nav()
+        for name in self.HDR_FIELD:
+            getattr(nav, name)[:] = np.nan
+        nav.sto_prm[:] = self.STO_UNSET
+        nav.ion_region = None
+        if rnxdec().decode_nav(file, nav) is not nav:
+            raise ValueError("unsupported RINEX version: " + file)
+        return nav
+
+    def get(self, file):
+        """ parsed Nav of a navigation file """
+        key = self.file_key(file)
+        if file in self.cache and self.cache[file][0] == key:
+            self.cache.move_to_end(file)
+            self.nhit += 1
+            return self.cache[file][1]
+        nav = None
+        if self.path is not None and os.path.exists(self.cache_file(file)):
+            with open(self.cache_file(file), 'rb') as fp:
+                key_, nav = pickle.load(fp)
+            if key_ != key:
+                nav = None
+        if nav is None:
+            self.nmiss += 1
+            nav = self.parse(file)
+            if self.path is not None:
+                self.save(file, key, nav)
+        else:
+            self.nhit += 1
+        self.cache[file] = (key, nav)
+        while len(self.cache) > max(self.size, 1):
+            self.cache.popitem(last=False)
+        return nav
+
+    def save(self, file, key, nav):
+        """ save parsed Nav (atomic replace for concurrent readers) """
+        os.makedirs(self.path, exist_ok=True)
+        file_tmp = self.cache_file(file) + '.{:d}.tmp'.format(os.getpid())
+        with open(file_tmp, 'wb') as fp:
+            pickle.dump((key, nav), fp, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(file_tmp, self.cache_file(file))
+
+    def nav(self, files):
+        """ Nav of navigation files merged in order """
+        nav = Nav()
+        for file in files:
+            nav_f = self.get(file)
+            nav.eph += nav_f.eph
+            nav.geph += nav_f.geph
+            for name in self.HDR_FIELD:
+                v = getattr(nav_f, name)
+                m = ~np.isnan(v)
+                getattr(nav, name)[m] = v[m]
+            m = nav_f.sto_prm != self.STO_UNSET
+            nav.sto_prm[m] = nav_f.sto_prm[m]
+            if nav_f.ion_region is not None:
+                nav.ion_region = nav_f.ion_region
+        return nav
+
+    def stat(self):
+        """ hit/miss statistics as string """
+        return "NAV cache: size={:d}/{:d} hit={:d} miss={:d}".format(
+            len(self.cache), self.size, self.nhit, self.nmiss)
+
+
+def read_nav(files, cache=None):
+    """ read RINEX navigation files to a Nav (cache: nav_cache, None: no
+        cache) """
+    if cache is not None:
+        return cache.nav(files)
+    rnx = rnxdec()
+    nav = Nav()
+    for k, file in enumerate(files):
+        nav = rnx.decode_nav(file, nav, k > 0)
+    return nav
+
+
+def init_time(cs, ep):
+    """ set week and day of decoder, returns time of epoch """
+    t = epoch2time(ep)
+    week, tow = time2gpst(t)
+    cs.week = week
+    cs.tow0 = tow // 86400 * 86400
+    return t
+
+
+def ssr_outputs(ssr_out, corr_dir, rtcm=False):
+    """ SSR outputs of decoder (ssr_out: server, rtcm: RTCM3 file of
+        corr_dir) """
+    out = [] if ssr_out is None else [ssr_out]
+    if rtcm:
+        out.append(rtcm3_file(corr_dir + '.rtcm3'))
+    return out
+
+
+def b2b_sept_pipeline(file_bds, nav_files, ep, corr_dir, prn=59, nproc=1,
+                      ldpc_max_iter=None, ldpc_es_tol=None, ssr_out=None,
+                      rtcm=False, monlevel=2, nav_cache=None,
+                      max_orbit_delay=MAX_ORBIT_DELAY,
+                      max_clock_delay=MAX_CLOCK_DELAY):
+    """ pipeline of PPP-B2b corrections by Septentrio receiver
+
+    file_bds  : SBF BDSRawB2b file (binary or ASCII export) or chunks of
+                records of the PRN (e.g. iter_stream() of sbf_framer)
+    nav_files : RINEX navigation files
+    ep        : start epoch [y, m, d, h, m, s]
+    corr_dir  : path of products without extension (.sp3, .ssr, .log,
+                .rtcm3)
+    prn       : BDS PRN of PPP-B2b corrections
+    nproc     : number of processes for LDPC decoding (>1: process pool)
+    ssr_out   : SSR product server (None: not served)
+    rtcm      : write RTCM3 SSR messages of epochs (.rtcm3)
+    nav_cache : cache of navigation files (nav_cache, None: not cached)
+    """
+    nav = read_nav(nav_files, nav_cache)
+    v = iter_sbf_file(file_bds, 4242, prn=prn) if isinstance(file_bds, str) \
+        else file_bds
+    cs = cssr_bds(corr_dir + '.log')
+    cs.ssr_out = ssr_outputs(ssr_out, corr_dir, rtcm)
+    cs.monlevel = monlevel
+    t = init_time(cs, ep)
+    return Pipeline(v, LDPCFec(nproc, ldpc_max_iter, ldpc_es_tol), cs,
+                    B2BScheduler(t, cstat=0xf,
+                                 max_orbit_delay=max_orbit_delay,
+                                 max_clock_delay=max_clock_delay),
+                    [SP3Sink(nav, corr_dir + '.sp3', corr_dir + '.ssr')])
+
+
+def b2b_um982_pipeline(source, nav_files, ep, corr_dir, ssr_out=None,
+                       rtcm=False, monlevel=2, nav_cache=None,
+                       max_orbit_delay=MAX_ORBIT_DELAY,
+                       max_clock_delay=MAX_CLOCK_DELAY):
+    """ pipeline of PPP-B2b corrections by Unicore UM982 receiver
+
+    source    : records of PPPB2BINFO1/2/4 in order (e.g. read_pppb2binfo(),
+                rows of iter_stream())
+    nav_files : RINEX navigation files
+    ep        : start epoch [y, m, d, h, m, s]
+    corr_dir  : path of products without extension (.sp3, .ssr, .log,
+                .rtcm3)
+    ssr_out   : SSR product server (None: not served)
+    rtcm      : write RTCM3 SSR messages of epochs (.rtcm3)
+    nav_cache : cache of navigation files (nav_cache, None: not cached)
+    """
+    nav = read_nav(nav_files, nav_cache)
+    cs = cssr_bdsC(corr_dir + '.log')
+    cs.ssr_out = ssr_outputs(ssr_out, corr_dir, rtcm)
+    cs.monlevel = monlevel
+    t = init_time(cs, ep)
+    return Pipeline(source, None, cs,
+                    B2BScheduler(t, cstat=0, max_orbit_delay=max_orbit_delay,
+                                 max_clock_delay=max_clock_delay),
+                    [SP3Sink(nav, corr_dir + '.sp3', corr_dir + '.ssr')])
+
+
+def has_sept_pipeline(file_has, nav_files, ep, corr_dir, rs_cache=None,
+                      ssr_out=None, rtcm=False, monlevel=2, progress=None,
+                      nav_cache=None, max_orbit_delay=MAX_ORBIT_DELAY,
+                      max_clock_delay=MAX_CLOCK_DELAY):
+    """ pipeline of Galileo HAS corrections by Septentrio receiver
+
+    file_has  : SBF GALRawCNAV file (binary or ASCII export) or chunks of
+                records (e.g. iter_stream() of sbf_framer)
+    nav_files : RINEX navigation files
+    ep        : start epoch [y, m, d, h, m, s]
+    corr_dir  : path of products without extension (.sp3, .ssr, .log,
+                .rtcm3)
+    rs_cache  : cache of RS decoding matrices shared by days (None: new)
+    ssr_out   : SSR product server (None: not served)
+    rtcm      : write RTCM3 SSR messages of epochs (.rtcm3)
+    progress  : wrapper of iterator to show progress (e.g. tqdm)
+    nav_cache : cache of navigation files (nav_cache, None: not cached)
+    """
+    nav = read_nav(nav_files, nav_cache)
+    v = iter_sbf_file(file_has, 4024) if isinstance(file_has, str) else \
+        file_has
+    gMat = np.genfromtxt(FILE_GMAT, dtype="u1", delimiter=",")
+    cs = cssr_has(corr_dir + '.log')
+    cs.ssr_out = ssr_outputs(ssr_out, corr_dir, rtcm)
+    cs.monlevel = monlevel
+    if rs_cache is not None:
+        cs.rs_cache = rs_cache
+    t = init_time(cs, ep)
+    return Pipeline(v, HASFec(cs, gMat, progress), cs,
+                    HASScheduler(t, max_orbit_delay=max_orbit_delay,
+                                 max_clock_delay=max_clock_delay),
+                    [SP3Sink(nav, corr_dir + '.sp3', corr_dir + '.ssr')])
@@ -0,0 +1,252 @@
+"""
+module for RTCM3 SSR message encoding
+
+Encodes the orbit, clock and code bias corrections of an epoch, as
+published by encode_SP3() of the CSSR decoders, into RTCM3 SSR messages:
+
+  orbit (1057/1063/1240/1246/1252/1258), clock (+1), code bias (+2),
+  combined orbit and clock (+3) of GPS/GLONASS/Galileo/QZSS/SBAS/BDS
+
+framed by 0xD3, length and CRC-24Q. The field widths of satellite ID, IOD
+and IODCRC per system, and the signal IDs of code bias follow RTKLIB
+(rtcm3e.c). Sign conventions are the same as local_corr: the satellite
+position is corrected by -dorb (radial, along, cross) and the clock by
++dclk, as in RTKLIB satpos_ssr().
+
+rtcm3_file writes the messages of the epochs to a file, and ssr_server
+serves them to subscribers, both as ssr_out of the decoders.
+
+[1] RTCM Standard 10403.3, Differential GNSS Services - Version 3, 2016
+[2] T. Takasu, RTKLIB ver.2.4.3, src/rtcm3e.c
+"""
+
+import bitstruct as bs
+import numpy as np
+from B2b_HAS_decoder.gnss import uGNSS, sat2prn, time2gpst, time2bdt, \
+    gpst2bdt, gpst2utc, timeadd
+
+SSR_ORBIT = 0
+SSR_CLOCK = 1
+SSR_CBIAS = 2
+SSR_COMBINED = 3
+
+# message number of orbit correction
+SSR_MSGNO = {uGNSS.GPS: 1057, uGNSS.GLO: 1063, uGNSS.GAL: 1240,
+             uGNSS.QZS: 1246, uGNSS.SBS: 1252, uGNSS.BDS: 1258}
+
+# bits of satellite ID, IOD, IODCRC and offset of PRN
+SSR_SATID = {uGNSS.GPS: (6, 8, 0, 0), uGNSS.GLO: (5, 8, 0, 0),
+             uGNSS.GAL: (6, 10, 0, 0), uGNSS.QZS: (4, 8, 0, 192),
+             uGNSS.BDS: (6, 10, 24, 1), uGNSS.SBS: (6, 9, 24, 120)}
+
+# signal ID of code bias -> signal (RINEX code, '': reserved)
+SSR_SIG = {
+    uGNSS.GPS: ['1C', '1P', '1W', '1S', '1L', '2C', '2D', '2S', '2L', '2X',
+                '2P', '2W', '', '', '5I', '5Q'],
+    uGNSS.GLO: ['1C', '1P', '2C', '2P', '4A', '4B', '6A', '6B', '3I', '3Q'],
+    uGNSS.GAL: ['1A', '1B', '1C', '', '', '5I', '5Q', '', '7I', '7Q', '',
+                '8I', '8Q', '', '6A', '6B', '6C'],
+    uGNSS.QZS: ['1C', '1S', '1L', '2S', '2L', '', '5I', '5Q', '', '6S', '6L',
+                '', '', '', '', '', '', '6E'],
+    uGNSS.BDS: ['2I', '2Q', '', '6I', '6Q', '', '7I', '7Q', '', '1D', '1P',
+                '', '5D', '5P', '', '1A', '', '', '6A'],
+    uGNSS.SBS: ['1C', '5I', '5Q'],
+}
+
+# update interval (s)
+SSR_UDI = [1, 2, 5, 10, 15, 30, 60, 120, 240, 300, 600, 900, 1800, 3600,
+           7200, 10800]
+
+MAXLEN = 1023  # max length of message (bytes)
+SSR_NSMAX = {uGNSS.QZS: 15}  # max number of satellites per message (63)
+
+# fields of orbit and clock corrections: (bits, scale)
+ORB_FMT = [(22, 1e-4), (20, 4e-4), (20, 4e-4), (21, 1e-6), (19, 4e-6),
+           (19, 4e-6)]
+CLK_FMT = [(22, 1e-4), (21, 1e-6), (27, 2e-8)]
+CB_FMT = (14, 0.01)
+
+
+def gen_crc24q_tbl():
+    """ table of CRC-24Q (polynomial 0x1864CFB) """
+    tbl = []
+    for i in range(256):
+        crc = i << 16
+        for _ in range(8):
+            crc <<= 1
+            if crc & 0x1000000:
+                crc ^= 0x1864CFB
+        tbl.append(crc & 0xFFFFFF)
+    return tbl
+
+
+CRC24Q_TBL = gen_crc24q_tbl()
+
+
+def crc24q(buff):
+    """ CRC-24Q of bytes """
+    crc = 0
+    for b in buff:
+        crc = (crc << 8 & 0xFFFFFF) ^ CRC24Q_TBL[(crc >> 16) ^ b]
+    return crc
+
+
+def rtcm3_frame(payload):
+    """ RTCM3 frame of message (preamble, length, message, CRC-24Q) """
+    buff = bytes([0xD3, len(payload) >> 8 & 0x3, len(payload) & 0xFF]) + \
+        payload
+    return buff + crc24q(buff).to_bytes(3, 'big')
+
+
+def ssr_epoch(t, sys):
+    """ epoch time of SSR message (GLONASS: time of day, BDS: BDT) """
+    if sys == uGNSS.GLO:
+        tod = time2gpst(timeadd(gpst2utc(t), 10800.0))[1] % 86400
+        return int(tod + 0.5) % 86400
+    if sys == uGNSS.BDS:
+        return int(time2bdt(gpst2bdt(t))[1] + 0.5) % 604800
+    return int(time2gpst(t)[1] + 0.5) % 604800
+
+
+def ssr_udi(udi):
+    """ update interval (s) -> index of SSR_UDI """
+    return int(np.argmin(np.abs(np.array(SSR_UDI) - udi)))
+
+
+def sint(x, n, scl):
+    """ scaled signed integer (None: out of range) """
+    v = int(np.round(x / scl))
+    return v if -(1 << (n-1)) < v < (1 << (n-1)) else None
+
+
+def encode_sat(subtype, sys, sat, c):
+    """ encode fields of a satellite, return (format, values) or None """
+    np_, ni, nj, offp = SSR_SATID[sys]
+    prn = sat2prn(sat)[1] - offp
+    fmt, val = 'u{}'.format(np_), [prn]
+    if subtype == SSR_CBIAS:
+        cb = [(SSR_SIG[sys].index(rsig.str()[1:]), sint(v, *CB_FMT))
+              for rsig, v in c.items() if rsig.str()[1:] in SSR_SIG[sys] and
+              not np.isnan(v)]
+        cb = [x for x in cb if x[1] is not None][:31]
+        fmt += 'u5' + 'u5s{}'.format(CB_FMT[0]) * len(cb)
+        val += [len(cb)] + [x for y in cb for x in y]
+        return fmt, val
+    iode, dclk, dorb = c
+    if subtype != SSR_CLOCK:
+        fmt += 'u{}'.format(ni) + ('u{}'.format(nj) if nj > 0 else '')
+        val += [int(iode) & ((1 << ni) - 1)] + ([0] if nj > 0 else [])
+        d = list(dorb[:3]) + [0.0, 0.0, 0.0]
+        for (n, scl), x in zip(ORB_FMT, d):
+            fmt += 's{}'.format(n)
+            val += [sint(x, n, scl)]
+    if subtype != SSR_ORBIT:
+        for (n, scl), x in zip(CLK_FMT, (dclk, 0.0, 0.0)):
+            fmt += 's{}'.format(n)
+            val += [sint(x, n, scl)]
+    if None in val or (prn < 0 or prn >= 1 << np_):
+        return None
+    return fmt, val
+
+
+def encode_ssr(subtype, t, sys, corr, iodssr=0, udi=5, provider=0,
+               solution=0, refd=0):
+    """ encode RTCM3 SSR messages of a system
+
+    subtype : SSR_ORBIT, SSR_CLOCK, SSR_CBIAS or SSR_COMBINED
+    t       : epoch time (gtime_t, GPST)
+    sys     : navigation system (uGNSS)
+    corr    : {sat: (iode, dclk, dorb)} (orbit/clock/combined) or
+              {sat: {rsig: cb}} (code bias) of satellites of sys
+    iodssr  : IOD SSR
+    udi     : update interval (s)
+    provider: SSR provider ID
+    solution: SSR solution ID
+    refd    : satellite reference datum (0: ITRF, 1: regional)
+    returns list of RTCM3 frames (split by multiple message indicator if
+    the satellites do not fit in a message). satellites of corrections
+    out of range of the fields are not encoded.
+    """
+    msgno = SSR_MSGNO[sys] + subtype
+    nsmax = SSR_NSMAX.get(sys, 63)
+    sats = []
+    for sat in sorted(corr):
+        if sat2prn(sat)[0] != sys:
+            continue
+        r = encode_sat(subtype, sys, sat, corr[sat])
+        if r is not None:
+            sats.append(r)
+
+    hfmt = 'u12' + ('u17' if sys == uGNSS.GLO else 'u20') + 'u4u1' + \
+        ('u1' if subtype in (SSR_ORBIT, SSR_COMBINED) else '') + 'u4u16u4' + \
+        ('u4' if sys == uGNSS.QZS else 'u6')
+    nhdr = bs.calcsize(hfmt)
+    grp, n = [[]], nhdr
+    for s in sats:  # split to messages
+        ns = bs.calcsize(s[0])
+        if len(grp[-1]) >= nsmax or n + ns > MAXLEN * 8:
+            grp.append([])
+            n = nhdr
+        grp[-1].append(s)
+        n += ns
+
+    frames = []
+    for k, g in enumerate(grp):
+        mmi = 1 if k < len(grp) - 1 else 0
+        hval = [msgno, ssr_epoch(t, sys), ssr_udi(udi), mmi] + \
+            ([refd] if subtype in (SSR_ORBIT, SSR_COMBINED) else []) + \
+            [iodssr & 0xF, provider, solution, len(g)]
+        fmt = hfmt + ''.join(s[0] for s in g)
+        val = hval + [x for s in g for x in s[1]]
+        frames.append(rtcm3_frame(bs.pack(fmt, *val)))
+    return frames
+
+
+def encode_ssr_corr(t, corr, subtype=SSR_COMBINED, **opts):
+    """ encode RTCM3 SSR messages of corrections {sat: (iode, dclk, dorb)}
+        (or {sat: {rsig: cb}}) of all systems (opts: see encode_ssr()) """
+    frames = []
+    for sys in SSR_MSGNO:
+        if any(sat2prn(sat)[0] == sys for sat in corr):
+            frames += encode_ssr(subtype, t, sys, corr, **opts)
+    return frames
+
+
+def encode_ssr_epoch(t, corr, cbias=None, **opts):
+    """ encode RTCM3 SSR messages of an epoch: combined orbit and clock of
+        corr {sat: (iode, dclk, dorb)} and code biases of cbias
+        {sat: {rsig: cb}} (None: none) (opts: see encode_ssr()) """
+    frames = encode_ssr_corr(t, corr, SSR_COMBINED, **opts)
+    if cbias:
+        frames += encode_ssr_corr(t, cbias, SSR_CBIAS, **opts)
+    return frames
+
+
+class rtcm3_file:
+    """ RTCM3 SSR file of corrections of epochs
+
+    file : RTCM3 file appended per epoch (combined orbit and clock, and code
+           bias messages)
+    opts : options of encode_ssr()
+
+    publish() is called per epoch as ssr_server.publish().
+    """
+
+    def __init__(self, file, **opts):
+        self.file = file
+        self.opts = opts
+        self.nepoch = 0  # number of epochs written
+
+    def publish(self, t, src, corr, cbias=None):
+        """ append RTCM3 messages of corrections of an epoch
+
+        t    : epoch time (gtime_t)
+        src  : source of corrections ('B2B' or 'HAS')
+        corr : {sat: (iode, dclk, dorb)}
+        cbias: {sat: {rsig: cb}} (None: no code bias)
+        """
+        if len(corr) == 0:
+            return
+        with open(self.file, 'ab') as fp:
+            fp.write(b''.join(encode_ssr_epoch(t, corr, cbias, **self.opts)))
+        self.nepoch += 1
@@ -0,0 +1,256 @@
+"""
+module for Septentrio SBF raw navigation data (binary and ASCII export)
+
+The ASCII export of BDSRawB2b and GALRawCNAV blocks has one record per
+line as comma separated fields:
+
+  TOW, WN, PRN, validity, ..., NAVBits
+
+where NAVBits is the hex string of the raw navigation bits (may contain
+whitespace). Binary SBF blocks are read directly from a memory-mapped
+file and give the same records.
+
+[1] Septentrio, mosaic-X5 Reference Guide, SBF Reference
+"""
+
+import os
+import mmap
+import struct
+from binascii import unhexlify, crc_hqx, Error as BinasciiError
+import numpy as np
+
+WS = b' \t\r\n'  # whitespace deleted from NAVBits
+NBYTE_NAV = 139  # max bytes of raw navigation bits (278 hex chars)
+NCHUNK = 65536   # number of records per chunk
+
+# SBF raw navigation blocks: block number -> (name, number of NAVBits words)
+SBF_BLK = {4242: ('BDSRawB2b', 31), 4024: ('GALRawCNAV', 16)}
+
+
+def sbf_dtype(nbyte=NBYTE_NAV):
+    """ record of raw navigation data (nav: bytes padded with 0) """
+    return [('tow', 'f8'), ('wn', 'u2'), ('prn', 'u1'), ('nav', 'u1', (nbyte,))]
+
+
+def iter_sbf_text(file, prn=None, nbyte=NBYTE_NAV, nchunk=NCHUNK):
+    """ read ASCII SBF raw navigation data as chunks of records
+
+    file  : ASCII SBF file
+    prn   : PRN number(s) of satellites to be read (None: all)
+    nbyte : bytes of navigation data field
+    nchunk: max number of records per chunk
+    generates records of sbf_dtype(nbyte) {n} (n <= nchunk), with only the
+    records of validity 'Passed'
+    """
+    if prn is not None:
+        prn = {prn} if np.isscalar(prn) else set(prn)
+    rec = []
+    with open(file, 'rb') as fp:
+        for line in fp:
+            f = line.split(b',')
+            if len(f) < 5 or f[3].strip() != b'Passed':
+                continue
+            try:
+                sat = int(f[2].strip()[1:])
+                if prn is not None and sat not in prn:
+                    continue
+                nav = f[-1].translate(None, WS)
+                buff = unhexlify(nav + b'0' if len(nav) % 2 else nav)
+                rec.append((float(f[0]), int(f[1]), sat,
+                            buff[:nbyte].ljust(nbyte, b'\0')))
+            except (ValueError, BinasciiError):
+                continue
+            if len(rec) >= nchunk:
+                yield to_records(rec, nbyte)
+                rec = []
+    if len(rec) > 0:
+        yield to_records(rec, nbyte)
+
+
+def to_records(rec, nbyte):
+    """ list of (tow, wn, prn, nav) -> records of sbf_dtype(nbyte) """
+    v = np.zeros(len(rec), dtype=sbf_dtype(nbyte))
+    tow, wn, prn, nav = zip(*rec)
+    v['tow'], v['wn'], v['prn'] = tow, wn, prn
+    v['nav'] = np.frombuffer(b''.join(nav), dtype='u1').reshape(-1, nbyte)
+    return v
+
+
+def read_sbf_text(file, prn=None, nbyte=NBYTE_NAV, nchunk=NCHUNK):
+    """ read ASCII SBF raw navigation data (see iter_sbf_text()) """
+    v = list(iter_sbf_text(file, prn, nbyte, nchunk))
+    if len(v) == 0:
+        return np.zeros(0, dtype=sbf_dtype(nbyte))
+    return np.concatenate(v)
+
+
+def svid2prn(svid):
+    """ SBF SVID -> PRN number (0: not BDS/Galileo) """
+    if 71 <= svid <= 106:  # Galileo
+        return svid - 70
+    if 141 <= svid <= 180:  # BDS C01-C40
+        return svid - 140
+    if 223 <= svid <= 245:  # BDS C41-C63
+        return svid - 182
+    return 0
+
+
+def decode_raw_nav(buff, i, nword, nbyte=NBYTE_NAV):
+    """ decode raw navigation block at buff[i:] (CRC checked)
+
+    returns record (tow, wn, prn, nav) of sbf_dtype(nbyte) or None if the
+    block is not CRCPassed or has no valid time
+    """
+    tow, wn, svid, valid = struct.unpack_from('<IHBB', buff, i + 8)
+    if not valid or tow == 0xffffffff:
+        return None
+    # NAVBits (u4 little endian) -> bytes (first bit: MSB)
+    nav = np.frombuffer(bytes(buff[i+20:i+20+nword*4]),
+                        dtype='<u4').astype('>u4').tobytes()
+    return (tow * 1e-3, wn, svid2prn(svid), nav[:nbyte].ljust(nbyte, b'\0'))
+
+
+def iter_sbf(file, blk, prn=None, nbyte=NBYTE_NAV, nchunk=NCHUNK):
+    """ read binary SBF raw navigation blocks as chunks of records
+
+    file  : binary SBF file
+    blk   : SBF block number (4242: BDSRawB2b, 4024: GALRawCNAV)
+    prn   : PRN number(s) of satellites to be read (None: all)
+    nbyte : bytes of navigation data field
+    nchunk: max number of records per chunk
+    generates records of sbf_dtype(nbyte) {n} (n <= nchunk) as
+    iter_sbf_text(), with only the blocks of CRC and CRCPassed valid.
+    other blocks are skipped by the block length without decoding (if the
+    next sync follows the block).
+    """
+    if prn is not None:
+        prn = {prn} if np.isscalar(prn) else set(prn)
+    nword = SBF_BLK[blk][1]
+    rec = []
+    if os.path.getsize(file) == 0:
+        return
+    with open(file, 'rb') as fp, \
+            mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        n, i = len(mm), 0
+        while True:
+            i = mm.find(b'$@', i)
+            if i < 0 or i + 8 > n:
+                break
+            crc, bid, length = struct.unpack_from('<HHH', mm, i + 2)
+            if length < 8 or length % 4 or i + length > n:  # not a block
+                i += 2
+                continue
+            if bid & 0x1fff != blk:  # skip if followed by sync or end of file
+                j = i + length
+                i = j if j == n or mm[j:j+2] == b'$@' else i + 2
+                continue
+            if length < 20 + nword * 4 or \
+                    crc_hqx(mm[i+4:i+length], 0) != crc:  # CRC-CCITT
+                i += 2
+                continue
+            r = decode_raw_nav(mm, i, nword, nbyte)
+            if r is not None and (prn is None or r[2] in prn):
+                rec.append(r)
+                if len(rec) >= nchunk:
+                    yield to_records(rec, nbyte)
+                    rec = []
+            i += length
+    if len(rec) > 0:
+        yield to_records(rec, nbyte)
+
+
+def iter_sbf_file(file, blk, prn=None, nbyte=NBYTE_NAV, nchunk=NCHUNK):
+    """ read raw navigation data of binary SBF or ASCII SBF export as chunks
+        of records (binary if the file starts with the SBF sync "$@", see
+        iter_sbf() and iter_sbf_text()) """
+    with open(file, 'rb') as fp:
+        binary = fp.read(2) == b'$@'
+    if binary:
+        yield from iter_sbf(file, blk, prn, nbyte, nchunk)
+    else:
+        yield from iter_sbf_text(file, prn, nbyte, nchunk)
+
+
+def read_sbf(file, blk, prn=None, nbyte=NBYTE_NAV, nchunk=NCHUNK):
+    """ read raw navigation data of binary SBF or ASCII SBF export
+        (see iter_sbf_file()) """
+    v = list(iter_sbf_file(file, blk, prn, nbyte, nchunk))
+    if len(v) == 0:
+        return np.zeros(0, dtype=sbf_dtype(nbyte))
+    return np.concatenate(v)
+
+
+class sbf_framer:
+    """ incremental reassembly of SBF raw navigation blocks from a stream
+
+    feed() takes bytes as received and returns records of sbf_dtype(nbyte)
+    of the completed blocks of valid CRC. an incomplete block is kept until
+    the next call (up to maxbuf bytes), or dropped as a false sync if a
+    complete block of valid CRC follows it.
+    """
+
+    def __init__(self, blk, prn=None, nbyte=NBYTE_NAV, maxbuf=65536):
+        if prn is not None:
+            prn = {prn} if np.isscalar(prn) else set(prn)
+        self.blk = blk
+        self.prn = prn
+        self.nword = SBF_BLK[blk][1]
+        self.nbyte = nbyte
+        self.maxbuf = maxbuf
+        self.buff = bytearray()
+        self.nblk = 0  # number of blocks decoded
+        self.nerr = 0  # number of CRC errors
+
+    def reset(self):
+        """ discard incomplete block (e.g. on reconnection) """
+        self.buff = bytearray()
+
+    def feed(self, data):
+        """ add received bytes, return records of completed blocks """
+        buff, rec, i = self.buff, [], 0
+        buff += data
+        n = len(buff)
+        while True:
+            i = buff.find(b'$@', i)
+            if i < 0:  # keep '$' of a split sync
+                i = n - 1 if n > 0 and buff[-1] == 0x24 else n
+                break
+            if i + 8 > n:
+                break
+            crc, bid, length = struct.unpack_from('<HHH', buff, i + 2)
+            blk = bid & 0x1fff == self.blk
+            if length < 8 or length % 4 or (blk and (length < 20 +
+                    self.nword * 4 or length > 84 + self.nword * 4)):
+                i += 2  # not a block
+                continue
+            if i + length > n:  # false sync if a valid block follows
+                if self.find_block(buff, i + 2, n) < 0:
+                    break
+                i += 2
+                continue
+            if crc_hqx(buff[i+4:i+length], 0) != crc:  # CRC-CCITT
+                self.nerr += blk
+                i += 2
+                continue
+            if blk:
+                r = decode_raw_nav(buff, i, self.nword, self.nbyte)
+                if r is not None and (self.prn is None or r[2] in self.prn):
+                    rec.append(r)
+                self.nblk += 1
+            i += length
+        del buff[:max(i, n - self.maxbuf)]
+        return to_records(rec, self.nbyte) if len(rec) > 0 else \
+            np.zeros(0, dtype=sbf_dtype(self.nbyte))
+
+    @staticmethod
+    def find_block(buff, i, n):
+        """ search a complete block of valid CRC in buff[i:n] (-1: none) """
+        while True:
+            i = buff.find(b'$@', i, n)
+            if i < 0 or i + 8 > n:
+                return -1
+            crc, bid, length = struct.unpack_from('<HHH', buff, i + 2)
+            if length >= 8 and length % 4 == 0 and i + length <= n and \
+                    crc_hqx(buff[i+4:i+length], 0) == crc:
+                return i
+            i += 2
@@ -24,8 +24,16 @@
 #  2023-01-07  1.1  support IRNV1_SF2 and IRNV1_SF3 in decode_LDPC()
 #  2023-01-09  1.2  support BCNV1_SF2, BCNV1_SF3, BCNV2, BCNV3 in decode_LDPC()
 #  2023-01-24  1.3  support NB-LDPC error correction
+#  2024-10-20  1.4  use vectorized NB-LDPC decoder for BCNV3 in decode_LDPC()
+#  2024-10-21  1.5  cache Tanner graphs for BCNV1_SF2, BCNV1_SF3 and BCNV2
+#  2024-10-22  1.6  add check_LDPC()
+#  2024-10-23  1.7  add decode_LDPC_batch()
+#  2024-10-24  1.8  reuse binary LDPC decoder context (b_ldpc_ctx_t)
+#  2024-10-25  1.9  add decode_LDPC_R() with decoding telemetry
+#  2024-10-26  1.10 parity check of binary LDPC batch by numpy (check_B_LDPC())
+#                   delete decode_B_LDPC()
 #
-import os, platform
+import os, platform, time
 from ctypes import *
 import numpy as np
 from B2b_HAS_decoder.sdr_nb_ldpc import *
@@ -34,22 +42,25 @@ from B2b_HAS_decoder.sdr_nb_ldpc import *
 env = platform.system() 
 dir_path = os.path.abspath(os.path.dirname(__file__))
 
+libldpc = None
 try:
     lib_path = os.path.join(dir_path, 'libldpc.so')
     if env == 'Windows':
         lib_path = os.path.join(dir_path, 'libldpc.so')  # Windows 下应使用 DLL
     elif env == 'Linux':
         lib_path = os.path.join(dir_path, 'libldpc.so_lx')
-    print('libldpc.so loaded successfully from:', lib_path)
+    libldpc = cdll.LoadLibrary(lib_path)
 except Exception as e:
+    # binary LDPC decoders are unavailable (NB-LDPC decoders work without it)
     print(f'Failed to load libldpc.so (OS: {env})')
     print(f'Error: {e}')
-    exit()
 
 # constants --------------------------------------------------------------------
 MAX_ITER = 250
 ERR_PROB = 1e-5
 RATIO = ((1.0 - ERR_PROB) / ERR_PROB, ERR_PROB / (1.0 - ERR_PROB))
+RATIO_ARR = np.array(RATIO, dtype='double')
+LIB_INIT = False    # prototypes and decoder of libldpc initialized
 
 # LDPC H-matrix cache ----------------------------------------------------------
 H_CNV2_SF2  = None
@@ -57,6 +68,18 @@ H_CNV2_SF3  = None
 H_IRNV1_SF2 = None
 H_IRNV1_SF3 = None
 
+# binary LDPC decoder context cache --------------------------------------------
+C_CNV2_SF2  = None
+C_CNV2_SF3  = None
+C_IRNV1_SF2 = None
+C_IRNV1_SF3 = None
+
+# NB-LDPC Tanner graph cache ---------------------------------------------------
+G_BCNV1_SF2 = None
+G_BCNV1_SF3 = None
+G_BCNV2     = None
+G_BCNV3     = None
+
 # CNAV-2 LDPC H-matrix table ([3]) ---------------------------------------------
 
 H_CNV2_SF2_A = ( # [3] Table 6.2-2
@@ -2179,112 +2202,277 @@ def decode_LDPC(type, syms):
         return decode_LDPC_IRNV1_SF3(syms)
     return [], -1
 
+# decode LDPC of multiple codewords (syms: {N, n}) ------------------------------
+def decode_LDPC_batch(type, syms, max_iter=None, es_tol=None):
+    res = decode_LDPC_R(type, syms, max_iter, es_tol)
+    return res.syms_dec, res.nerr
+
+# decode LDPC of multiple codewords with telemetry -----------------------------
+#
+#  args:
+#      type     (I) LDPC code type
+#      syms     (I) binary codes {N, n}
+#      max_iter (I) max number of iterations (None: default of decoder)
+#      es_tol   (I) early-stop threshold (None: ES_TOL, 0: disabled) (*1)
+#
+#  return:
+#      res          decoding results (ldpc_res_t)
+#
+#  notes:
+#      *1  only for NB-LDPC. iterations of binary LDPC are run in libldpc.
+#
+def decode_LDPC_R(type, syms, max_iter=None, es_tol=None):
+    G = gen_NB_LDPC_G(type)
+    if G:
+        if type in ('BCNV1_SF2', 'BCNV1_SF3'):
+            syms = np.asarray(syms) ^ 1
+        return decode_NB_LDPC_R(G, syms, max_iter, es_tol)
+    
+    ctx = gen_B_LDPC_ctx(type)
+    if ctx:
+        return decode_B_LDPC_R(ctx, syms, max_iter)
+    res = ldpc_res_t(len(syms), 0)
+    res.nerr[:] = -1
+    return res
+
+# parity check of LDPC codes (NB-LDPC only) -----------------------------------
+def check_LDPC(type, syms):
+    G = gen_NB_LDPC_G(type)
+    if not G or len(syms) != G.n * N_GF:
+        return False
+    if type in ('BCNV1_SF2', 'BCNV1_SF3'):
+        syms = syms ^ 1
+    return check_parity_G(G, bin2gf(syms))
+
 # decode LDPC(1200,600) of CNAV-2 subframe 2 -----------------------------------
 def decode_LDPC_CNV2_SF2(syms):
-    global H_CNV2_SF2
-    if not H_CNV2_SF2:
-        H_CNV2_SF2 = gen_B_LDPC_H(600, 1200, 1, H_CNV2_SF2_A, H_CNV2_SF2_B,
-            H_CNV2_SF2_C, H_CNV2_SF2_D, H_CNV2_SF2_E, H_CNV2_SF2_T)
-    
-    return decode_B_LDPC(H_CNV2_SF2, 600, 1200, syms)
+    return decode_B_LDPC_ctx(gen_B_LDPC_ctx('CNV2_SF2'), syms)
 
 # decode LDPC(548,274) of CNAV-2 subframe 3 ------------------------------------
 def decode_LDPC_CNV2_SF3(syms):
-    global H_CNV2_SF3
-    if not H_CNV2_SF3:
-        H_CNV2_SF3 = gen_B_LDPC_H(274, 548, 1, H_CNV2_SF3_A, H_CNV2_SF3_B,
-            H_CNV2_SF3_C, H_CNV2_SF3_D, H_CNV2_SF3_E, H_CNV2_SF3_T)
-    
-    return decode_B_LDPC(H_CNV2_SF3, 274, 548, syms)
+    return decode_B_LDPC_ctx(gen_B_LDPC_ctx('CNV2_SF3'), syms)
 
 # decode LDPC(200,100) of B-CNAV1 subframe 2 -----------------------------------
 def decode_LDPC_BCNV1_SF2(syms):
-    return decode_NB_LDPC(H_BCNV1_SF2_idx, H_BCNV1_SF2_ele, 100, 200, syms ^ 1)
+    return decode_NB_LDPC_G(gen_NB_LDPC_G('BCNV1_SF2'), syms ^ 1)
 
 # decode LDPC(88,44) of B-CNAV1 subframe 3 -------------------------------------
 def decode_LDPC_BCNV1_SF3(syms):
-    return decode_NB_LDPC(H_BCNV1_SF3_idx, H_BCNV1_SF3_ele, 44, 88, syms ^ 1)
+    return decode_NB_LDPC_G(gen_NB_LDPC_G('BCNV1_SF3'), syms ^ 1)
 
 # decode LDPC(96,48) of B-CNAV2 frame ------------------------------------------
 def decode_LDPC_BCNV2(syms):
-    return decode_NB_LDPC(H_BCNV2_idx, H_BCNV2_ele, 48, 96, syms)
+    return decode_NB_LDPC_G(gen_NB_LDPC_G('BCNV2'), syms)
 
 # decode LDPC(162,81) of B-CNAV3 frame -----------------------------------------
 def decode_LDPC_BCNV3(syms):
-    return decode_NB_LDPC(H_BCNV3_idx, H_BCNV3_ele, 81, 162, syms)
+    return decode_NB_LDPC_G(gen_NB_LDPC_G('BCNV3'), syms)
 
 # decode LDPC(1200,600) of NavIC L1-SPS subframe 2 -----------------------------
 def decode_LDPC_IRNV1_SF2(syms):
-    global H_IRNV1_SF2
-    if not H_IRNV1_SF2:
-        H_IRNV1_SF2 = gen_B_LDPC_H(600, 1200, 50, H_IRNV1_SF2_A, H_IRNV1_SF2_B,
-            H_IRNV1_SF2_C, H_IRNV1_SF2_D, H_IRNV1_SF2_E, H_IRNV1_SF2_T)
-    
-    return decode_B_LDPC(H_IRNV1_SF2, 600, 1200, syms)
+    return decode_B_LDPC_ctx(gen_B_LDPC_ctx('IRNV1_SF2'), syms)
 
 # decode LDPC(548,274) of NavIC L1-SPS subframe 3 ------------------------------
 def decode_LDPC_IRNV1_SF3(syms):
-    global H_IRNV1_SF3
-    if not H_IRNV1_SF3:
-        H_IRNV1_SF3 = gen_B_LDPC_H(274, 548, 23, H_IRNV1_SF3_A, H_IRNV1_SF3_B,
-            H_IRNV1_SF3_C, H_IRNV1_SF3_D, H_IRNV1_SF3_E, H_IRNV1_SF3_T)
+    return decode_B_LDPC_ctx(gen_B_LDPC_ctx('IRNV1_SF3'), syms)
+
+# generate NB-LDPC Tanner graph ------------------------------------------------
+def gen_NB_LDPC_G(type):
+    global G_BCNV1_SF2, G_BCNV1_SF3, G_BCNV2, G_BCNV3
+    if type == 'BCNV1_SF2':
+        if not G_BCNV1_SF2:
+            G_BCNV1_SF2 = nb_graph_t(H_BCNV1_SF2_idx, H_BCNV1_SF2_ele, 100, 200)
+        return G_BCNV1_SF2
+    elif type == 'BCNV1_SF3':
+        if not G_BCNV1_SF3:
+            G_BCNV1_SF3 = nb_graph_t(H_BCNV1_SF3_idx, H_BCNV1_SF3_ele, 44, 88)
+        return G_BCNV1_SF3
+    elif type == 'BCNV2':
+        if not G_BCNV2:
+            G_BCNV2 = nb_graph_t(H_BCNV2_idx, H_BCNV2_ele, 48, 96)
+        return G_BCNV2
+    elif type == 'BCNV3':
+        if not G_BCNV3:
+            G_BCNV3 = nb_graph_t(H_BCNV3_idx, H_BCNV3_ele, 81, 162)
+        return G_BCNV3
+    return None
+
+# initialize prototypes and decoder of libldpc ---------------------------------
+def init_libldpc():
+    global LIB_INIT
+    if LIB_INIT:
+        return
+    p_dbl, p_chr = POINTER(c_double), POINTER(c_int8)
+    libldpc.mod2sparse_allocate.argtypes = (c_int, c_int)
+    libldpc.mod2sparse_allocate.restype = c_void_p
+    libldpc.mod2sparse_insert.argtypes = (c_void_p, c_int, c_int)
+    libldpc.mod2sparse_insert.restype = c_void_p
+    libldpc.mod2sparse_free.argtypes = (c_void_p,)
+    libldpc.mod2sparse_free.restype = None
+    libldpc.prprp_decode.argtypes = (c_void_p, p_dbl, p_chr, p_chr, p_dbl)
+    libldpc.prprp_decode.restype = c_uint
+    libldpc.check.argtypes = (c_void_p, p_chr, p_chr)
+    libldpc.check.restype = c_int
+    libldpc.changed.argtypes = (p_dbl, p_chr, c_int)
+    libldpc.changed.restype = c_double
     
-    return decode_B_LDPC(H_IRNV1_SF3, 274, 548, syms)
+    # setup decoder
+    max_iter = c_int.in_dll(libldpc, "max_iter")
+    max_iter.value = MAX_ITER
+    libldpc.prprp_decode_setup()
+    LIB_INIT = True
 
-# generate binary LDPC parity check matrix -------------------------------------
-def gen_B_LDPC_H(m, n, g, H_A, H_B, H_C, H_D, H_E, H_T):
+# generate binary LDPC decoder context -----------------------------------------
+def gen_B_LDPC_ctx(type):
+    global H_CNV2_SF2, H_CNV2_SF3, H_IRNV1_SF2, H_IRNV1_SF3
+    global C_CNV2_SF2, C_CNV2_SF3, C_IRNV1_SF2, C_IRNV1_SF3
+    if type == 'CNV2_SF2':
+        if not C_CNV2_SF2:
+            idx = gen_B_LDPC_idx(600, 1200, 1, H_CNV2_SF2_A, H_CNV2_SF2_B,
+                H_CNV2_SF2_C, H_CNV2_SF2_D, H_CNV2_SF2_E, H_CNV2_SF2_T)
+            if not H_CNV2_SF2:
+                H_CNV2_SF2 = gen_B_LDPC_H(600, 1200, idx)
+            C_CNV2_SF2 = b_ldpc_ctx_t(H_CNV2_SF2, 600, 1200, idx)
+        return C_CNV2_SF2
+    elif type == 'CNV2_SF3':
+        if not C_CNV2_SF3:
+            idx = gen_B_LDPC_idx(274, 548, 1, H_CNV2_SF3_A, H_CNV2_SF3_B,
+                H_CNV2_SF3_C, H_CNV2_SF3_D, H_CNV2_SF3_E, H_CNV2_SF3_T)
+            if not H_CNV2_SF3:
+                H_CNV2_SF3 = gen_B_LDPC_H(274, 548, idx)
+            C_CNV2_SF3 = b_ldpc_ctx_t(H_CNV2_SF3, 274, 548, idx)
+        return C_CNV2_SF3
+    elif type == 'IRNV1_SF2':
+        if not C_IRNV1_SF2:
+            idx = gen_B_LDPC_idx(600, 1200, 50, H_IRNV1_SF2_A, H_IRNV1_SF2_B,
+                H_IRNV1_SF2_C, H_IRNV1_SF2_D, H_IRNV1_SF2_E, H_IRNV1_SF2_T)
+            if not H_IRNV1_SF2:
+                H_IRNV1_SF2 = gen_B_LDPC_H(600, 1200, idx)
+            C_IRNV1_SF2 = b_ldpc_ctx_t(H_IRNV1_SF2, 600, 1200, idx)
+        return C_IRNV1_SF2
+    elif type == 'IRNV1_SF3':
+        if not C_IRNV1_SF3:
+            idx = gen_B_LDPC_idx(274, 548, 23, H_IRNV1_SF3_A, H_IRNV1_SF3_B,
+                H_IRNV1_SF3_C, H_IRNV1_SF3_D, H_IRNV1_SF3_E, H_IRNV1_SF3_T)
+            if not H_IRNV1_SF3:
+                H_IRNV1_SF3 = gen_B_LDPC_H(274, 548, idx)
+            C_IRNV1_SF3 = b_ldpc_ctx_t(H_IRNV1_SF3, 274, 548, idx)
+        return C_IRNV1_SF3
+    return None
+
+# binary LDPC decoder context (preallocated buffers for libldpc) ---------------
+class b_ldpc_ctx_t:
+    def __init__(self, H, m, n, idx):
+        init_libldpc()
+        self.H = c_void_p(H)
+        self.m, self.n = m, n
+        self.rows, self.cols = idx  # H-matrix elements sorted by rows
+        self.rowp = np.flatnonzero(np.diff(self.rows, prepend=-1))
+        self.lratio = np.zeros(n, dtype='double')
+        self.dblk   = np.zeros(n, dtype='int8')
+        self.pchk   = np.zeros(n, dtype='int8')
+        self.bitpr  = np.zeros(n, dtype='double')
+        self.p1 = self.lratio.ctypes.data_as(POINTER(c_double))
+        self.p2 = self.dblk.ctypes.data_as(POINTER(c_int8))
+        self.p3 = self.pchk.ctypes.data_as(POINTER(c_int8))
+        self.p4 = self.bitpr.ctypes.data_as(POINTER(c_double))
+
+# decode binary LDPC by decoder context ----------------------------------------
+def decode_B_LDPC_ctx(ctx, syms):
+    if len(syms) != ctx.n:
+        print('decode_B_LDPC_ctx: size error (%d %d)' % (ctx.n, len(syms)))
+        return [], -1
     
-    libldpc.mod2sparse_allocate.restype = c_void_p
-    H = libldpc.mod2sparse_allocate(m, n)
-    p = c_void_p(H)
+    np.take(RATIO_ARR, syms, out=ctx.lratio)
     
-    for i in range(len(H_A)):
-        libldpc.mod2sparse_insert(p, H_A[i][0] - 1, H_A[i][1] - 1)
-    for i in range(len(H_B)):
-        libldpc.mod2sparse_insert(p, H_B[i][0] - 1, m + H_B[i][1] - 1)
-    for i in range(len(H_C)):
-        libldpc.mod2sparse_insert(p, m - g + H_C[i][0] - 1, H_C[i][1] - 1)
-    for i in range(len(H_D)):
-        libldpc.mod2sparse_insert(p, m - g + H_D[i][0] - 1, m + H_D[i][1] - 1)
-    for i in range(len(H_E)):
-        libldpc.mod2sparse_insert(p, m - g + H_E[i][0] - 1, m + g + H_E[i][1] - 1)
-    for i in range(len(H_T)):
-        libldpc.mod2sparse_insert(p, H_T[i][0] - 1, m + g + H_T[i][1] - 1)
+    # decode LDPC by probability propagation
+    libldpc.prprp_decode(ctx.H, ctx.p1, ctx.p2, ctx.p3, ctx.p4)
+    valid = libldpc.check(ctx.H, ctx.p2, ctx.p3) == 0
+    nerr = int(libldpc.changed(ctx.p1, ctx.p2, ctx.n))
     
-    return H
+    return ctx.dblk[:ctx.m].copy(), nerr if valid else -1
 
-# free binary LDPC parity check matrix -----------------------------------------
-def free_LDPC_H(H):
-    libldpc.mod2sparse_free(c_void_p(H))
+# decode binary LDPC of multiple codewords (syms: {N, n}) ----------------------
+def decode_B_LDPC_batch(ctx, syms, max_iter=None):
+    res = decode_B_LDPC_R(ctx, syms, max_iter)
+    return res.syms_dec, res.nerr
 
-# decode binary LDPC -----------------------------------------------------------
-def decode_B_LDPC(H, m, n, syms):
-    if len(syms) != n:
-        print('decode_LDPC_H: size error (%d %d)' % (n, len(syms)))
-        return [], -1
+# parity check of binary LDPC codewords (dblk: {N, n}) -------------------------
+#
+#  return:
+#      ok       parity check status {N} (same as check() of libldpc == 0)
+#      nerr     number of bits changed by decoding {N} (same as changed())
+#
+def check_B_LDPC(ctx, dblk, lratio):
+    pchk = np.add.reduceat(dblk[:, ctx.cols], ctx.rowp, axis=1) & 1
+    nerr = np.count_nonzero(dblk != (lratio > 1.0), axis=1)
+    return ~np.any(pchk, axis=1), nerr
+
+# decode binary LDPC of multiple codewords with telemetry ----------------------
+#
+#  notes:
+#      libldpc is called once per codeword (prprp_decode()). parity checks and
+#      numbers of changed bits are computed for all codewords at once by
+#      check_B_LDPC() instead of check() and changed() of libldpc.
+#
+def decode_B_LDPC_R(ctx, syms, max_iter=None):
+    syms = np.asarray(syms)
+    N = len(syms)
+    res = ldpc_res_t(N, ctx.m)
+    res.nerr[:] = -1
+    if syms.ndim != 2 or syms.shape[1] != ctx.n:
+        print('decode_B_LDPC_R: size error (%d %s)' % (ctx.n, syms.shape))
+        return res
     
-    lratio = np.zeros(n, dtype='double')
-    dblk   = np.zeros(n, dtype='int8')
-    pchk   = np.zeros(n, dtype='int8')
-    bitpr  = np.zeros(n, dtype='double')
-    p1 = lratio.ctypes.data_as(POINTER(c_double))
-    p2 = dblk.ctypes.data_as(POINTER(c_int8))
-    p3 = pchk.ctypes.data_as(POINTER(c_int8))
-    p4 = bitpr.ctypes.data_as(POINTER(c_double))
+    # max number of iterations of libldpc restored after decoding
+    lib_max_iter = c_int.in_dll(libldpc, "max_iter")
+    max_iter0 = lib_max_iter.value
+    lib_max_iter.value = MAX_ITER if max_iter is None else max_iter
+    lratio = RATIO_ARR[syms]
+    dblk = np.zeros((N, ctx.n), dtype='int8')
+    try:
+        decode = libldpc.prprp_decode
+        for i in range(N):
+            t0 = time.perf_counter()
+            ctx.lratio[:] = lratio[i]
+            res.niter[i] = decode(ctx.H, ctx.p1, ctx.p2, ctx.p3, ctx.p4)
+            dblk[i] = ctx.dblk
+            res.time[i] = time.perf_counter() - t0
+    finally:
+        lib_max_iter.value = max_iter0
     
-    for i in range(n):
-        lratio[i] = RATIO[syms[i]]
+    ok, nerr = check_B_LDPC(ctx, dblk, lratio)
+    res.syms_dec[:] = dblk[:, :ctx.m]
+    res.nerr[ok] = nerr[ok]
+    return res
+
+# generate element indices of binary LDPC parity check matrix ------------------
+#
+#  return:
+#      (rows, cols) row and column indices of elements (sorted by rows)
+#
+def gen_B_LDPC_idx(m, n, g, H_A, H_B, H_C, H_D, H_E, H_T):
+    idx = [(i - 1, j - 1) for i, j in H_A]
+    idx += [(i - 1, m + j - 1) for i, j in H_B]
+    idx += [(m - g + i - 1, j - 1) for i, j in H_C]
+    idx += [(m - g + i - 1, m + j - 1) for i, j in H_D]
+    idx += [(m - g + i - 1, m + g + j - 1) for i, j in H_E]
+    idx += [(i - 1, m + g + j - 1) for i, j in H_T]
+    idx = np.unique(np.array(idx, dtype='int32').reshape(-1, 2), axis=0)
+    return idx[:, 0], idx[:, 1]
+
+# generate binary LDPC parity check matrix -------------------------------------
+def gen_B_LDPC_H(m, n, idx):
     
-    # setup decoder
-    max_iter = c_int.in_dll(libldpc, "max_iter")
-    max_iter.value = MAX_ITER
-    libldpc.prprp_decode_setup()
+    init_libldpc()
+    H = libldpc.mod2sparse_allocate(m, n)
+    p = c_void_p(H)
     
-    # decode LDPC by probability propagation
-    niter = libldpc.prprp_decode(c_void_p(H), p1, p2, p3, p4)
-    valid = libldpc.check(c_void_p(H), p2, p3) == 0
-    libldpc.changed.restype = c_double
-    nerr = int(libldpc.changed(p1, p2, n))
+    for i, j in zip(*idx):
+        libldpc.mod2sparse_insert(p, int(i), int(j))
     
-    return dblk[:m], nerr if valid else -1
+    return H
 
+# free binary LDPC parity check matrix -----------------------------------------
+def free_LDPC_H(H):
+    libldpc.mod2sparse_free(c_void_p(H))
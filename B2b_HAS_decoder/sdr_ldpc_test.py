@@ -2,72 +2,184 @@
 #
 #  uinit test for sdr_ldpc.py
 #
-import sys, time
+import sys
 sys.path.append('../python')
+from functools import partial
 import numpy as np
 from B2b_HAS_decoder import sdr_ldpc
 from B2b_HAS_decoder import sdr_nb_ldpc
 import bitstruct as bs
 from binascii import unhexlify,hexlify
 
-# Convert the LDPC(162,91)
-def decode_LDPC(vi_row):
-    if isinstance(vi_row['nav'], np.ndarray):
-        buff=vi_row['nav'][0]
+NBATCH = 256        # number of frames per batch in decode_LDPC_batch()
+NCHUNK = 2048       # number of frames per task in decode_LDPC_parallel()
+
+# LDPC decoding statistics -----------------------------------------------------
+#
+#  stat     frames by decoding (fast: syndrome check only, iter: iterative
+#           decoding, fail: decoding failure)
+#  hist     decoding telemetry (niter: histogram of iterations, nerr: histogram
+#           of corrected bits (-1: failure), time/tmax: total/max wall time per
+#           frame (s))
+#
+class ldpc_stat_t:
+    def __init__(self):
+        self.stat = {'fast': 0, 'iter': 0, 'fail': 0}
+        self.hist = {'niter': {}, 'nerr': {}, 'time': 0.0, 'tmax': 0.0}
+    
+    # reset statistics
+    def reset(self):
+        self.__init__()
+    
+    # update statistics by decoding results
+    def update(self, nerr, niter, tdec):
+        self.stat['fast'] += int(np.count_nonzero(nerr == 0))
+        self.stat['iter'] += int(np.count_nonzero(nerr > 0))
+        self.stat['fail'] += int(np.count_nonzero(nerr < 0))
+        for key, val in (('niter', niter), ('nerr', nerr)):
+            h = self.hist[key]
+            v, n = np.unique(val, return_counts=True)
+            for i in range(len(v)):
+                h[int(v[i])] = h.get(int(v[i]), 0) + int(n[i])
+        if len(tdec) > 0:
+            self.hist['time'] += float(np.sum(tdec))
+            self.hist['tmax'] = max(self.hist['tmax'], float(np.max(tdec)))
+    
+    # summary of statistics for log
+    def summary(self):
+        nfrm = sum(self.hist['niter'].values())
+        hist = lambda h: ' '.join('%d:%d' % (k, h[k]) for k in sorted(h))
+        return ['LDPC frames: syndrome-only={:d} iterative={:d} failed={:d}'
+            .format(self.stat['fast'], self.stat['iter'], self.stat['fail']),
+            'LDPC iterations (iter:frames): ' + hist(self.hist['niter']),
+            'LDPC corrected bits (bits:frames): ' + hist(self.hist['nerr']),
+            'LDPC decoding time: total={:.3f}s mean={:.1f}us max={:.1f}us'
+            .format(self.hist['time'], self.hist['time'] / max(nfrm, 1) * 1e6,
+            self.hist['tmax'] * 1e6)]
+
+# Convert the LDPC(162,91) (stat: LDPC decoding statistics, None: not updated)
+def decode_LDPC(vi_row, stat=None):
+    if isinstance(vi_row['nav'], np.ndarray) and vi_row['nav'].dtype == 'uint8':
+        SF = np.unpackbits(vi_row['nav'].ravel()[:123])  # bytes by sbf.py
     else:
-        buff=vi_row['nav']
-    buff=buff.decode('utf-8')
-    buff =  buff[:-2]
-    # buff = [item.decode('utf-8') for item in buff]
-    # buff =  buff[0][:-2]
-    length=len(buff)
-    # buff = buff.decode('utf-8')
-    SF = read_hex(buff)
+        if isinstance(vi_row['nav'], np.ndarray):
+            buff=vi_row['nav'][0]
+        else:
+            buff=vi_row['nav']
+        SF = read_hex(buff[:-2])
     SF=SF[12:]
-    ok, ng = 0, 0
-    t = time.time()
 
-    err_data = SF.copy()
+    # return systematic bits of valid codeword without iterations, or decode
+    # by iterations with the syndrome of the check
+    G = sdr_ldpc.gen_NB_LDPC_G('BCNV3')
+    syn = sdr_nb_ldpc.syndrome_G(G, sdr_nb_ldpc.bin2gf(SF[None]))
+    if not np.any(syn):
+        res = sdr_nb_ldpc.ldpc_res_t(1, 486)
+        dec_data = SF[:486]
+    else:
+        res = sdr_nb_ldpc.decode_NB_LDPC_R(G, SF[None], syn=syn)
+        dec_data = res.syms_dec[0]
+    if stat is not None:
+        stat.update(res.nerr, res.niter, res.time)
+
+    # whole HEX digits of message (484 bits) packed to bytes
+    return pack_bits(dec_data[:484]).tobytes()
 
-    dec_data, nerr = sdr_ldpc.decode_LDPC('BCNV3', err_data)
+# Convert the LDPC(162,91) of multiple frames
+#
+#  args:
+#      rows     (I) records of BDSRawB2b frames with 'nav' field
+#      nbatch   (I) number of frames decoded at once
+#      max_iter (I) max number of LDPC iterations (None: default)
+#      es_tol   (I) early-stop threshold of LDPC decoder (None: default)
+#      stat     (IO) LDPC decoding statistics (ldpc_stat_t, None: not updated)
+#
+#  return:
+#      msgs         decoded messages as uint8 ndarray {N, 61} (bytes of row i
+#                   are the same as decode_LDPC(rows[i]))
+#      nerr         number of corrected bits (-1: decoding error) {N}
+#
+def decode_LDPC_batch(rows, nbatch=NBATCH, max_iter=None, es_tol=None,
+                      stat=None):
+    msgs, nerr, niter, tdec = decode_LDPC_frames(rows, nbatch, max_iter, es_tol)
+    if stat is not None:
+        stat.update(nerr, niter, tdec)
+    return msgs, nerr
+
+# Convert the LDPC(162,91) of multiple frames with telemetry (no statistics)
+def decode_LDPC_frames(rows, nbatch=NBATCH, max_iter=None, es_tol=None):
+    navs = rows['nav']
+    if navs.dtype != 'uint8':
+        navs = np.ravel(navs)
+    msgs = np.zeros((len(navs), 61), dtype='uint8')
+    nerr = np.zeros(len(navs), dtype='int32')
+    niter = np.zeros(len(navs), dtype='int32')
+    tdec = np.zeros(len(navs), dtype='float64')
+
+    for i in range(0, len(navs), nbatch):
+        # 12 bits header + 972 bits LDPC(162,81) codeword
+        if navs.dtype == 'uint8':  # bytes {N, nbyte} by sbf.py
+            SF = np.unpackbits(navs[i:i+nbatch, :123], axis=1)[:, 12:]
+        else:
+            buff = b''.join(nav[:246].ljust(246, b'0') for nav in navs[i:i+nbatch])
+            SF = np.unpackbits(np.frombuffer(unhexlify(buff), dtype='uint8'))
+            SF = SF.reshape(-1, 984)[:, 12:]
+
+        res = sdr_ldpc.decode_LDPC_R('BCNV3', SF, max_iter, es_tol)
+        msgs[i:i+nbatch] = np.packbits(res.syms_dec[:, :484], axis=1)
+        nerr[i:i+nbatch] = res.nerr
+        niter[i:i+nbatch] = res.niter
+        tdec[i:i+nbatch] = res.time
+
+    return msgs, nerr, niter, tdec
+
+# Convert the LDPC(162,91) of multiple frames by process pool
+#
+#  args:
+#      rows     (I) records of BDSRawB2b frames with 'nav' field
+#      executor (I) process pool (e.g. ProcessPoolExecutor) reused over calls
+#      nchunk   (I) number of frames per task
+#      max_iter (I) max number of LDPC iterations (None: default)
+#      es_tol   (I) early-stop threshold of LDPC decoder (None: default)
+#      stat     (IO) LDPC decoding statistics (ldpc_stat_t, None: not updated)
+#
+#  return:
+#      msgs, nerr   same as decode_LDPC_batch() in the order of rows
+#
+def decode_LDPC_parallel(rows, executor, nchunk=NCHUNK, max_iter=None,
+                         es_tol=None, stat=None):
+    chunks = [rows[i:i+nchunk] for i in range(0, len(rows), nchunk)]
+    if len(chunks) == 0:
+        return decode_LDPC_batch(rows, max_iter=max_iter, es_tol=es_tol,
+            stat=stat)
+
+    res = list(executor.map(partial(decode_LDPC_frames, max_iter=max_iter,
+        es_tol=es_tol), chunks))
+    msgs = np.vstack([r[0] for r in res])
+    nerr = np.hstack([r[1] for r in res])
+
+    if stat is not None:
+        stat.update(nerr, np.hstack([r[2] for r in res]),
+            np.hstack([r[3] for r in res]))
+    return msgs, nerr
 
-    if np.all(SF[:486] == dec_data):
-        #print('test_08 (%3d) OK: nerr=%3d' % (n, nerr))
-        ok += 1
-    else:
-        #print('test_08 (%3d) NG: nerr=%3d' % (n, nerr))
-        ng += 1
-    hex_txt=hex_str(dec_data)
-    if len(hex_txt) % 2 == 1:
-        hex_txt += '0'
-    # hex_txt1=hexlify(dec_data).decode('utf-8')
-    buff = unhexlify(hex_txt)
-    return buff
 # pack bits to uint8 ndarray ---------------------------------------------------
 def pack_bits(data, nz=0):
+    data = np.asarray(data, dtype='uint8')
     if nz > 0:
-        data = np.hstack([[0] * nz, data])
-    N = len(data)
-    buff = np.zeros((N + 7) // 8, dtype='uint8')
-    for i in range(N):
-        buff[i // 8] |= (data[i] << (7 - i % 8))
-    return buff
+        data = np.hstack([np.zeros(nz, dtype='uint8'), data])
+    return np.packbits(data)
 
 # read HEX strings -------------------------------------------------------------
 def read_hex(str0):
+    if isinstance(str0, str):
+        str0 = str0.encode()
     N = len(str0) * 4
-    data = np.zeros(N, dtype='uint8')
-    for i in range(N):
-        data[i] = (int(str0[i // 4], 16) >> (3 - i % 4)) & 1
-    return data
+    if len(str0) % 2:
+        str0 += b'0'
+    return np.unpackbits(np.frombuffer(unhexlify(str0), dtype='uint8'))[:N]
 
 # data to HEX strings ----------------------------------------------------------
 def hex_str(data):
-    str = ''
-    hex = 0
-    for i in range(len(data)):
-        hex = (hex << 1) + data[i]
-        if i % 4 == 3:
-            str += '%1X' % (hex)
-            hex = 0
-    return str
+    N = len(data) // 4
+    return hexlify(pack_bits(data[:N*4]).tobytes()).decode().upper()[:N]
@@ -12,7 +12,12 @@
 #
 #  History:
 #  2024-01-25  1.0  new
+#  2024-10-20  1.1  add vectorized EMS decoder with cached Tanner graph
+#  2024-10-21  1.2  build GF(q) and LLR tables once at import
+#  2024-10-23  1.3  support multiple codewords in decode_NB_LDPC_G()
+#  2024-10-25  1.4  add early termination and decoding telemetry (ldpc_res_t)
 #
+import time
 from math import *
 import numpy as np
 
@@ -22,6 +27,8 @@ Q_GF = 1<<N_GF      # number of GF(q) elements
 MAX_ITER = 15       # max number of iterations
 NM_EMS = 4          # LLR truncation size of EMS
 ERR_PROB = 1e-5     # error probability of input codes
+ES_TOL = 0.0        # early-stop threshold of convergence rate (0: disabled)
+ES_NSTALL = 3       # number of stalled iterations to stop decoding
 
 # GF(q) tables -----------------------------------------------------------------
 GF_VEC = ( # power -> vector ([1])
@@ -38,33 +45,32 @@ GF_POW = ( # vector -> power ([1])
 
 GF_MUL = [] # multiply
 
+GF_NERR = np.array([bin(i).count('1') for i in range(Q_GF)], dtype='uint8')
+
 # initialize GF(q) table -------------------------------------------------------
 def init_table():
     global GF_MUL
     if len(GF_MUL):
         return
-    GF_MUL = np.zeros((Q_GF, Q_GF), dtype='uint8')
-    for i in range(1, Q_GF):
-        for j in range(1, Q_GF):
-            GF_MUL[i][j] = GF_VEC[(GF_POW[i] + GF_POW[j]) % (Q_GF - 1)]
+    gf_pow = np.array(GF_POW)
+    GF_MUL = np.array(GF_VEC, dtype='uint8')[(gf_pow[:,None] + gf_pow) %
+        (Q_GF - 1)]
+    GF_MUL[0,:] = GF_MUL[:,0] = 0
 
 # convert binary codes to GF(q) codes ------------------------------------------
 def bin2gf(syms):
-    n = len(syms) // N_GF
-    code = np.zeros(n, dtype='uint8')
-    for i in range(n):
-        for j in range(N_GF):
-            code[i] = (code[i] << 1) + syms[i*N_GF+j]
-    return code
+    syms = np.asarray(syms, dtype='uint8')
+    n = syms.shape[-1] // N_GF
+    code = syms[..., :n*N_GF].reshape(syms.shape[:-1] + (n, N_GF))
+    return (code << np.arange(N_GF - 1, -1, -1, dtype='uint8')).sum(axis=-1,
+        dtype='uint8')
 
 # convert GF(q) codes to binary codes ------------------------------------------
 def gf2bin(code):
-    n = len(code)
-    syms = np.zeros(n * N_GF, dtype='uint8')
-    for i in range(n):
-        for j in range(N_GF):
-            syms[i*N_GF+j] = (code[i] >> (N_GF - 1 - j)) & 1
-    return syms
+    code = np.asarray(code, dtype='uint8')
+    shift = np.arange(N_GF - 1, -1, -1, dtype='uint8')
+    return ((code[..., None] >> shift) & 1).reshape(code.shape[:-1] +
+        (code.shape[-1] * N_GF,))
 
 # Tanner graph edges -----------------------------------------------------------
 def graph_edge(H_idx, H_ele):
@@ -76,14 +82,14 @@ def graph_edge(H_idx, H_ele):
             he.append(H_ele[i][j])
     return ie, je, he, len(he) # CN-index, VN-index, H_ij of edges
 
+# LLR table of GF(q) codes (L[code][j]) ----------------------------------------
+def LLR_table(err_prob):
+    nerr = GF_NERR[np.arange(Q_GF)[:,None] ^ np.arange(Q_GF)]
+    return (-log(err_prob) * nerr).astype('float32')
+
 # initialize LLR ---------------------------------------------------------------
 def init_LLR(code, err_prob):
-    L = np.zeros((len(code), Q_GF), dtype='float32')
-    for i in range(len(code)):
-        for j in range(Q_GF):
-            nerr = bin(code[i] ^ j).count('1')
-            L[i][j] = -log(err_prob) * nerr
-    return L
+    return LLR_table(err_prob)[code]
 
 # parity check -----------------------------------------------------------------
 def check_parity(ie, je, he, m, code):
@@ -124,9 +130,6 @@ def ext_min_sum(L1, L2):
 # decode NB-LDPC ---------------------------------------------------------------
 def decode_NB_LDPC(H_idx, H_ele, m, n, syms):
     
-    # initialze GF(q) tables
-    init_table()
-    
     # convert binary codes to GF(q) codes
     code = bin2gf(syms)
     
@@ -175,3 +178,208 @@ def decode_NB_LDPC(H_idx, H_ele, m, n, syms):
     
     return gf2bin(code)[:m*N_GF], -1
 
+# Tanner graph adjacency of NB-LDPC code ---------------------------------------
+class nb_graph_t:
+    def __init__(self, H_idx, H_ele, m, n):
+        ie, je, he, ne = graph_edge(H_idx, H_ele)
+        self.m, self.n, self.ne = m, n, ne
+        self.ie = np.array(ie, dtype='int32')  # CN-index of edges
+        self.je = np.array(je, dtype='int32')  # VN-index of edges
+        self.he = np.array(he, dtype='uint8')  # H_ij of edges
+        
+        # first edge of each CN (edges are ordered by CN)
+        self.cn_ofs = np.searchsorted(self.ie, np.arange(m)).astype('int32')
+        self.cn_edge = [np.arange(self.cn_ofs[i], self.cn_ofs[i] + len(H_idx[i]),
+            dtype='int32') for i in range(m)]
+        
+        # other edges of same CN, grouped by CN degree (ascending edge order)
+        self.cn_grp = []
+        deg = np.bincount(self.ie, minlength=m)
+        for d in np.unique(deg):
+            edges = np.nonzero(deg[self.ie] == d)[0]
+            oth = np.array([[j for j in range(self.cn_ofs[self.ie[i]],
+                self.cn_ofs[self.ie[i]] + d) if j != i] for i in edges],
+                dtype='int32').reshape(len(edges), d - 1)
+            self.cn_grp.append((edges, oth))
+        
+        # edges of each VN and other edges of same VN (padded with index ne)
+        vn_edge = [[] for i in range(n)]
+        for i in range(ne):
+            vn_edge[je[i]].append(i)
+        nd = max(len(e) for e in vn_edge)
+        self.vn_edge = np.full((n, nd), ne, dtype='int32')
+        self.vn_oth = np.full((ne, max(nd - 1, 1)), ne, dtype='int32')
+        for i in range(n):
+            self.vn_edge[i, :len(vn_edge[i])] = vn_edge[i]
+            for j in vn_edge[i]:
+                oth = [k for k in vn_edge[i] if k != j]
+                self.vn_oth[j, :len(oth)] = oth
+        
+        # permutation indices of VN->CN and CN->VN messages
+        self.perm_C2V = GF_MUL[self.he].astype('intp')
+        self.perm_V2C = np.argsort(self.perm_C2V, axis=1)
+        
+        # LLR table of GF(q) codes
+        self.LLR = LLR_table(ERR_PROB)
+
+# syndrome by Tanner graph -----------------------------------------------------
+def syndrome_G(G, code):
+    return np.bitwise_xor.reduceat(GF_MUL[G.he, code[..., G.je]], G.cn_ofs,
+        axis=-1)
+
+# parity check by Tanner graph -------------------------------------------------
+def check_parity_G(G, code):
+    return not np.any(syndrome_G(G, code))
+
+# extended-min-sum (EMS) of LLRs for multiple edges ([2]) ----------------------
+def ext_min_sum_vec(L1, L2):
+    shape = L1.shape
+    L1 = L1.reshape(-1, Q_GF)
+    L2 = L2.reshape(-1, Q_GF)
+    r = np.arange(len(L1))
+    idx1 = np.argsort(L1, axis=1)[:, :NM_EMS]
+    idx2 = np.argsort(L2, axis=1)[:, :NM_EMS]
+    L1s = np.take_along_axis(L1, idx1, axis=1)
+    L2s = np.take_along_axis(L2, idx2, axis=1)
+    maxL = L1s[:, NM_EMS-1] + L2s[:, NM_EMS-1]
+    Ls = np.repeat(maxL[:, None], Q_GF, axis=1)
+    
+    for i in range(NM_EMS):
+        for j in range(NM_EMS):
+            k = idx1[:, i] ^ idx2[:, j]
+            Ls[r, k] = np.minimum(Ls[r, k], L1s[:, i] + L2s[:, j])
+    return Ls.reshape(shape)
+
+# LDPC decoding results and telemetry of multiple codewords -------------------
+class ldpc_res_t:
+    def __init__(self, N, k):
+        self.syms_dec = np.zeros((N, k), dtype='uint8') # decoded systematic bits
+        self.nerr = np.zeros(N, dtype='int32')  # corrected bits (-1: error)
+        self.niter = np.zeros(N, dtype='int32') # number of iterations
+        self.time = np.zeros(N, dtype='float64') # wall time (s) (*1)
+    
+    def __len__(self):
+        return len(self.nerr)
+#  *1 time of iterations shared by decoding codewords is divided equally
+
+# decode NB-LDPC by Tanner graph with telemetry --------------------------------
+#
+#  args:
+#      G        (I) Tanner graph (nb_graph_t)
+#      syms     (I) binary codes {N, n*N_GF}
+#      max_iter (I) max number of iterations (None: MAX_ITER)
+#      es_tol   (I) early-stop threshold (None: ES_TOL, 0: disabled) (*1)
+#      syn      (I) syndromes of codes by syndrome_G() (None: computed)
+#
+#  return:
+#      res          decoding results (ldpc_res_t)
+#
+#  notes:
+#      *1  convergence of LLRs is measured by the number of unsatisfied parity
+#          checks of the hard decision. decoding of a codeword is terminated
+#          as error if the number is not reduced by the ratio es_tol from the
+#          minimum so far in ES_NSTALL consecutive iterations.
+#
+def decode_NB_LDPC_R(G, syms, max_iter=None, es_tol=None, syn=None):
+    t0 = time.perf_counter()
+    max_iter = MAX_ITER if max_iter is None else max_iter
+    es_tol = ES_TOL if es_tol is None else es_tol
+    syms = np.asarray(syms, dtype='uint8')
+    res = ldpc_res_t(len(syms), G.m*N_GF)
+    
+    # convert binary codes to GF(q) codes
+    code = bin2gf(syms)
+    res.syms_dec[:] = syms[:, :G.m*N_GF]
+    
+    # skip iterations for valid codes
+    if syn is None:
+        syn = syndrome_G(G, code)
+    idx = np.nonzero(np.any(syn, axis=1))[0]
+    code = code[idx]
+    
+    # initialize LLR and VN->CN messages (C2V[:,ne]: zero-padding for VN)
+    L = G.LLR[code]
+    V2C = np.take_along_axis(L[:, G.je], G.perm_V2C[None], axis=2)
+    C2V = np.zeros((len(idx), G.ne + 1, Q_GF), dtype='float32')
+    nchk = np.count_nonzero(syn[idx], axis=1)
+    nstall = np.zeros(len(idx), dtype='int32')
+    t1 = time.perf_counter()
+    res.time[:] = (t1 - t0) / max(len(syms), 1)
+    
+    for iter in range(max_iter):
+        # parity check and remove decoded or stalled codes
+        nc = nchk if iter == 0 else np.count_nonzero(syndrome_G(G, code),
+                                                      axis=1)
+        ok = nc == 0
+        if es_tol > 0 and iter > 0:
+            conv = nc < nchk * (1.0 - es_tol)
+            nchk = np.where(conv, nc, nchk)
+            nstall = np.where(conv, 0, nstall + 1)
+        stop = ok | (nstall >= ES_NSTALL)
+        if np.any(stop):
+            dec = gf2bin(code[ok])
+            res.syms_dec[idx[ok]] = dec[:, :G.m*N_GF]
+            res.nerr[idx[ok]] = np.count_nonzero(dec ^ syms[idx[ok]], axis=1)
+            res.syms_dec[idx[stop & ~ok]] = gf2bin(code[stop & ~ok])[:, :G.m*N_GF]
+            res.nerr[idx[stop & ~ok]] = -1
+            res.niter[idx[stop]] = iter
+            idx, code, L, V2C, C2V = idx[~stop], code[~stop], L[~stop], \
+                V2C[~stop], C2V[~stop]
+            nchk, nstall = nchk[~stop], nstall[~stop]
+        if len(idx) == 0:
+            break
+        
+        # update check nodes
+        for edges, oth in G.cn_grp:
+            Ls = V2C[:, oth[:, 0]]
+            for k in range(1, oth.shape[1]):
+                Ls = ext_min_sum_vec(Ls, V2C[:, oth[:, k]])
+            Ls -= np.min(Ls, axis=2, keepdims=True)
+            C2V[:, edges] = np.take_along_axis(Ls, G.perm_C2V[edges][None],
+                axis=2)
+        
+        # update variable nodes
+        Ls = L[:, G.je]
+        for k in range(G.vn_oth.shape[1]):
+            Ls += C2V[:, G.vn_oth[:, k]]
+        Ls -= np.min(Ls, axis=2, keepdims=True)
+        V2C = np.take_along_axis(Ls, G.perm_V2C[None], axis=2)
+        
+        # update LLR and GF(q) codes
+        for k in range(G.vn_edge.shape[1]):
+            L += C2V[:, G.vn_edge[:, k]]
+        L -= np.min(L, axis=2, keepdims=True)
+        code = np.argmin(L, axis=2).astype('uint8')
+        
+        t2 = time.perf_counter()
+        res.time[idx] += (t2 - t1) / len(idx)
+        t1 = t2
+    
+    res.syms_dec[idx] = gf2bin(code)[:, :G.m*N_GF]
+    res.nerr[idx] = -1
+    res.niter[idx] = max_iter
+    return res
+
+# decode NB-LDPC by Tanner graph (vectorized version of decode_NB_LDPC()) ------
+#
+#  args:
+#      G        (I) Tanner graph (nb_graph_t)
+#      syms     (I) binary codes ({n*N_GF} or {N, n*N_GF} for N codewords)
+#      max_iter (I) max number of iterations (None: MAX_ITER)
+#      es_tol   (I) early-stop threshold (None: ES_TOL, 0: disabled)
+#
+#  return:
+#      syms_dec     decoded systematic bits ({m*N_GF} or {N, m*N_GF})
+#      nerr         number of corrected bits (-1: decoding error)
+#
+def decode_NB_LDPC_G(G, syms, max_iter=None, es_tol=None):
+    syms = np.asarray(syms, dtype='uint8')
+    if syms.ndim == 1:
+        syms_dec, nerr = decode_NB_LDPC_G(G, syms[None], max_iter, es_tol)
+        return syms_dec[0], int(nerr[0])
+    
+    res = decode_NB_LDPC_R(G, syms, max_iter, es_tol)
+    return res.syms_dec, res.nerr
+
+# initialize GF(q) tables
+init_table()
@@ -0,0 +1,226 @@
+"""
+module for real-time SSR product server
+
+Orbit/clock corrections of each epoch generated by encode_SP3() of the
+CSSR decoders are broadcast to TCP subscribers as they are generated:
+
+  BNC text : same as the .ssr file ('> CLOCK', '> ORBIT' blocks)
+  RTCM3    : combined orbit and clock, and code bias messages (see
+             rtcm3_ssr.py)
+  binary   : compact message of an epoch (little endian)
+
+      sync 'SS' (2), version (1), source (1: 0=B2B,1=HAS), week (2),
+      tow (8, f8, GPST), nsat (2), nsat x [sat (1), iode (2),
+      dclk (4, f4, m), dorb (3x4, f4, radial/along/cross m)], CRC32 (4)
+
+The server runs an asyncio event loop in a background thread. publish()
+only passes the epoch to the loop, so that the decoder never waits for the
+subscribers. Each subscriber has a bounded queue of epochs, and a
+subscriber is dropped when its queue is full (slow consumer).
+"""
+
+import asyncio
+import struct
+import threading
+import zlib
+import numpy as np
+from B2b_HAS_decoder.gnss import sat2id, time2epoch, time2gpst, gpst2time
+from B2b_HAS_decoder.rtcm3_ssr import encode_ssr_epoch
+
+QSIZE = 16  # max number of epochs queued per subscriber
+BIN_SYNC = b'SS'
+BIN_VER = 1
+BIN_HDR = '<2sBBHdH'
+BIN_SAT = '<BHffff'
+BIN_SRC = {'B2B': 0, 'HAS': 1}
+
+
+def encode_bnc(t, src, corr):
+    """ encode corrections of an epoch in BNC text (as .ssr file)
+
+    t   : epoch time (gtime_t)
+    src : source of corrections ('B2B' or 'HAS')
+    corr: {sat: (iode, dclk, dorb)} (dorb: radial, along, cross)
+    """
+    e = time2epoch(t)
+    str_time = "{:04d} {:02d} {:02d} {:02d} {:02d} {:02d}".format(
+        e[0], e[1], e[2], e[3], e[4], int(e[5]))
+    s = ['> CLOCK {} {}  {:4d} {} \n'.format(str_time, 0, len(corr), src)]
+    for sat, (iode, dclk, dorb) in corr.items():
+        s += ['{}  {:6d} {:11.4f} {:11.4f} {:11.4f} \n'.format(
+            sat2id(sat), iode, dclk, 0.0, 0.0)]
+    s += ['> ORBIT {} {}  {:4d} {} \n'.format(str_time, 0, len(corr), src)]
+    for sat, (iode, dclk, dorb) in corr.items():
+        s += ['{}  {:4d} {:11.4f} {:11.4f} {:11.4f} {:11.4f} {:11.4f} {:11.4f}\n'
+              .format(sat2id(sat), iode, dorb[0], dorb[1], dorb[2], 0.0, 0.0,
+                      0.0)]
+    return ''.join(s).encode()
+
+
+def encode_bin(t, src, corr):
+    """ encode corrections of an epoch in binary (see encode_bnc()) """
+    week, tow = time2gpst(t)
+    buff = struct.pack(BIN_HDR, BIN_SYNC, BIN_VER, BIN_SRC[src], week, tow,
+                       len(corr))
+    buff += b''.join(struct.pack(BIN_SAT, sat, iode, dclk, *dorb)
+                     for sat, (iode, dclk, dorb) in corr.items())
+    return buff + struct.pack('<I', zlib.crc32(buff))
+
+
+def decode_bin(buff, i=0):
+    """ decode binary message at buff[i:]
+
+    returns (t, src, corr, length) or None if the message is not complete
+    or has invalid CRC32
+    """
+    nh, ns = struct.calcsize(BIN_HDR), struct.calcsize(BIN_SAT)
+    if len(buff) < i + nh:
+        return None
+    sync, ver, src, week, tow, nsat = struct.unpack_from(BIN_HDR, buff, i)
+    n = nh + ns * nsat
+    if sync != BIN_SYNC or len(buff) < i + n + 4 or \
+            zlib.crc32(buff[i:i+n]) != struct.unpack_from('<I', buff, i+n)[0]:
+        return None
+    corr = {}
+    for k in range(nsat):
+        sat, iode, dclk, *dorb = struct.unpack_from(BIN_SAT, buff, i+nh+k*ns)
+        corr[sat] = (iode, dclk, np.array(dorb))
+    src = {v: k for k, v in BIN_SRC.items()}[src]
+    return gpst2time(week, tow), src, corr, n + 4
+
+
+class ssr_server:
+    """ TCP server of SSR products
+
+    host     : address to listen
+    port_bnc : port of BNC text subscribers (None: not served)
+    port_bin : port of binary subscribers (None: not served)
+    port_rtcm: port of RTCM3 subscribers (None: not served)
+    qsize    : max number of epochs queued per subscriber
+    """
+
+    def __init__(self, host='0.0.0.0', port_bnc=None, port_bin=None,
+                 port_rtcm=None, qsize=QSIZE):
+        self.host = host
+        self.ports = {'bnc': port_bnc, 'bin': port_bin, 'rtcm': port_rtcm}
+        self.qsize = qsize
+        self.loop = None
+        self.thread = None
+        self.servers = []
+        self.subs = {}  # subscriber writer -> (format, queue)
+        self.tasks = set()  # tasks of subscribers
+        self.npub = 0   # number of epochs published
+        self.nsub = 0   # number of subscribers connected
+        self.ndrop = 0  # number of subscribers dropped (slow consumer)
+
+    def start(self):
+        """ start the server in a background thread """
+        self.loop = asyncio.new_event_loop()
+        ready = threading.Event()
+
+        def run():
+            asyncio.set_event_loop(self.loop)
+            self.loop.run_until_complete(self.listen())
+            ready.set()
+            self.loop.run_forever()
+
+        self.thread = threading.Thread(target=run, daemon=True)
+        self.thread.start()
+        ready.wait()
+        return self
+
+    async def listen(self):
+        """ open listening sockets """
+        for fmt, port in self.ports.items():
+            if port is None:
+                continue
+            srv = await asyncio.start_server(
+                lambda r, w, fmt=fmt: self.serve(fmt, r, w), self.host, port)
+            self.servers.append(srv)
+            if port == 0:  # ephemeral port
+                self.ports[fmt] = srv.sockets[0].getsockname()[1]
+
+    def stop(self):
+        """ stop the server and disconnect all subscribers """
+        if self.loop is None:
+            return
+
+        async def close():
+            for srv in self.servers:
+                srv.close()
+            for w in list(self.subs):
+                self.drop(w)
+            for task in self.tasks:
+                task.cancel()
+            await asyncio.gather(*self.tasks, return_exceptions=True)
+
+        asyncio.run_coroutine_threadsafe(close(), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.loop.close()
+        self.loop = None
+
+    def publish(self, t, src, corr, cbias=None):
+        """ broadcast corrections of an epoch (thread-safe, non-blocking)
+
+        t    : epoch time (gtime_t)
+        src  : source of corrections ('B2B' or 'HAS')
+        corr : {sat: (iode, dclk, dorb)}
+        cbias: {sat: {rsig: cb}} (RTCM3 only, None: no code bias)
+        """
+        if self.loop is None or len(corr) == 0:
+            return
+        msg = {}
+        if self.ports['bnc'] is not None:
+            msg['bnc'] = encode_bnc(t, src, corr)
+        if self.ports['bin'] is not None:
+            msg['bin'] = encode_bin(t, src, corr)
+        if self.ports['rtcm'] is not None:
+            msg['rtcm'] = b''.join(encode_ssr_epoch(t, corr, cbias))
+        self.npub += 1
+        self.loop.call_soon_threadsafe(self.dispatch, msg)
+
+    def dispatch(self, msg):
+        """ put message to the queues of subscribers (in the loop) """
+        for w, (fmt, q) in list(self.subs.items()):
+            if q.qsize() >= self.qsize:  # slow consumer
+                self.ndrop += 1
+                self.drop(w, abort=True)
+            else:
+                q.put_nowait(msg[fmt])
+
+    def drop(self, w, abort=False):
+        """ disconnect a subscriber (abort: discard data not sent) """
+        fmt, q = self.subs.pop(w, (None, None))
+        if q is not None:
+            while not q.empty():
+                q.get_nowait()
+            q.put_nowait(None)
+        if abort:
+            w.transport.abort()
+        else:
+            w.close()
+
+    async def serve(self, fmt, reader, writer):
+        """ send queued messages to a subscriber """
+        q = asyncio.Queue(self.qsize + 1)  # +1: end of subscription
+        self.subs[writer] = (fmt, q)
+        self.tasks.add(asyncio.current_task())
+        self.nsub += 1
+        try:
+            while True:
+                msg = await q.get()
+                if msg is None:
+                    break
+                writer.write(msg)
+                await writer.drain()
+        except (OSError, asyncio.CancelledError):
+            pass
+        finally:
+            self.drop(writer)
+            self.tasks.discard(asyncio.current_task())
+
+    def stat_str(self):
+        """ statistics of the server """
+        return 'ssr server: epochs={} subscribers={} connected={} dropped={}' \
+            .format(self.npub, self.nsub, len(self.subs), self.ndrop)
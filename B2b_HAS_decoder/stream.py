@@ -0,0 +1,276 @@
+"""
+module for real-time input of receiver streams (TCP or serial)
+
+Raw navigation data streamed by a receiver are reassembled into frames
+incrementally and passed to the CSSR decoders as soon as they arrive:
+
+  transport -> framer -> queue (bounded) -> handler (decoder)
+
+The chunks of records generated by iter_stream() are the sources of the
+pipelines (pipeline.py) of the drivers, rolled at each day by iter_days().
+
+transport: coroutine function returning (reader, writer) as
+           asyncio.open_connection(), reader.read(n) gives the bytes
+           received (b'': end of stream), writer may be None. any byte
+           source (TCP, serial, local test server) can be injected.
+framer   : sbf_framer (Septentrio SBF) or unicore_framer (UM982), feed()
+           returns records of the completed frames.
+handler  : function called with the records in order of reception (e.g.
+           the queue to the caller of iter_stream()). an exception of the
+           handler is counted and logged (logging), and the chunk is dropped
+           without stopping the stream.
+
+The queue between the reader and the handler is bounded, so that the
+stream is no longer read while the handler is behind (back-pressure to the
+sender by TCP flow control). The connection is re-established with an
+exponential backoff if it is closed, fails or gives no data for a timeout.
+"""
+
+import asyncio
+import logging
+import queue
+import threading
+from datetime import datetime, timedelta
+from itertools import groupby
+from urllib.parse import urlparse, parse_qs
+import numpy as np
+
+QSIZE = 64      # max number of chunks in the queue
+NREAD = 4096    # max bytes per read
+TMO = 30.0      # timeout of no data (s)
+TMIN = 1.0      # min interval of reconnection (s)
+TMAX = 60.0     # max interval of reconnection (s)
+GPST0 = datetime(1980, 1, 6)  # start of GPST
+
+logger = logging.getLogger(__name__)
+
+
+def tcp_transport(host, port):
+    """ transport of TCP client """
+    async def connect():
+        return await asyncio.open_connection(host, port)
+    return connect
+
+
+def serial_transport(port, baudrate=115200):
+    """ transport of serial device (requires pyserial-asyncio) """
+    async def connect():
+        import serial_asyncio
+        return await serial_asyncio.open_serial_connection(url=port,
+                                                           baudrate=baudrate)
+    return connect
+
+
+def open_transport(url):
+    """ transport of URL
+
+    url: 'tcp://host:port' or 'serial://device?baud=115200'
+         (e.g. 'serial:///dev/ttyUSB0?baud=460800', 'serial://COM3')
+    """
+    u = urlparse(url)
+    if u.scheme == 'tcp':
+        return tcp_transport(u.hostname, u.port)
+    if u.scheme == 'serial':
+        baud = int(parse_qs(u.query).get('baud', [115200])[0])
+        return serial_transport(u.netloc + u.path, baud)
+    raise ValueError('unsupported stream: ' + url)
+
+
+class nav_stream:
+    """ input of a receiver stream with reconnection and back-pressure
+
+    transport: see module docstring
+    framer   : sbf_framer or unicore_framer
+    handler  : function called with the non-empty outputs of framer.feed()
+    qsize    : max number of chunks waiting for the handler
+    tmo      : timeout of no data to reconnect (s, None: no timeout)
+    tmin,tmax: min and max interval of reconnection (s)
+    maxretry : max number of successive failed connections (None: no limit)
+    offload  : run handler in a worker thread (not to block the reader)
+    """
+
+    def __init__(self, transport, framer, handler, qsize=QSIZE, nread=NREAD,
+                 tmo=TMO, tmin=TMIN, tmax=TMAX, maxretry=None, offload=False):
+        self.transport = transport
+        self.framer = framer
+        self.handler = handler
+        self.qsize = qsize
+        self.nread = nread
+        self.tmo = tmo
+        self.tmin = tmin
+        self.tmax = tmax
+        self.maxretry = maxretry
+        self.offload = offload
+        self.stopped = None
+        self.nconn = 0   # number of connections
+        self.nbyte = 0   # number of bytes received
+        self.nchunk = 0  # number of chunks to the handler
+        self.nwait = 0   # number of waits for the handler (queue full)
+        self.nerr = 0    # number of chunks failed by the handler
+        self.lasterr = ''  # last exception of the handler
+
+    def stop(self):
+        """ stop the stream (from the event loop of run()) """
+        if self.stopped is not None:
+            self.stopped.set()
+
+    async def run(self):
+        """ read the stream until stop() or maxretry, then process the
+            chunks left in the queue """
+        self.stopped = asyncio.Event()
+        q = asyncio.Queue(self.qsize)
+        cons = asyncio.ensure_future(self.consume(q))
+        try:
+            await self.produce(q)
+        finally:
+            await q.put(None)
+            await cons
+
+    async def produce(self, q):
+        """ connect, read and reassemble frames into the queue """
+        nfail, t = 0, self.tmin
+        while not self.stopped.is_set():
+            try:
+                reader, writer = await self.transport()
+            except (OSError, asyncio.TimeoutError):
+                nfail += 1
+                if self.maxretry is not None and nfail > self.maxretry:
+                    return
+                await self.wait(t)
+                t = min(t * 2, self.tmax)
+                continue
+            self.nconn += 1
+            self.framer.reset()
+            try:
+                while not self.stopped.is_set():
+                    data = await self.read(reader)
+                    if data is None or len(data) == 0:  # stopped or closed
+                        break
+                    nfail, t = 0, self.tmin
+                    self.nbyte += len(data)
+                    rec = self.framer.feed(data)
+                    if len(rec) > 0:
+                        if q.full():
+                            self.nwait += 1
+                        await q.put(rec)
+            except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError):
+                pass
+            finally:
+                if writer is not None:
+                    writer.close()
+            if not self.stopped.is_set():
+                nfail += 1
+                if self.maxretry is not None and nfail > self.maxretry:
+                    return
+                await self.wait(t)
+                t = min(t * 2, self.tmax)
+
+    async def read(self, reader):
+        """ read bytes (None: stopped) """
+        rd = asyncio.ensure_future(asyncio.wait_for(reader.read(self.nread),
+                                                    self.tmo))
+        st = asyncio.ensure_future(self.stopped.wait())
+        done, _ = await asyncio.wait({rd, st},
+                                     return_when=asyncio.FIRST_COMPLETED)
+        if rd not in done:
+            rd.cancel()
+            return None
+        st.cancel()
+        return rd.result()
+
+    async def wait(self, t):
+        """ wait for reconnection (or stop) """
+        try:
+            await asyncio.wait_for(self.stopped.wait(), t)
+        except asyncio.TimeoutError:
+            pass
+
+    async def consume(self, q):
+        """ pass chunks in the queue to the handler """
+        while True:
+            rec = await q.get()
+            if rec is None:
+                return
+            self.nchunk += 1
+            try:
+                if self.offload:
+                    await asyncio.get_running_loop().run_in_executor(
+                        None, self.handler, rec)
+                else:
+                    self.handler(rec)
+            except Exception as e:  # keep reading the stream
+                self.nerr += 1
+                self.lasterr = '{}: {}'.format(type(e).__name__, e)
+                logger.warning('stream: handler error: %s', self.lasterr)
+
+    def stat_str(self):
+        """ statistics of the stream """
+        return 'stream: conn={} bytes={} chunks={} waits={} errors={}'.format(
+            self.nconn, self.nbyte, self.nchunk, self.nwait, self.nerr)
+
+
+def iter_stream(url, framer, qsize=QSIZE, **opts):
+    """ read a receiver stream as an iterator of chunks
+
+    url    : see open_transport() (or transport function)
+    framer : sbf_framer or unicore_framer
+    qsize  : max number of chunks waiting for the caller
+    opts   : options of nav_stream
+    generates outputs of framer.feed() as they arrive. the stream is read
+    by an event loop in a background thread, which waits while qsize chunks
+    are not taken by the caller. the stream is stopped when the iterator
+    is closed.
+    """
+    transport = open_transport(url) if isinstance(url, str) else url
+    out = queue.Queue(qsize)
+    end = object()
+    st = nav_stream(transport, framer, out.put, offload=True, **opts)
+    loop = asyncio.new_event_loop()
+
+    def run():
+        try:
+            loop.run_until_complete(st.run())
+            loop.run_until_complete(loop.shutdown_default_executor())
+        finally:
+            out.put(end)
+
+    th = threading.Thread(target=run, daemon=True)
+    th.start()
+    try:
+        while True:
+            rec = out.get()
+            if rec is end:
+                break
+            yield rec
+    finally:
+        loop.call_soon_threadsafe(st.stop)
+        while th.is_alive():  # release the handler waiting for the queue
+            try:
+                out.get(timeout=0.1)
+            except queue.Empty:
+                pass
+        loop.close()
+
+
+def iter_days(chunks, week='wn'):
+    """ split chunks of records by days (GPST)
+
+    chunks : chunks of records with week and 'tow' fields (e.g.
+             iter_stream() of sbf_framer)
+    week   : name of the week field ('week' of unicore_framer)
+    generates (date, chunks of the day) in order of the records, date is
+    datetime of the start of the day. the chunks of a day are to be read
+    before the next day as itertools.groupby().
+    """
+    def split():
+        for rec in chunks:
+            if len(rec) == 0:
+                continue
+            day = rec[week].astype('i8') * 7 + \
+                (rec['tow'] // 86400).astype('i8')
+            k = np.flatnonzero(np.diff(day)) + 1
+            for d, r in zip(day[np.r_[0, k]], np.split(rec, k)):
+                yield int(d), r
+
+    for d, g in groupby(split(), key=lambda x: x[0]):
+        yield GPST0 + timedelta(days=d), (r for _, r in g)
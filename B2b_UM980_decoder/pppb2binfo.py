@@ -0,0 +1,172 @@
+"""
+module for Unicore UM982 PPPB2BINFO log parsing
+
+Parses #PPPB2BINFO1/2/4 ASCII logs of a raw UM982 log in a single pass into
+columnar record arrays (one structured array per message type). Records
+have the same fields and values as the text file written by
+ext124.extract_all_pppb2binfo_content() and read back in
+decode_B2B_UM982.read_um982_b2b_info(), so a one-row view of them can be
+passed to cssr_bdsC.decode_cssr().
+"""
+
+import numpy as np
+
+# records of PPP-B2b message type 1 (mask), 2 (orbit) and 4 (clock)
+DTYPE1 = [
+    ('week', 'i4'), ('tow', 'i4'), ('prn', 'i4'), ('iodssr', 'i4'), ('iodp', 'i4'),
+    ('tod', 'i4'), ('BDS', 'U63'), ('GPS', 'U37'), ('Galileo', 'U37'), ('GLONASS', 'U37')
+]
+
+DTYPE2 = [
+    ('week', 'i4'), ('tow', 'i4'), ('prn', 'i4'), ('iodssr', 'i4'), ('iodp', 'i4'),
+    ('tod', 'i4'), ('satslot', 'i4', (6,)), ('iodn', 'i4', (6,)), ('Rorb', 'f8', (6,)),
+    ('Aorb', 'f8', (6,)), ('Corb', 'f8', (6,)), ('iodcorr', 'i4', (6,)), ('URAI', 'U2', (6,))
+]
+
+DTYPE4 = [
+    ('week', 'i4'), ('tow', 'i4'), ('prn', 'i4'), ('sub', 'i4'), ('iodssr', 'i4'), ('iodp', 'i4'),
+    ('tod', 'i4'), ('iodcorr', 'i4', (23,)), ('sc0', 'f8', (23,))
+]
+
+DTYPE = {1: DTYPE1, 2: DTYPE2, 4: DTYPE4}
+
+HEADER = b'#PPPB2BINFO'
+NCHUNK = 65536  # number of messages per batch
+
+
+class b2b_batch:
+    """ batch of PPP-B2b messages as columnar record arrays
+
+    msg[mt]: records of message type mt (1, 2, 4)
+    seq    : message type and index in msg[mt] in order of the log {N, 2}
+    iteration gives one-row record arrays in order of the log
+    """
+
+    def __init__(self, rec, seq):
+        self.msg = {mt: np.array(rec[mt], dtype=DTYPE[mt]) for mt in DTYPE}
+        self.seq = np.array(seq, dtype='i4').reshape(-1, 2)
+
+    def __len__(self):
+        return len(self.seq)
+
+    def __iter__(self):
+        for mt, k in self.seq:
+            yield self.msg[mt][k:k+1]
+
+
+def decode_pppb2binfo(content):
+    """ decode content of a PPPB2BINFO log after the header
+
+    content: log without '#PPPB2BINFO' and line end (bytes)
+    returns (message type, record tuple) or (0, None) for other or invalid
+    logs
+    """
+    p = content.decode('ascii', errors='ignore').replace(';', ',') \
+        .replace('*', ',').split(',')
+    mt = p[0].replace('A', '')
+    try:
+        if mt == '1' and len(p) >= 15:
+            h = p[14]
+            bits = bin(int(h, 16))[2:].zfill(len(h) * 4)
+            return 1, (int(p[4]), int(p[5]) // 1000, int(p[10]) - 160,
+                       int(p[11]), int(p[12]), int(p[13]), bits[:63],
+                       bits[63:100], bits[100:137], bits[137:174])
+        if mt == '2' and len(p) >= 56:
+            s = [p[i:i+7] for i in range(14, len(p) - 1, 7)]
+            if len(s) != 6 or len(s[-1]) != 7:
+                return 0, None
+            return 2, (int(p[4]), int(p[5]) // 1000, int(p[10]) - 160,
+                       int(p[11]), int(p[12]), int(p[13]),
+                       [int(x[0]) for x in s], [int(x[1]) for x in s],
+                       [float('%.4f' % (float(x[2]) * 0.0016)) for x in s],
+                       [float('%.4f' % (float(x[3]) * 0.0064)) for x in s],
+                       [float('%.4f' % (float(x[4]) * 0.0064)) for x in s],
+                       [int(x[5]) for x in s], [x[6] for x in s])
+        if mt == '4' and len(p) >= 56:
+            s = [p[i:i+2] for i in range(18, len(p) - 1, 2)]
+            if len(s) != 23 or len(s[-1]) != 2:
+                return 0, None
+            return 4, (int(p[4]), int(p[5]) // 1000, int(p[10]) - 160,
+                       int(p[14]), int(p[11]), int(p[12]), int(p[13]),
+                       [int(x[0]) for x in s],
+                       [float(x[1]) * 0.0016 for x in s])
+    except (ValueError, IndexError):
+        pass
+    return 0, None
+
+
+def iter_pppb2binfo(file, nchunk=NCHUNK):
+    """ read PPPB2BINFO logs of a raw UM982 log as batches of messages
+
+    file  : raw UM982 log (mixed binary/ASCII)
+    nchunk: max number of messages per batch
+    generates b2b_batch of messages in order of the log
+    """
+    rec, seq = {mt: [] for mt in DTYPE}, []
+    with open(file, 'rb') as fp:
+        for line in fp:
+            if HEADER not in line:
+                continue
+            for part in line.rstrip(b'\n').split(HEADER)[1:]:
+                mt, r = decode_pppb2binfo(part)
+                if r is None:
+                    continue
+                seq.append((mt, len(rec[mt])))
+                rec[mt].append(r)
+            if len(seq) >= nchunk:
+                yield b2b_batch(rec, seq)
+                rec, seq = {mt: [] for mt in DTYPE}, []
+    if len(seq) > 0:
+        yield b2b_batch(rec, seq)
+
+
+def read_pppb2binfo(file):
+    """ read PPPB2BINFO logs of a raw UM982 log as a batch of messages """
+    batch = list(iter_pppb2binfo(file, nchunk=1 << 62))
+    if len(batch) == 0:
+        return b2b_batch({mt: [] for mt in DTYPE}, [])
+    return batch[0]
+
+
+class unicore_framer:
+    """ incremental reassembly of PPPB2BINFO logs from a UM982 stream
+
+    feed() takes bytes as received and returns b2b_batch of the completed
+    ASCII logs, decoded as iter_pppb2binfo(). an incomplete log is kept
+    until the next call (up to maxbuf bytes).
+    """
+
+    def __init__(self, types=(1, 2, 4), maxbuf=65536):
+        self.types = types
+        self.maxbuf = maxbuf
+        self.buff = bytearray()
+        self.nmsg = 0  # number of messages decoded
+
+    def reset(self):
+        """ discard incomplete log (e.g. on reconnection) """
+        self.buff = bytearray()
+
+    def feed(self, data):
+        """ add received bytes, return b2b_batch of completed messages """
+        buff, rec, seq, i = self.buff, {mt: [] for mt in DTYPE}, [], 0
+        buff += data
+        n = len(buff)
+        while True:
+            k = buff.find(HEADER, i)
+            if k < 0:  # keep the head of a split header
+                i = max(i, n - len(HEADER) + 1)
+                break
+            i = k + len(HEADER)  # log until line end or next header
+            e = [x for x in (buff.find(b'\n', i), buff.find(HEADER, i))
+                 if x >= 0]
+            if len(e) == 0:
+                i = k
+                break
+            mt, r = decode_pppb2binfo(bytes(buff[i:min(e)]).rstrip(b'\r'))
+            i = min(e)
+            if r is not None and mt in self.types:
+                seq.append((mt, len(rec[mt])))
+                rec[mt].append(r)
+        del buff[:max(i, n - self.maxbuf)]
+        self.nmsg += len(seq)
+        return b2b_batch(rec, seq)
@@ -0,0 +1,258 @@
+"""
+ Reprocessing of PPP-B2b/HAS corrections for stations and days in parallel
+
+ usage: python reprocess.py PRODUCT START [-n DAYS] [-s STA ...] [-p NPROC]
+
+ e.g. python reprocess.py HAS 2024-05-14 -n 365 -s SEPT -p 8
+
+ Each (station, day) is decoded as a job of a process pool. The navigation
+ files are parsed once and shared by the jobs as read-only pickle files
+ (nav_cache), and the products are written to temporary files and renamed
+ when the job completes, so that a product file is either complete or absent.
+"""
+import argparse
+import os
+import sys
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime, timedelta
+from B2b_HAS_decoder.cssr_has_sept import rs_inv_cache
+from B2b_HAS_decoder.pipeline import b2b_sept_pipeline, b2b_um982_pipeline, \
+    has_sept_pipeline, nav_cache
+from B2b_UM980_decoder.pppb2binfo import read_pppb2binfo
+
+
+def relative_to_absolute(relative_path):
+    current_dir = os.path.dirname(os.path.abspath(__file__))
+    return os.path.join(current_dir, relative_path)
+
+
+# Start for the configuration
+# file templates of products in data_dir: {sta} station, {doy} day of year,
+# {yy} 2-digit year, {yyyydoy} year and doy, {yyyymmdd} date, navigation files
+# of days (offset to the day) in nav_dir
+PRODUCTS = {
+    'B2b-Sept': {
+        'file': '{sta}{doy}0.{yy}__SBF_BDSRawB2b.txt',
+        'nav': 'BRD400DLR_S_{yyyydoy}0000_01D_MN.rnx',
+        'nav_days': (-1, 0, 1),
+        'corr': '{sta}{yyyydoy}_B2b', 'sta': ['SEPT']},
+    'B2b-UM982': {
+        'file': 'log_{sta}_{yyyymmdd}_00.txt',
+        'nav': 'BRD400DLR_S_{yyyydoy}0000_01D_MN.rnx', 'nav_days': (0,),
+        'corr': '{sta}{yyyydoy}_B2BRTCM', 'sta': ['UM982']},
+    'HAS': {
+        'file': '{sta}{doy}0.{yy}__SBF_GALRawCNAV.txt',
+        'nav': 'BRDC00IGS_R_{yyyydoy}0000_01D_MN.rnx', 'nav_days': (-1, 0, 1),
+        'corr': '{sta}{yyyydoy}_HAS', 'sta': ['SEPT']},
+}
+data_dir = 'test_data'
+nav_dir = os.path.join('test_data', 'eph')
+nav_cache_dir = os.path.join('test_data', 'eph', 'cache')  # parsed nav files
+rs_cache_size = 256  # max number of cached RS decoding matrices (0: no cache)
+rs_cache_file = os.path.join('test_data', 'has_rs_cache.npy')  # read only
+prn_ref = 59  # satellite PRN to receive BDS PPP collection
+ldpc_max_iter = 15  # max number of LDPC iterations
+ldpc_es_tol = 0.0   # early-stop threshold of LDPC decoder (0: disabled)
+max_orbit_delay = 300
+max_clock_delay = 30
+rtcm_out = False  # write RTCM3 SSR messages of products (.rtcm3)
+#End for the configuration
+
+EXT_OUT = ('.ssr', '.log', '.rtcm3', '.sp3')  # product files (.sp3 renamed
+                                              # last)
+
+# per-process caches shared by jobs (set by init_worker())
+_nav_cache = None
+_rs_cache = None
+
+
+def date_keys(date, sta=''):
+    """ keys of file templates for a day """
+    doy = date.timetuple().tm_yday
+    return {'sta': sta, 'doy': f"{doy:03d}", 'yy': f"{date.year % 100:02d}",
+            'yyyydoy': f"{date.year}{doy:03d}",
+            'yyyymmdd': date.strftime('%Y%m%d')}
+
+
+def make_jobs(product, stations, start_date, ndays, data_dir, nav_dir):
+    """ jobs of (station, day), ordered by day to share navigation files """
+    prd = PRODUCTS[product]
+    jobs = []
+    for i in range(ndays):
+        date = start_date + timedelta(days=i)
+        for sta in stations:
+            keys = date_keys(date, sta)
+            jobs.append({
+                'product': product, 'sta': sta, 'doy': keys['yyyydoy'],
+                'ep': [date.year, date.month, date.day, 0, 0, 0],
+                'file': os.path.join(data_dir, prd['file'].format(**keys)),
+                'nav_files': [os.path.join(nav_dir, prd['nav'].format(
+                    **date_keys(date + timedelta(days=d))))
+                    for d in prd['nav_days']],
+                'corr_dir': os.path.join(data_dir, prd['corr'].format(**keys))})
+    return jobs
+
+
+def init_worker(nav_cache_dir, rs_cache_file):
+    """ set caches of a process """
+    global _nav_cache, _rs_cache
+    _nav_cache = nav_cache(nav_cache_dir)
+    _rs_cache = rs_inv_cache(rs_cache_size)
+    if rs_cache_file is not None:
+        _rs_cache.load(rs_cache_file)
+
+
+def prepare_nav(file):
+    """ parse a navigation file to the shared cache """
+    try:
+        _nav_cache.get(file)
+    except (OSError, ValueError) as e:
+        return file, str(e)
+    return file, None
+
+
+def remove_files(corr_dir):
+    for ext in EXT_OUT:
+        if os.path.exists(corr_dir + ext):
+            os.remove(corr_dir + ext)
+
+
+def run_job(job, overwrite=False, monlevel=1):
+    """ decode corrections of a (station, day) job
+
+    returns (job, status, processing time (s), message), status:
+      'done' (written), 'skip' (products exist), 'missing' (no input file),
+      'failed' (exception)
+    """
+    t0 = time.time()
+    corr_dir = job['corr_dir']
+    if not os.path.exists(job['file']):
+        return job, 'missing', 0.0, "not found file: " + job['file']
+    if not overwrite and os.path.exists(corr_dir + '.sp3'):
+        return job, 'skip', 0.0, ""
+    os.makedirs(os.path.dirname(corr_dir) or '.', exist_ok=True)
+    corr_tmp = corr_dir + '.{:d}.tmp'.format(os.getpid())
+    remove_files(corr_tmp)
+    opt = {'monlevel': monlevel, 'nav_cache': _nav_cache,
+           'max_orbit_delay': max_orbit_delay,
+           'max_clock_delay': max_clock_delay, 'rtcm': rtcm_out}
+    pipe = None
+    try:
+        if job['product'] == 'B2b-Sept':
+            pipe = b2b_sept_pipeline(job['file'], job['nav_files'], job['ep'],
+                                     corr_tmp, prn=prn_ref, nproc=1,
+                                     ldpc_max_iter=ldpc_max_iter,
+                                     ldpc_es_tol=ldpc_es_tol, **opt)
+        elif job['product'] == 'B2b-UM982':
+            pipe = b2b_um982_pipeline(read_pppb2binfo(job['file']),
+                                      job['nav_files'], job['ep'], corr_tmp,
+                                      **opt)
+        else:
+            pipe = has_sept_pipeline(job['file'], job['nav_files'], job['ep'],
+                                     corr_tmp, rs_cache=_rs_cache, **opt)
+        try:
+            pipe.run()
+        finally:
+            if pipe.cs.fh is not None:
+                pipe.cs.fh.close()
+        # publish products: rename is atomic, a stale file is removed
+        for ext in EXT_OUT:
+            if os.path.exists(corr_tmp + ext):
+                os.replace(corr_tmp + ext, corr_dir + ext)
+            elif os.path.exists(corr_dir + ext):
+                os.remove(corr_dir + ext)
+    except Exception:
+        remove_files(corr_tmp)
+        return job, 'failed', time.time() - t0, traceback.format_exc()
+    return job, 'done', time.time() - t0, ""
+
+
+def reprocess(product, stations, start_date, ndays, nproc=1, overwrite=False,
+              download=False, monlevel=1):
+    """ decode corrections of stations and days by nproc processes
+
+    returns number of failed jobs
+    """
+    jobs = make_jobs(product, stations, start_date, ndays,
+                     relative_to_absolute(data_dir),
+                     relative_to_absolute(nav_dir))
+    if download:
+        # download tools are needed only by the main process
+        from download.down_PPP_products import down_NAV_data
+        down_NAV_data(start_date - timedelta(days=1), ndays + 2,
+                      relative_to_absolute(nav_dir))
+    nav_files = sorted({f for job in jobs for f in job['nav_files']
+                        if os.path.exists(f)})
+    initargs = (relative_to_absolute(nav_cache_dir),
+                relative_to_absolute(rs_cache_file)
+                if product == 'HAS' else None)
+    stat = {'done': 0, 'skip': 0, 'missing': 0, 'failed': 0}
+    failed = []
+
+    def report(k, result):
+        job, status, tp, msg = result
+        stat[status] += 1
+        print("[{:d}/{:d}] {:7s} {:s} {:s} {:s} {:.1f}s".format(
+            k, len(jobs), status, job['product'], job['sta'], job['doy'],
+            tp), flush=True)
+        if status == 'failed':
+            failed.append((job, msg))
+
+    tstart = time.time()
+    if nproc <= 1:
+        init_worker(*initargs)
+        for file, err in map(prepare_nav, nav_files):
+            if err is not None:
+                print("nav file error: " + err)
+        for k, job in enumerate(jobs):
+            report(k + 1, run_job(job, overwrite, monlevel))
+    else:
+        with ProcessPoolExecutor(max_workers=nproc, initializer=init_worker,
+                                 initargs=initargs) as pool:
+            # parse navigation files once in parallel before the jobs
+            for file, err in pool.map(prepare_nav, nav_files):
+                if err is not None:
+                    print("nav file error: " + err)
+            futures = [pool.submit(run_job, job, overwrite, monlevel)
+                       for job in jobs]
+            for k, future in enumerate(as_completed(futures)):
+                report(k + 1, future.result())
+
+    print("jobs: done={:d} skip={:d} missing={:d} failed={:d} time={:.1f}s"
+          .format(stat['done'], stat['skip'], stat['missing'],
+                  stat['failed'], time.time() - tstart))
+    for job, msg in failed:
+        print("failed: {:s} {:s} {:s}\n{:s}".format(job['product'], job['sta'],
+                                                     job['doy'], msg))
+    return len(failed)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="reprocess PPP-B2b/HAS corrections of stations and days")
+    parser.add_argument('product', choices=list(PRODUCTS))
+    parser.add_argument('start', help="first day (YYYY-MM-DD)")
+    parser.add_argument('-n', '--days', type=int, default=1,
+                        help="number of days (default: 1)")
+    parser.add_argument('-s', '--sta', nargs='+', default=None,
+                        help="stations (default: station of product)")
+    parser.add_argument('-p', '--nproc', type=int, default=os.cpu_count(),
+                        help="number of processes (default: number of CPUs)")
+    parser.add_argument('-o', '--overwrite', action='store_true',
+                        help="decode days with existing products")
+    parser.add_argument('-d', '--download', action='store_true',
+                        help="download navigation files before decoding")
+    parser.add_argument('-m', '--monlevel', type=int, default=1,
+                        help="monitor level of decoder (default: 1)")
+    args = parser.parse_args(argv)
+    start_date = datetime.strptime(args.start, '%Y-%m-%d')
+    stations = args.sta or PRODUCTS[args.product]['sta']
+    nfail = reprocess(args.product, stations, start_date, args.days,
+                      args.nproc, args.overwrite, args.download, args.monlevel)
+    return 1 if nfail > 0 else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
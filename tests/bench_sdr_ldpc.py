@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+#
+#  micro-benchmark of HEX/bit conversions of sdr_ldpc_test.py
+#
+#  run: python tests/bench_sdr_ldpc.py
+#
+import os, sys, time
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from binascii import unhexlify
+import numpy as np
+from B2b_HAS_decoder.sdr_ldpc_test import read_hex, pack_bits
+
+# per-bit implementations for reference ----------------------------------------
+def read_hex_ref(str0):
+    N = len(str0) * 4
+    data = np.zeros(N, dtype='uint8')
+    for i in range(N):
+        data[i] = (int(str0[i // 4], 16) >> (3 - i % 4)) & 1
+    return data
+
+def hex_str_ref(data):
+    str = ''
+    hex = 0
+    for i in range(len(data)):
+        hex = (hex << 1) + data[i]
+        if i % 4 == 3:
+            str += '%1X' % (hex)
+            hex = 0
+    return str
+
+# micro-benchmark of HEX/bit conversions per frame -----------------------------
+def bench_conv(nfrm=1000):
+    rng = np.random.default_rng(0)
+    frms = [hex_str_ref(rng.integers(0, 2, 992, dtype='uint8'))
+        for i in range(nfrm)]
+    
+    t = time.time()
+    for frm in frms:
+        SF = read_hex_ref(frm[:-2])[12:]
+        hex_txt = hex_str_ref(SF[:486])
+        buff_ref = unhexlify(hex_txt + '0')
+    t_ref = (time.time() - t) / nfrm
+    
+    t = time.time()
+    for frm in frms:
+        SF = read_hex(frm[:-2])[12:]
+        buff = pack_bits(SF[:484]).tobytes()
+    t_new = (time.time() - t) / nfrm
+    
+    print('HEX/bit conversion per frame: %.1f us -> %.1f us (x%.0f)' %
+        (t_ref * 1e6, t_new * 1e6, t_ref / t_new))
+    return buff == buff_ref
+
+if __name__ == '__main__':
+    bench_conv()
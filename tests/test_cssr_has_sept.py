@@ -0,0 +1,152 @@
+import numpy as np
+import bitstruct as bs
+import pytest
+
+from B2b_HAS_decoder.cssr_has_sept import cssr_has, rs_inv_cache, gf_inv, \
+    gf_matmul, HASPageAssembler, decode_has_pages
+from B2b_HAS_decoder.pipeline import FILE_GMAT
+
+
+@pytest.fixture(scope='module')
+def gMat():
+    return np.genfromtxt(FILE_GMAT, dtype='u1', delimiter=',')
+
+
+def encode_pages(gMat, msg):
+    """ HAS encoded pages {255, 53} of message {ms, 53} """
+    return gf_matmul(gMat[:, :len(msg)], msg)
+
+
+def test_gf_inv(gMat):
+    A = gMat[[3, 40, 77, 200], :4]
+    assert np.array_equal(gf_matmul(gf_inv(A), A), np.eye(4, dtype='u1'))
+    with pytest.raises(np.linalg.LinAlgError):
+        gf_inv(np.zeros((2, 2), dtype='u1'))
+
+
+def test_rs_cache_lru(gMat):
+    cache = rs_inv_cache(size=2)
+    D1 = cache.get((1, 50, 90), 3, gMat)
+    assert cache.get((1, 50, 90), 3, gMat) is D1
+    cache.get((2, 50, 90), 3, gMat)
+    cache.get((1, 50, 90), 3, gMat)  # most recently used
+    cache.get((0, 50, 90), 3, gMat)  # evicts (2, 50, 90)
+    assert list(cache.cache) == [((1, 50, 90), 3), ((0, 50, 90), 3)]
+    assert (cache.nhit, cache.nmiss) == (2, 3)
+    assert 'hit=2 miss=3' in cache.stat()
+
+    cache = rs_inv_cache(size=0)
+    cache.get((1, 50, 90), 3, gMat)
+    assert len(cache.cache) == 0 and cache.nmiss == 1
+
+
+def test_rs_cache_save_load(tmp_path, gMat):
+    cache = rs_inv_cache()
+    for idx in ((0, 40), (2, 50, 100), tuple(range(40, 72))):
+        cache.get(idx, len(idx), gMat)
+    file = str(tmp_path / 'rs_cache.npy')
+    cache.save(file)
+    cache2 = rs_inv_cache(size=2)
+    assert cache2.load(file) == 3
+    assert list(cache2.cache) == list(cache.cache)[1:]
+    for key, Dinv in cache2.cache.items():
+        assert np.array_equal(Dinv, cache.cache[key])
+    assert rs_inv_cache().load(str(tmp_path / 'none.npy')) == 0
+
+
+def test_decode_has_page(gMat):
+    rng = np.random.default_rng(1)
+    msg = rng.integers(0, 256, (5, 53), dtype='u1')
+    pages = encode_pages(gMat, msg)
+    cs = cssr_has()
+    idx = [200, 3, 40, 254, 99]
+    assert cs.decode_has_page(idx, pages, gMat, 5) == msg.tobytes()
+    # same message by cached matrix for pages in another order
+    assert cs.decode_has_page(idx[::-1], pages, gMat, 5) == msg.tobytes()
+    assert cs.rs_cache.nhit == 1
+    assert cs.decode_has_page(idx[:4], pages, gMat, 5) == b''
+
+
+def raw_page(mt, mid, ms, pid, page, hass=1):
+    """ raw E6-B page bytes with HAS page header at bit 14 """
+    buff = bytearray(64)
+    bs.pack_into('u2u2u2u5u5u8', buff, 14, hass, 0, mt, mid, ms - 1, pid)
+    bs.pack_into('u8' * 53, buff, 14 + 24, *page)
+    return bytes(buff)
+
+
+def test_assembler_complete():
+    asm = HASPageAssembler()
+    page = [np.full(53, k, dtype='u1') for k in range(4)]
+    assert asm.add_fields(1, 7, 3, 10, page[0], tow=3600) == []
+    assert asm.add_fields(1, 7, 3, 10, page[0], tow=3600) == []  # duplicated
+    assert asm.add_fields(1, 8, 2, 1, page[3], tow=3600) == []  # interleaved
+    assert asm.add_fields(1, 7, 3, 20, page[1], tow=3601) == []
+    res = asm.add_fields(1, 7, 3, 30, page[2], tow=3602)
+    assert len(res) == 1
+    mt, mid, ms, rec, pages = res[0]
+    assert (mt, mid, ms, rec) == (1, 7, 3, [9, 19, 29])
+    assert np.array_equal(pages[rec], np.array(page[:3]))
+    # pages of decoded message ignored
+    assert asm.add_fields(1, 7, 3, 40, page[3], tow=3603) == []
+    assert asm.stat == {1: [1, 0, 1]}
+    assert list(asm.msg) == [8]
+
+
+def test_assembler_timeout():
+    asm = HASPageAssembler(maxmsg=2, ntmo=2)
+    page = np.zeros(53, dtype='u1')
+    asm.add_fields(1, 1, 1 + 1, 1, page)
+    asm.add_fields(1, 2, 5, 1, page)
+    asm.end_epoch()
+    asm.add_fields(1, 3, 5, 1, page)  # drops the oldest (mid=1)
+    assert sorted(asm.msg) == [2, 3]
+    tmo = []
+    for k in range(11):  # timeout: 2 x 5 epochs
+        tmo += asm.end_epoch()
+    assert tmo == [2, 3]
+    assert asm.stat == {0: [0, 3, 0]}
+
+
+def test_assembler_invalid_pid():
+    asm = HASPageAssembler()
+    page = np.zeros(53, dtype='u1')
+    assert asm.add_fields(1, 4, 2, 0, page) == []
+    assert asm.add_fields(1, 4, 2, 256, page) == []
+    assert asm.msg == {} and asm.stat == {}
+    assert asm.add_page(raw_page(1, 4, 2, 0, page)) == []
+    asm.add_fields(1, 4, 2, 1, page)
+    assert len(asm.add_fields(1, 4, 2, 255, page)) == 1
+
+
+def test_assembler_stat_str():
+    asm = HASPageAssembler()
+    page = np.zeros(53, dtype='u1')
+    for day in (0, 1):  # same hour of day of two days
+        tow = day * 86400 + 5 * 3600
+        asm.add_fields(1, day + 1, 1, 1, page, tow=tow)
+    assert asm.stat_str() == [
+        "HAS messages day={:d} hour=05: completed=1 timeout=0 duplicated "
+        "pages=0".format(day) for day in (0, 1)]
+
+
+def test_assembler_raw_pages():
+    rng = np.random.default_rng(2)
+    page = rng.integers(0, 256, (2, 53), dtype='u1')
+    raw = [raw_page(1, 9, 2, 1 + k, page[k]) for k in range(2)]
+    dummy = bytearray(64)
+    bs.pack_into('u24', dummy, 14, 0xaf3bc3)
+    asm = HASPageAssembler()
+    assert asm.add_page(bytes(dummy)) == []
+    assert asm.add_page(raw_page(1, 9, 2, 1, page[0], hass=2)) == []
+    assert asm.add_page(raw[0]) == []
+    mt, mid, ms, rec, pages = asm.add_page(raw[1])[0]
+    assert np.array_equal(pages[rec], page)
+
+    # header fields decoded at once
+    pg = decode_has_pages(np.frombuffer(b''.join(raw + [bytes(dummy)]),
+                          dtype='u1').reshape(3, 64), tow=[1.0, 2.0, 3.0])
+    assert list(pg['valid']) == [True, True, False]
+    assert list(pg['mid'][:2]) == [9, 9] and list(pg['ms'][:2]) == [2, 2]
+    assert list(pg['pid'][:2]) == [1, 2]
+    assert np.array_equal(pg['page'][:2], page)
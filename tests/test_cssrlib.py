@@ -0,0 +1,92 @@
+import numpy as np
+import pytest
+
+from B2b_HAS_decoder.cssrlib import corr_table, local_corr, sCType
+from B2b_HAS_decoder.gnss import gtime_t, timediff, rSigRnx
+
+
+def dict_corr():
+    """ local_corr with dict fields of two satellites """
+    lc = local_corr()
+    t = gtime_t(1400000000, 0.123456789)
+    lc.iode = {3: 10, 40: 20}
+    lc.iodc = {3: 11, 40: 21}
+    lc.iodc_c = {3: 11}
+    lc.dorb = {3: np.array([0.1, -0.2, 0.3]), 40: np.array([1.0, 2.0, 3.0])}
+    lc.dclk = {3: 0.5}
+    lc.t0 = {3: {sCType.ORBIT: t, sCType.CLOCK: t}, 40: {sCType.ORBIT: t}}
+    lc.cbias = {3: {rSigRnx('GC1C'): 1.5, rSigRnx('GC2W'): -0.5}}
+    return lc
+
+
+def test_table_view():
+    lc = dict_corr()
+    tbl = corr_table().update_from(lc)
+    v = tbl.view()
+    for name in ('iode', 'iodc', 'iodc_c', 'dclk'):
+        assert dict(getattr(v, name)) == getattr(lc, name)
+    assert list(v.dorb) == [3, 40]
+    assert np.array_equal(v.dorb[40], lc.dorb[40])
+    assert set(v.t0[3]) == {sCType.ORBIT, sCType.CLOCK}
+    assert dict(v.cbias[3]) == lc.cbias[3]
+    assert 5 not in v.dorb and 40 not in v.dclk
+    with pytest.raises(KeyError):
+        v.dclk[40]
+    assert list(tbl.sats('dorb')) == [3, 40]
+
+
+def test_table_t0_exact():
+    tbl = corr_table().update_from(dict_corr())
+    t = tbl.view().t0[3][sCType.ORBIT]
+    assert (t.time, t.sec) == (1400000000, 0.123456789)
+    age = tbl.age(sCType.ORBIT, gtime_t(1400000010, 0.0))
+    assert age[2] == pytest.approx(10 - 0.123456789, abs=1e-12)
+    assert np.isnan(age[0]) and np.isnan(tbl.age(sCType.CLOCK,
+                                                 gtime_t(1400000010))[39])
+
+
+def test_table_legacy_updates():
+    tbl = corr_table().update_from(dict_corr())
+    v = tbl.view()
+    v.dorb[3] *= -1.0
+    assert np.array_equal(tbl.dorb[2], [-0.1, 0.2, -0.3])
+    # deletePRN of B2BData/HASData
+    v.iode[40] = 0
+    v.dorb[40] = []
+    v.dclk[40] = np.nan
+    v.t0[40][sCType.ORBIT] = None
+    assert 40 in v.dorb and np.isnan(v.dorb[40][0])
+    assert sCType.ORBIT not in v.t0[40]
+    with pytest.raises(ValueError):
+        v.dorb[5] = [1.0, 2.0]
+    assert 5 not in v.dorb
+    del v.cbias[3][rSigRnx('GC1C')]
+    assert dict(v.cbias[3]) == {rSigRnx('GC2W'): -0.5}
+    del v.dclk[3]
+    assert 3 not in v.dclk and np.isnan(tbl.age(sCType.ORBIT,
+                                                gtime_t(1400000000))[39])
+
+
+def test_table_cbias_columns():
+    tbl = corr_table(nsig=1)
+    sig = [rSigRnx(s) for s in ('GC1C', 'GC2W', 'GC5Q')]
+    for k, s in enumerate(sig):
+        tbl.set_cbias(7, s, float(k))
+    assert tbl.cbias.shape[1] >= 3 and tbl.sig == sig
+    assert dict(tbl.view().cbias[7]) == {s: float(k) for k, s in
+                                         enumerate(sig)}
+    tbl.clear('cbias', 7)
+    assert 7 not in tbl.view().cbias and np.all(np.isnan(tbl.cbias[6]))
+
+
+def test_table_copy():
+    tbl = corr_table().update_from(dict_corr())
+    snap = tbl.copy()
+    v = tbl.view()
+    v.dclk[3] = 9.0
+    v.cbias[40] = {rSigRnx('GC1C'): 2.0}
+    v.t0[3][sCType.CLOCK] = gtime_t(1400000030, 0.5)
+    w = snap.view()
+    assert w.dclk[3] == 0.5 and 40 not in w.cbias
+    assert timediff(v.t0[3][sCType.CLOCK], w.t0[3][sCType.CLOCK]) == \
+        pytest.approx(30 - 0.123456789 + 0.5)
@@ -0,0 +1,157 @@
+import numpy as np
+import bitstruct as bs
+import pytest
+
+from B2b_HAS_decoder.pipeline import FILE_GMAT, HASData, HASFec, \
+    HASScheduler, LDPCFec, iter_chunks
+from B2b_HAS_decoder.cssrlib import sCSSR, sCType
+from B2b_HAS_decoder.gnss import epoch2time, timeadd, timediff, rSigRnx
+from B2b_HAS_decoder.cssr_has_sept import cssr_has, gf_matmul
+from B2b_HAS_decoder.sbf import sbf_dtype, iter_sbf_file
+
+
+@pytest.fixture(scope='module')
+def gMat():
+    return np.genfromtxt(FILE_GMAT, dtype='u1', delimiter=',')
+
+
+@pytest.fixture(scope='module')
+def has_records(gMat):
+    """ GALRawCNAV records of HAS messages (pages of 2 epochs per message)
+        and the messages """
+    rng = np.random.default_rng(5)
+    v, msgs = np.zeros(0, dtype=sbf_dtype()), []
+    for m in range(40):
+        mid, ms = m % 32, int(rng.integers(1, 6))
+        msg = rng.integers(0, 256, (ms, 53), dtype='u1')
+        pages = gf_matmul(gMat[:, :ms], msg)
+        pids = rng.choice(np.r_[0:ms, 32:255], ms + int(rng.integers(0, 3)),
+                          replace=False)
+        r = np.zeros(len(pids), dtype=sbf_dtype())
+        for k, pid in enumerate(pids):
+            buff = bytearray(r['nav'].shape[1])
+            bs.pack_into('u2u2u2u5u5u8', buff, 14, 1, 0, 1, mid, ms - 1,
+                         pid + 1)
+            bs.pack_into('u8' * 53, buff, 38, *pages[pid])
+            r['nav'][k] = np.frombuffer(buff, dtype='u1')
+        r['tow'] = 345600.0 + m + rng.integers(0, 2, len(r))
+        v = np.concatenate([v, r])
+        msgs.append(msg.tobytes())
+    return v[np.argsort(v['tow'], kind='stable')], msgs
+
+
+def decode(gMat, records):
+    cs = cssr_has()
+    cs.monlevel = 0
+    return list(HASFec(cs, gMat)(records))
+
+
+def test_has_fec(gMat, has_records):
+    v, msgs = has_records
+    out = decode(gMat, v)
+    assert [m for m, a in out] == msgs
+    assert all(a == {'msgtype': 1} for m, a in out)
+
+
+@pytest.mark.parametrize('nchunk', [1, 3, 7, 100])
+def test_has_fec_chunks(gMat, has_records, nchunk):
+    # messages of chunks of records same as of all records
+    v, msgs = has_records
+    chunks = (v[i:i+nchunk] for i in range(0, len(v), nchunk))
+    assert [m for m, a in decode(gMat, chunks)] == msgs
+
+
+def test_iter_chunks():
+    v = np.arange(10)
+    assert [list(c) for c in iter_chunks(iter(v), 4)] == [
+        [0, 1, 2, 3], [4, 5, 6, 7], [8, 9]]
+    assert [list(c) for c in iter_chunks([v[:3], v[3:3], v[3:]])] == [
+        [0, 1, 2], list(range(3, 10))]
+
+
+def test_ldpc_fec_pool():
+    # pool shut down after the records, statistics of each decoder
+    rows = np.zeros(5, dtype=[('nav', 'u1', 123)])
+    fec1, fec2 = LDPCFec(nproc=2, nchunk=2), LDPCFec()
+    assert [m for m, a in fec1(iter(rows))] == [bytes(61)] * 5
+    assert fec1.executor is None
+    assert list(fec2(rows[:2])) == [(bytes(61), {})] * 2
+    assert fec1.stat.stat['fast'] == 5 and fec2.stat.stat['fast'] == 2
+
+
+def test_iter_sbf_file_lazy(tmp_path):
+    # file opened at the first chunk (source of the pipelines)
+    file = tmp_path / 'SEPT1350.24__SBF_GALRawCNAV.txt'
+    it = iter_sbf_file(str(file), 4024)
+    file.write_bytes(b'345600.000,2310,E05,Passed,E6B,1,00ff\n')
+    assert [list(c['prn']) for c in it] == [[5]]
+
+
+class FakeCssr:
+    """ decoder of messages given by subtype and time """
+
+    def __init__(self):
+        self.mask_id, self.mask_id_clk = 0, 1  # no data merged
+        self.log = []
+
+    def log_msg(self, msg):
+        self.log.append(msg)
+
+    def put(self, subtype, time):
+        self.subtype, self.time = subtype, time
+        return self
+
+
+def test_has_scheduler_clock_update():
+    # orbit age checked only for orbit updates
+    t0 = epoch2time([2024, 5, 14, 0, 0, 0])
+    sched, cs = HASScheduler(t0), FakeCssr()
+    epochs = lambda subtype, dt: [timediff(t, t0) for t, in sched.update(
+        cs.put(subtype, timeadd(t0, dt)))]
+    assert epochs(sCSSR.ORBIT, 0) == []
+    assert epochs(sCSSR.CLOCK, 0) == []
+    assert epochs(sCSSR.CLOCK, 400) == [5, 10, 15, 20, 25, 30]
+    assert epochs(sCSSR.CLOCK, 410) == [405]  # orbit age 405 s
+    assert epochs(sCSSR.ORBIT, 700) == []  # orbit age > max_orbit_delay
+    assert len(cs.log) > 0
+
+
+def test_decode_day(tmp_path, monkeypatch):
+    # driver function runs without the globals of the script
+    pytest.importorskip('dateutil')
+    import decode_B2B_UM982 as drv
+    calls = []
+
+    class FakePipeline:
+        def __init__(self, v, nav_files, ep, corr_dir, **opt):
+            calls.append((v, nav_files, ep, corr_dir, opt))
+
+        def run(self):
+            pass
+
+    monkeypatch.setattr(drv, 'down_NAV_data', lambda *args: None)
+    monkeypatch.setattr(drv, 'b2b_um982_pipeline', FakePipeline)
+    drv.decode_day([], drv.datetime(2024, 5, 14),
+                   str(tmp_path / 'eph' / 'BRD_{}.rnx'),
+                   str(tmp_path / 'out' / 'UM982{}'), max_clock_delay=10)
+    v, nav_files, ep, corr_dir, opt = calls[0]
+    assert nav_files == [str(tmp_path / 'eph' / 'BRD_2024135.rnx')]
+    assert corr_dir == str(tmp_path / 'out' / 'UM9822024135')
+    assert opt['max_clock_delay'] == 10 and opt['ssr_out'] is None
+
+
+def test_has_data_cbias():
+    # code biases of the decoder merged for output (RTCM3 code bias)
+    cs = cssr_has()
+    t = epoch2time([2024, 5, 14, 0, 0, 0])
+    lc = cs.lc[0]
+    cs.sat_n, cs.sat_n_p, cs.iodssr = [30, 31], [30], 1
+    lc.iode = {30: 5, 31: 6}
+    lc.dorb = {30: np.zeros(3), 31: np.ones(3)}
+    lc.dclk = {30: 0.1}
+    lc.t0 = {30: {sCType.ORBIT: t, sCType.CLOCK: t}, 31: {sCType.ORBIT: t}}
+    lc.cbias = {30: {rSigRnx('EC1C'): 0.5}}
+    data = HASData()
+    data.update_value_from(cs)
+    assert dict(data.lc[0].cbias) == {30: {rSigRnx('EC1C'): 0.5}}
+    assert data.lc[0].dclk == {30: 0.1}
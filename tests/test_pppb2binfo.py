@@ -0,0 +1,91 @@
+import numpy as np
+import pytest
+
+from B2b_UM980_decoder import pppb2binfo as pb
+
+HEAD = 'COM1,0,FINE,{week},{ms},0,0,18,0;{prn}'
+
+
+def log_line(mt, week=2310, ms=345600000, prn=59):
+    """ ASCII #PPPB2BINFO log of message type mt """
+    h = '#PPPB2BINFO{:d}A,'.format(mt) + HEAD.format(week=week, ms=ms,
+                                                     prn=prn + 160)
+    if mt == 1:
+        body = ',3,5,%d,' % (ms // 1000 % 86400) + '%044X' % (0xfff << 164)
+    elif mt == 2:
+        body = ',3,5,%d' % (ms // 1000 % 86400) + ''.join(
+            ',%d,%d,%d,%d,%d,%d,%02d' % (k + 1, 100 + k, 10 * k, -5 * k, k, k, 3)
+            for k in range(6))
+    else:
+        body = ',3,5,%d,0,0,0,0' % (ms // 1000 % 86400) + ''.join(
+            ',%d,%d' % (k % 8, 7 * k - 50) for k in range(23))
+    return (h + body + '*1234abcd\r\n').encode()
+
+
+@pytest.fixture
+def ascii_log():
+    lines = [log_line(1), b'$GNGGA,noise\r\n', log_line(2, ms=345601000),
+             log_line(4, ms=345602000),
+             log_line(4, ms=345603000)[:40] + b'\r\n',  # truncated
+             log_line(2, ms=345604000) + log_line(4, ms=345605000)]
+    return b''.join(lines)
+
+
+def test_decode_ascii():
+    mt, r = pb.decode_pppb2binfo(log_line(2)[11:].rstrip())
+    assert mt == 2
+    rec = np.array([r], dtype=pb.DTYPE2)[0]
+    assert (rec['week'], rec['tow'], rec['prn']) == (2310, 345600, 59)
+    assert list(rec['satslot']) == [1, 2, 3, 4, 5, 6]
+    assert rec['Rorb'][1] == pytest.approx(10 * 0.0016)
+    assert rec['Aorb'][2] == pytest.approx(-10 * 0.0064)
+    mt, r = pb.decode_pppb2binfo(log_line(4)[11:].rstrip())
+    rec = np.array([r], dtype=pb.DTYPE4)[0]
+    assert (rec['sub'], rec['iodssr'], rec['iodp'], rec['tod']) == \
+        (0, 3, 5, 345600 % 86400)
+    assert rec['sc0'][22] == pytest.approx((7 * 22 - 50) * 0.0016)
+    mt, r = pb.decode_pppb2binfo(log_line(1)[11:].rstrip())
+    assert r[6] == '1' * 12 + '0' * 51
+    assert pb.decode_pppb2binfo(b'2A,COM1,1,2') == (0, None)
+
+
+def test_read_ascii(tmp_path, ascii_log):
+    file = tmp_path / 'log_UM982_20240514_00.txt'
+    file.write_bytes(ascii_log)
+    batch = pb.read_pppb2binfo(str(file))
+    assert [int(r['tow'][0]) for r in batch] == \
+        [345600, 345601, 345602, 345604, 345605]
+    assert [mt for mt, k in batch.seq] == [1, 2, 4, 2, 4]
+    chunks = list(pb.iter_pppb2binfo(str(file), nchunk=2))
+    assert [len(c) for c in chunks] == [2, 2, 1]
+
+
+def test_framer_ascii(tmp_path, ascii_log):
+    file = tmp_path / 'log_UM982_20240514_00.txt'
+    file.write_bytes(ascii_log)
+    ref = pb.read_pppb2binfo(str(file))
+    for size in (len(ascii_log), 1, 13, 100):
+        framer = pb.unicore_framer()
+        batch = [framer.feed(ascii_log[i:i+size])
+                 for i in range(0, len(ascii_log), size)]
+        recs = [r for b in batch for r in b]
+        assert len(recs) == len(ref) == framer.nmsg
+        for r, r_ref in zip(recs, ref):
+            assert r.tobytes() == r_ref.tobytes()
+    framer = pb.unicore_framer(types=(2,))
+    assert [mt for mt, k in framer.feed(ascii_log).seq] == [2, 2]
+
+
+def test_binary_ignored(tmp_path, ascii_log):
+    # binary messages of the raw log (e.g. Unicore sync and CRC) are skipped
+    rng = np.random.default_rng(3)
+    junk = b'\xaa\x44\xb5' + rng.integers(0, 256, 300, dtype='u1').tobytes()
+    data = junk + b'\r\n' + ascii_log + junk
+    file = tmp_path / 'log_UM982_20240514_00.txt'
+    file.write_bytes(data)
+    ref = pb.read_pppb2binfo(str(file))
+    assert [mt for mt, k in ref.seq] == [1, 2, 4, 2, 4]
+    framer = pb.unicore_framer()
+    recs = [r for i in range(0, len(data), 50) for r in
+            framer.feed(data[i:i+50])]
+    assert [r.tobytes() for r in recs] == [r.tobytes() for r in ref]
@@ -0,0 +1,123 @@
+import os
+from datetime import datetime
+
+import pytest
+
+import reprocess
+
+
+class FakeDecoder:
+    def __init__(self, file=None):
+        self.fh = None if file is None else open(file, 'w')
+
+
+class FakePipeline:
+    """ pipeline writing the products to corr_dir (fail: raise after .ssr,
+        log: write .log) """
+
+    def __init__(self, corr_dir, fail=False, log=True):
+        self.corr_dir = corr_dir
+        self.fail = fail
+        self.cs = FakeDecoder(corr_dir + '.log' if log else None)
+
+    def run(self):
+        with open(self.corr_dir + '.ssr', 'w') as fp:
+            fp.write('ssr\n')
+        if self.fail:
+            raise RuntimeError('decoding error')
+        with open(self.corr_dir + '.sp3', 'w') as fp:
+            fp.write('sp3\n')
+        return self
+
+
+@pytest.fixture
+def fake(monkeypatch):
+    """ options of FakePipeline built by run_job() """
+    opt = {}
+
+    def has_sept_pipeline(file, nav_files, ep, corr_dir, rs_cache=None,
+                          **kw):
+        return FakePipeline(corr_dir, **opt)
+
+    monkeypatch.setattr(reprocess, 'has_sept_pipeline', has_sept_pipeline)
+    return opt
+
+
+@pytest.fixture
+def job(tmp_path):
+    job = reprocess.make_jobs('HAS', ['SEPT'], datetime(2024, 5, 14), 1,
+                              str(tmp_path / 'data'), str(tmp_path / 'eph'))[0]
+    os.makedirs(tmp_path / 'data')
+    with open(job['file'], 'w') as fp:
+        fp.write('\n')
+    return job
+
+
+def products(job):
+    """ files of the job except input """
+    d = os.path.dirname(job['corr_dir'])
+    return sorted(f for f in os.listdir(d) if f != os.path.basename(job['file']))
+
+
+def read(file):
+    with open(file) as fp:
+        return fp.read()
+
+
+def test_make_jobs():
+    jobs = reprocess.make_jobs('HAS', ['SEPT', 'ABMF'], datetime(2024, 5, 14),
+                               2, 'data', 'eph')
+    assert [(j['sta'], j['doy']) for j in jobs] == [
+        ('SEPT', '2024135'), ('ABMF', '2024135'), ('SEPT', '2024136'),
+        ('ABMF', '2024136')]
+    assert jobs[0]['file'] == os.path.join('data',
+                                           'SEPT1350.24__SBF_GALRawCNAV.txt')
+    assert jobs[0]['corr_dir'] == os.path.join('data', 'SEPT2024135_HAS')
+    assert [os.path.basename(f) for f in jobs[0]['nav_files']] == [
+        'BRDC00IGS_R_20241340000_01D_MN.rnx',
+        'BRDC00IGS_R_20241350000_01D_MN.rnx',
+        'BRDC00IGS_R_20241360000_01D_MN.rnx']
+    # 3-day navigation window as HAS
+    jobs = reprocess.make_jobs('B2b-Sept', ['SEPT'], datetime(2024, 5, 14),
+                               1, 'data', 'eph')
+    assert [os.path.basename(f) for f in jobs[0]['nav_files']] == [
+        'BRD400DLR_S_20241340000_01D_MN.rnx',
+        'BRD400DLR_S_20241350000_01D_MN.rnx',
+        'BRD400DLR_S_20241360000_01D_MN.rnx']
+
+
+def test_run_job_missing(fake, job):
+    os.remove(job['file'])
+    j, status, tp, msg = reprocess.run_job(job)
+    assert status == 'missing' and job['file'] in msg
+    assert products(job) == []
+
+
+def test_run_job_done_skip(fake, job):
+    assert reprocess.run_job(job)[1] == 'done'
+    assert products(job) == ['SEPT2024135_HAS.log', 'SEPT2024135_HAS.sp3',
+                             'SEPT2024135_HAS.ssr']
+    fake['fail'] = True
+    assert reprocess.run_job(job)[1] == 'skip'
+    assert read(job['corr_dir'] + '.sp3') == 'sp3\n'
+
+
+def test_run_job_failed(fake, job):
+    reprocess.run_job(job)
+    with open(job['corr_dir'] + '.ssr', 'w') as fp:
+        fp.write('old\n')
+    fake['fail'] = True
+    j, status, tp, msg = reprocess.run_job(job, overwrite=True)
+    assert status == 'failed' and 'decoding error' in msg
+    # products of the previous run kept, no temporary files
+    assert products(job) == ['SEPT2024135_HAS.log', 'SEPT2024135_HAS.sp3',
+                             'SEPT2024135_HAS.ssr']
+    assert read(job['corr_dir'] + '.ssr') == 'old\n'
+
+
+def test_run_job_overwrite(fake, job):
+    reprocess.run_job(job)
+    fake['log'] = False
+    assert reprocess.run_job(job, overwrite=True)[1] == 'done'
+    # stale .log of the previous run removed
+    assert products(job) == ['SEPT2024135_HAS.sp3', 'SEPT2024135_HAS.ssr']
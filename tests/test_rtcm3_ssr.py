@@ -0,0 +1,256 @@
+import bitstruct as bs
+import numpy as np
+import pytest
+
+from B2b_HAS_decoder import rtcm3_ssr
+from B2b_HAS_decoder.gnss import uGNSS, rSigRnx, prn2sat, epoch2time
+from B2b_HAS_decoder.rtcm3_ssr import SSR_ORBIT, SSR_CLOCK, SSR_CBIAS, \
+    SSR_COMBINED, SSR_MSGNO, SSR_SATID, SSR_SIG, SSR_UDI, ORB_FMT, CLK_FMT, \
+    CB_FMT, crc24q, rtcm3_frame, ssr_epoch, encode_ssr, encode_ssr_corr, \
+    rtcm3_file
+from B2b_HAS_decoder.cssrlib import local_corr
+from B2b_HAS_decoder.cssr_has_sept import cssr_has
+
+
+def decode_ssr(buff, i=0):
+    """ decode RTCM3 SSR message encoded by encode_ssr() at buff[i:]
+
+    returns (msg, length) or (None, length) for a frame of an other message
+    or (None, 0) for no valid frame. msg is a dict of msgno, sys, subtype,
+    epoch, udi (s), mmi, refd, iodssr, provider, solution and corr of
+    {sat: (iode, dclk, dorb)} or {sat: {rsig: cb}} as encode_ssr()
+    """
+    if len(buff) < i + 6 or buff[i] != 0xD3:
+        return None, 0
+    n = (buff[i+1] & 0x3) << 8 | buff[i+2]
+    if len(buff) < i + n + 6 or crc24q(buff[i:i+n+3]) != \
+            int.from_bytes(buff[i+n+3:i+n+6], 'big'):
+        return None, 0
+    msg = bytes(buff[i+3:i+n+3])
+    msgno = bs.unpack_from('u12', msg)[0]
+    sys = [s for s, m in SSR_MSGNO.items() if 0 <= msgno - m < 4]
+    if len(sys) == 0:
+        return None, n + 6
+    sys = sys[0]
+    subtype = msgno - SSR_MSGNO[sys]
+    np_, ni, nj, offp = SSR_SATID[sys]
+
+    hfmt = 'u12' + ('u17' if sys == uGNSS.GLO else 'u20') + 'u4u1' + \
+        ('u1' if subtype in (SSR_ORBIT, SSR_COMBINED) else '') + 'u4u16u4' + \
+        ('u4' if sys == uGNSS.QZS else 'u6')
+    h = bs.unpack_from(hfmt, msg)
+    if subtype not in (SSR_ORBIT, SSR_COMBINED):
+        h = h[:4] + (0,) + h[4:]
+    r = {'msgno': msgno, 'sys': sys, 'subtype': subtype, 'epoch': h[1],
+         'udi': SSR_UDI[h[2]], 'mmi': h[3], 'refd': h[4], 'iodssr': h[5],
+         'provider': h[6], 'solution': h[7], 'corr': {}}
+    j = bs.calcsize(hfmt)
+    for _ in range(h[8]):
+        prn = bs.unpack_from('u{}'.format(np_), msg, j)[0] + offp
+        j += np_
+        sat = prn2sat(sys, prn)
+        if subtype == SSR_CBIAS:
+            nb = bs.unpack_from('u5', msg, j)[0]
+            j += 5
+            cb = {}
+            for _ in range(nb):
+                sig, v = bs.unpack_from('u5s{}'.format(CB_FMT[0]), msg, j)
+                j += 5 + CB_FMT[0]
+                cb[rSigRnx(sys, 'C' + SSR_SIG[sys][sig])] = v * CB_FMT[1]
+            r['corr'][sat] = cb
+            continue
+        iode, dorb, dclk = 0, np.zeros(3), 0.0
+        if subtype != SSR_CLOCK:
+            iode = bs.unpack_from('u{}'.format(ni), msg, j)[0]
+            j += ni + nj
+            d = bs.unpack_from(''.join('s{}'.format(n) for n, _ in ORB_FMT),
+                               msg, j)
+            j += sum(n for n, _ in ORB_FMT)
+            dorb = np.array([d[k] * ORB_FMT[k][1] for k in range(3)])
+        if subtype != SSR_ORBIT:
+            c = bs.unpack_from(''.join('s{}'.format(n) for n, _ in CLK_FMT),
+                               msg, j)
+            j += sum(n for n, _ in CLK_FMT)
+            dclk = c[0] * CLK_FMT[0][1]
+        r['corr'][sat] = (iode, dclk, dorb)
+    return r, n + 6
+
+
+def decode_all(frames):
+    """ decode frames, check length, return messages """
+    msgs = []
+    for f in frames:
+        msg, n = decode_ssr(f)
+        assert n == len(f) and msg is not None
+        msgs.append(msg)
+    return msgs
+
+
+T = epoch2time([2024, 5, 14, 1, 2, 30])
+
+# satellites of systems: (system, PRNs)
+SATS = {uGNSS.GPS: [1, 17, 32], uGNSS.GLO: [1, 24], uGNSS.GAL: [2, 36],
+        uGNSS.QZS: [193, 202], uGNSS.BDS: [19, 46, 59],
+        uGNSS.SBS: [120, 158]}
+SYS = list(SATS)
+
+
+def orbclk(sys):
+    """ corrections {sat: (iode, dclk, dorb)} of a system """
+    ni = SSR_SATID[sys][1]
+    return {prn2sat(sys, prn): ((37 * k + 5) % (1 << ni), 1.2345 - k,
+            np.array([0.5 - 0.3 * k, -1.25 + k, 0.0625 * k]))
+            for k, prn in enumerate(SATS[sys])}
+
+
+def cbias(sys):
+    """ code biases {sat: {rsig: cb}} of a system """
+    sig = [s for s in SSR_SIG[sys] if s][:3]
+    return {prn2sat(sys, prn): {rSigRnx(sys, 'C' + s): 0.11 * (j + 1) - k
+                                for j, s in enumerate(sig)}
+            for k, prn in enumerate(SATS[sys])}
+
+
+def check_orbclk(corr, ref, subtype):
+    assert list(corr) == sorted(ref)
+    for sat, (iode, dclk, dorb) in ref.items():
+        iode1, dclk1, dorb1 = corr[sat]
+        if subtype != SSR_CLOCK:
+            assert iode1 == iode
+            assert np.allclose(dorb1, dorb, atol=ORB_FMT[1][1] / 2)
+        if subtype != SSR_ORBIT:
+            assert dclk1 == pytest.approx(dclk, abs=CLK_FMT[0][1] / 2)
+
+
+@pytest.mark.parametrize('sys', SYS)
+@pytest.mark.parametrize('subtype', [SSR_ORBIT, SSR_CLOCK, SSR_COMBINED])
+def test_orbclk(sys, subtype):
+    ref = orbclk(sys)
+    frames = encode_ssr(subtype, T, sys, ref, iodssr=3, udi=10, provider=7,
+                        solution=2)
+    (msg,) = decode_all(frames)
+    assert msg['msgno'] == SSR_MSGNO[sys] + subtype
+    assert (msg['sys'], msg['subtype'], msg['mmi']) == (sys, subtype, 0)
+    assert msg['epoch'] == ssr_epoch(T, sys)
+    assert (msg['udi'], msg['iodssr'], msg['provider'], msg['solution']) == \
+        (10, 3, 7, 2)
+    check_orbclk(msg['corr'], ref, subtype)
+
+
+@pytest.mark.parametrize('sys', SYS)
+def test_cbias(sys):
+    ref = cbias(sys)
+    (msg,) = decode_all(encode_ssr(SSR_CBIAS, T, sys, ref))
+    assert msg['msgno'] == SSR_MSGNO[sys] + SSR_CBIAS
+    assert list(msg['corr']) == sorted(ref)
+    for sat, cb in ref.items():
+        assert {s.str(): v for s, v in msg['corr'][sat].items()} == \
+            pytest.approx({s.str(): v for s, v in cb.items()},
+                          abs=CB_FMT[1] / 2)
+
+
+def test_rtcm3_file(tmp_path):
+    # messages of epochs published by a decoder to the file pipeline output
+    ref, cb = orbclk(uGNSS.GAL), cbias(uGNSS.GAL)
+    data = local_corr()
+    data.cbias = {**cb, prn2sat(uGNSS.GAL, 9): {}}  # sat not in ref
+    data = type('data', (), {'lc': [data]})  # merged corrections
+    file = str(tmp_path / 'SEPT2024135_HAS.rtcm3')
+    cs = cssr_has()
+    cs.ssr_out = [rtcm3_file(file)]
+    cs.publish_ssr(T, 'HAS', ref, data)
+    cs.publish_ssr(T, 'HAS', {}, data)  # no corrections: not written
+    data.lc[0].cbias = None
+    cs.publish_ssr(T, 'HAS', ref, data)
+    assert cs.ssr_out[0].nepoch == 2
+    with open(file, 'rb') as fp:
+        buff = fp.read()
+    msgs, i = [], 0
+    while i < len(buff):
+        msg, n = decode_ssr(buff, i)
+        assert msg is not None
+        msgs.append(msg)
+        i += n
+    assert [m['subtype'] for m in msgs] == [SSR_COMBINED, SSR_CBIAS,
+                                            SSR_COMBINED]
+    check_orbclk(msgs[0]['corr'], ref, SSR_COMBINED)
+    assert list(msgs[1]['corr']) == sorted(cb)
+    for sat, c in cb.items():
+        assert {s.str(): v for s, v in msgs[1]['corr'][sat].items()} == \
+            pytest.approx({s.str(): v for s, v in c.items()},
+                          abs=CB_FMT[1] / 2)
+
+
+def test_all_systems():
+    ref = {}
+    for sys in SYS:
+        ref.update(orbclk(sys))
+    msgs = decode_all(encode_ssr_corr(T, ref))
+    assert [m['sys'] for m in msgs] == list(SSR_MSGNO)
+    corr = {}
+    for m in msgs:
+        assert m['subtype'] == SSR_COMBINED
+        corr.update(m['corr'])
+    check_orbclk(dict(sorted(corr.items())), ref, SSR_COMBINED)
+
+
+def test_split_qzs(monkeypatch):
+    # QZSS satellites of gnss (10) split by 4 satellites per message
+    monkeypatch.setitem(rtcm3_ssr.SSR_NSMAX, uGNSS.QZS, 4)
+    ref = {prn2sat(uGNSS.QZS, prn): (prn, 0.1, np.array([0.1, 0.2, 0.3]))
+           for prn in range(193, 203)}
+    msgs = decode_all(encode_ssr(SSR_COMBINED, T, uGNSS.QZS, ref))
+    assert [len(m['corr']) for m in msgs] == [4, 4, 2]
+    assert [m['mmi'] for m in msgs] == [1, 1, 0]
+    corr = {k: v for m in msgs for k, v in m['corr'].items()}
+    check_orbclk(corr, ref, SSR_COMBINED)
+
+
+def test_split_length():
+    # code biases of 32 GPS satellites exceed max length of a message
+    sig = [s for s in SSR_SIG[uGNSS.GPS] if s]
+    ref = {prn2sat(uGNSS.GPS, prn): {rSigRnx(uGNSS.GPS, 'C' + s): 0.01 * prn
+                                     for s in sig} for prn in range(1, 33)}
+    frames = encode_ssr(SSR_CBIAS, T, uGNSS.GPS, ref)
+    assert len(frames) == 2
+    assert all(len(f) <= rtcm3_ssr.MAXLEN + 6 for f in frames)
+    msgs = decode_all(frames)
+    assert [m['mmi'] for m in msgs] == [1, 0]
+    assert sum(len(m['corr']) for m in msgs) == 32
+
+
+def test_out_of_range():
+    sats = [prn2sat(uGNSS.GPS, prn) for prn in (1, 2, 3, 4)]
+    ref = {sats[0]: (1, 0.5, np.array([0.1, 0.2, 0.3])),
+           sats[1]: (2, 0.5, np.array([300.0, 0.2, 0.3])),   # radial
+           sats[2]: (3, 250.0, np.array([0.1, 0.2, 0.3])),   # clock
+           sats[3]: (4, 0.5, np.array([0.1, 0.2, -900.0]))}  # cross
+    (msg,) = decode_all(encode_ssr(SSR_COMBINED, T, uGNSS.GPS, ref))
+    assert list(msg['corr']) == [sats[0]]
+    # clock only
+    (msg,) = decode_all(encode_ssr(SSR_CLOCK, T, uGNSS.GPS, ref))
+    assert list(msg['corr']) == [sats[0], sats[1], sats[3]]
+
+    # code biases out of range or NaN dropped, others of satellite kept
+    c1c, c2w, c5q = (rSigRnx(uGNSS.GPS, s) for s in ('C1C', 'C2W', 'C5Q'))
+    ref = {sats[0]: {c1c: 1.5, c2w: 100.0, c5q: np.nan}}
+    (msg,) = decode_all(encode_ssr(SSR_CBIAS, T, uGNSS.GPS, ref))
+    assert {s.str(): v for s, v in msg['corr'][sats[0]].items()} == \
+        pytest.approx({'C1C': 1.5})
+
+    # satellites of other systems and empty corrections
+    assert encode_ssr_corr(T, {}) == []
+    (msg,) = decode_all(encode_ssr(SSR_ORBIT, T, uGNSS.GAL,
+                                   {**ref, **orbclk(uGNSS.GAL)}))
+    assert list(msg['corr']) == sorted(orbclk(uGNSS.GAL))
+
+
+def test_crc24q():
+    assert crc24q(b'123456789') == 0xCDE703  # check value of CRC-24Q
+    assert rtcm3_frame(b'') == bytes.fromhex('D3000047EA4B')
+    frame = bytearray(encode_ssr(SSR_COMBINED, T, uGNSS.GPS,
+                                 orbclk(uGNSS.GPS))[0])
+    assert crc24q(frame) == 0  # CRC of frame with CRC
+    frame[10] ^= 0x10
+    assert decode_ssr(frame) == (None, 0)
+    assert decode_ssr(frame[:-1]) == (None, 0)
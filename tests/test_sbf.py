@@ -0,0 +1,173 @@
+import struct
+from binascii import crc_hqx, hexlify, unhexlify
+
+import numpy as np
+import pytest
+
+from B2b_HAS_decoder import sbf
+
+NWORD = sbf.SBF_BLK[4242][1]
+
+
+def nav_words(k):
+    """ NAVBits of BDSRawB2b (31 words) for record k """
+    return [(k * 0x01010101 + i * 0x10203) & 0xffffffff for i in range(NWORD)]
+
+
+def text_line(tow, prn, words, valid=b'Passed', sep=b' '):
+    """ ASCII SBF export line: TOW, WN, PRN, validity, signal, num, NAVBits """
+    nav = sep.join(b'%08X' % w for w in words)
+    return b'%.3f,2310,C%02d,%s,B2b,2,%s\r\n' % (tow, prn, valid, nav)
+
+
+def bds_svid(prn):
+    """ BDS PRN number -> SBF SVID """
+    return prn + 140 if prn <= 40 else prn + 182
+
+
+def sbf_block(tow, svid, words, blk=4242, valid=1, crc_err=False):
+    """ binary SBF raw navigation block """
+    body = struct.pack('<IHBBBBBB', int(tow * 1000), 2310, svid, valid,
+                       0, 0, 0, 0) + struct.pack('<%dI' % len(words), *words)
+    body += b'\0' * (-(len(body) + 8) % 4)
+    head = struct.pack('<HH', blk, len(body) + 8)
+    crc = crc_hqx(head + body, 0) ^ crc_err
+    return b'$@' + struct.pack('<H', crc) + head + body
+
+
+@pytest.fixture
+def text_file(tmp_path):
+    lines = [text_line(345600 + k, 59 if k % 3 else 60, nav_words(k))
+             for k in range(10)]
+    lines.insert(4, text_line(345604.5, 59, nav_words(99), valid=b'Failed'))
+    lines.insert(6, text_line(345605.5, 59, nav_words(98), sep=b'\t'))
+    file = tmp_path / 'SEPT1350.24__SBF_BDSRawB2b.txt'
+    file.write_bytes(b''.join(lines))
+    return file
+
+
+def read_genfromtxt(file, prn):
+    """ records of the former np.genfromtxt path of decode_B2B_sept.py """
+    dtype = [('tow', 'float64'), ('wn', 'int'), ('prn', 'S3'),
+             ('validity', 'S10'), ('signal', 'S10'), ('num2', 'int'),
+             ('nav', 'S278')]
+    v = np.genfromtxt(file, dtype=dtype, delimiter=',')
+    v = v[v['validity'] == b'Passed']
+    v = v[v['prn'] == ('C' + str(prn)).encode()]
+    for i, nav in enumerate(v['nav']):
+        v[i]['nav'] = b''.join(nav.split())
+    return v
+
+
+def test_text_filter(text_file):
+    v = sbf.read_sbf_text(text_file)
+    assert len(v) == 11  # 'Failed' record dropped
+    v = sbf.read_sbf_text(text_file, prn=60)
+    assert list(v['tow']) == [345600.0, 345603.0, 345606.0, 345609.0]
+    assert set(sbf.read_sbf_text(text_file, prn=[59, 60])['prn']) == {59, 60}
+    assert len(sbf.read_sbf_text(text_file, prn=1)) == 0
+
+
+def test_text_types(text_file):
+    v = sbf.read_sbf_text(text_file)
+    assert v.dtype['tow'] == np.dtype('f8')
+    assert v.dtype['wn'] == np.dtype('u2')
+    assert v.dtype['prn'] == np.dtype('u1')
+    assert v.dtype['nav'].base == np.dtype('u1')
+    assert v.dtype['nav'].shape == (sbf.NBYTE_NAV,)
+    assert sbf.read_sbf_text(text_file, nbyte=123).dtype['nav'].shape == (123,)
+
+
+def test_text_whitespace(text_file):
+    # NAVBits separated by tabs
+    v = sbf.read_sbf_text(text_file)
+    rec = v[v['tow'] == 345605.5][0]
+    nav = b''.join(b'%08X' % w for w in nav_words(98))
+    assert bytes(rec['nav'][:124]) == unhexlify(nav)
+    assert not np.any(rec['nav'][124:])
+
+
+def test_text_chunks(text_file):
+    chunks = list(sbf.iter_sbf_text(text_file, nchunk=4))
+    assert [len(c) for c in chunks] == [4, 4, 3]
+    assert np.array_equal(np.concatenate(chunks), sbf.read_sbf_text(text_file))
+
+
+def test_text_genfromtxt(text_file):
+    ref = read_genfromtxt(text_file, 59)
+    v = sbf.read_sbf_text(text_file, prn=59)
+    assert len(v) == len(ref) == 7
+    assert np.array_equal(v['tow'], ref['tow'])
+    assert np.array_equal(v['wn'], ref['wn'])
+    assert all(b'C%02d' % p == r for p, r in zip(v['prn'], ref['prn']))
+    for nav, nav_ref in zip(v['nav'], ref['nav']):
+        assert hexlify(bytes(nav[:124])).upper() == nav_ref
+
+
+def test_binary(tmp_path):
+    data = [sbf_block(345600 + k, bds_svid(59), nav_words(k)) for k in range(5)]
+    data.insert(1, sbf_block(345600.5, bds_svid(59), nav_words(97), crc_err=True))
+    data.insert(2, sbf_block(345600.6, bds_svid(59), nav_words(96), valid=0))
+    data.insert(3, sbf_block(345600.7, 70 + 5, nav_words(95)[:16], blk=4024))
+    data.insert(4, sbf_block(345600.8, bds_svid(41), nav_words(94)))  # C41
+    file = tmp_path / 'SEPT1350.24_.sbf'
+    file.write_bytes(b''.join(data))
+
+    v = sbf.read_sbf(str(file), 4242)
+    assert list(v['tow']) == [345600.0, 345600.8] + [345601.0 + k
+                                                     for k in range(4)]
+    assert list(v['prn']) == [59, 41, 59, 59, 59, 59]
+    v = sbf.read_sbf(str(file), 4242, prn=59)
+    assert len(v) == 5  # CRC error and not CRCPassed blocks dropped
+    nav = b''.join(struct.pack('>I', w) for w in nav_words(2))
+    assert bytes(v[2]['nav'][:124]) == nav
+    v = sbf.read_sbf(str(file), 4024)
+    assert list(v['prn']) == [5]
+
+
+def test_binary_text_same(tmp_path, text_file):
+    v_txt = sbf.read_sbf_text(text_file)
+    data = b''.join(sbf_block(r['tow'], bds_svid(int(r['prn'])),
+                    struct.unpack('>%dI' % NWORD, bytes(r['nav'][:124])))
+                    for r in v_txt)
+    file = tmp_path / 'SEPT1350.24_.sbf'
+    file.write_bytes(data)
+    assert np.array_equal(sbf.read_sbf(str(file), 4242), v_txt)
+    assert np.array_equal(sbf.read_sbf(str(text_file), 4242), v_txt)
+
+
+def feed_all(framer, data, sizes):
+    """ feed data split by sizes, return concatenated records """
+    v, i, k = [], 0, 0
+    while i < len(data):
+        n = sizes[k % len(sizes)]
+        v.append(framer.feed(data[i:i+n]))
+        i, k = i + n, k + 1
+    return np.concatenate(v)
+
+
+def test_framer(tmp_path):
+    data = b''.join(sbf_block(345600 + k, bds_svid(59), nav_words(k))
+                    for k in range(6))
+    file = tmp_path / 'SEPT1350.24_.sbf'
+    file.write_bytes(data)
+    ref = sbf.read_sbf(str(file), 4242)
+    for sizes in ([len(data)], [1], [7, 150, 3], [144]):
+        framer = sbf.sbf_framer(4242)
+        assert np.array_equal(feed_all(framer, data, sizes), ref)
+        assert framer.nblk == 6 and framer.nerr == 0
+        assert len(framer.buff) == 0
+
+
+def test_framer_errors():
+    blk = [sbf_block(345600 + k, bds_svid(59), nav_words(k)) for k in range(3)]
+    bad = sbf_block(345610, bds_svid(59), nav_words(9), crc_err=True)
+    # CRC error, noise with a false sync and a truncated block
+    data = b'$@xx' + blk[0] + bad + b'\x00$' + blk[1] + blk[2][:50] + blk[2]
+    framer = sbf.sbf_framer(4242, prn=59)
+    v = feed_all(framer, data, [33])
+    assert list(v['tow']) == [345600.0, 345601.0, 345602.0]
+    assert framer.nerr == 2  # bad and truncated block
+    framer.feed(blk[0][:10])
+    framer.reset()
+    assert len(framer.feed(blk[1])) == 1
@@ -0,0 +1,121 @@
+import numpy as np
+import pytest
+
+from B2b_HAS_decoder import sdr_ldpc_test
+
+
+def frame(flip=()):
+    """ BDSRawB2b 'nav' bytes of all-zero codeword (12-bit header) """
+    bits = np.zeros(123 * 8, dtype='uint8')
+    for i in flip:
+        bits[12 + i] ^= 1
+    return {'nav': np.packbits(bits)}
+
+
+def test_clean_frame_fast():
+    stat = sdr_ldpc_test.ldpc_stat_t()
+    msg = sdr_ldpc_test.decode_LDPC(frame(), stat)
+    assert msg == bytes(61)
+    assert stat.stat == {'fast': 1, 'iter': 0, 'fail': 0}
+
+
+def test_corrupted_frame_iter():
+    stat = sdr_ldpc_test.ldpc_stat_t()
+    msg = sdr_ldpc_test.decode_LDPC(frame(flip=(5,)), stat)
+    assert msg == bytes(61)
+    assert stat.stat == {'fast': 0, 'iter': 1, 'fail': 0}
+
+
+def test_syndrome_not_recomputed(monkeypatch):
+    nb_ldpc = sdr_ldpc_test.sdr_nb_ldpc
+    syndrome_G = nb_ldpc.syndrome_G
+    calls = []
+
+    def count(G, code):
+        calls.append(len(code))
+        return syndrome_G(G, code)
+
+    monkeypatch.setattr(nb_ldpc, 'syndrome_G', count)
+    frm = frame(flip=(5,))
+    sdr_ldpc_test.decode_LDPC(frm)
+    ncall = len(calls)
+
+    # same number of syndromes as iterative decoding alone
+    calls.clear()
+    G = sdr_ldpc_test.sdr_ldpc.gen_NB_LDPC_G('BCNV3')
+    syms = np.unpackbits(frm['nav'])[None, 12:]
+    nb_ldpc.decode_NB_LDPC_R(G, syms)
+    assert ncall == len(calls)
+
+
+def test_parallel_executor_stat():
+    # pool given by caller, statistics kept per decoder
+    from concurrent.futures import ThreadPoolExecutor
+    rows = np.zeros(5, dtype=[('nav', 'u1', 123)])
+    rows['nav'][2] = frame(flip=(5,))['nav']
+    rows['nav'][4] = frame(flip=(1, 7))['nav']
+    s1, s2 = sdr_ldpc_test.ldpc_stat_t(), sdr_ldpc_test.ldpc_stat_t()
+    msgs, nerr = sdr_ldpc_test.decode_LDPC_batch(rows, stat=s1)
+    with ThreadPoolExecutor(2) as executor:
+        for k in range(2):
+            msgs2, nerr2 = sdr_ldpc_test.decode_LDPC_parallel(rows, executor,
+                                                              nchunk=2,
+                                                              stat=s2)
+    assert np.array_equal(msgs, msgs2) and list(nerr2) == [0, 0, 1, 0, 2]
+    assert s1.stat == {'fast': 3, 'iter': 2, 'fail': 0}
+    assert s2.stat == {'fast': 6, 'iter': 4, 'fail': 0}
+    assert s2.hist['nerr'] == {0: 6, 1: 2, 2: 2}
+    s2.reset()
+    assert s2.stat['fast'] == 0 and s2.hist['nerr'] == {}
+
+
+def test_binary_max_iter_restored():
+    from ctypes import c_int
+    from B2b_HAS_decoder import sdr_ldpc
+    try:
+        ctx = sdr_ldpc.gen_B_LDPC_ctx('IRNV1_SF3')
+    except (OSError, AttributeError) as e:
+        pytest.skip("libldpc not available: " + str(e))
+    lib_max_iter = c_int.in_dll(sdr_ldpc.libldpc, "max_iter")
+    max_iter0 = lib_max_iter.value
+    syms = np.zeros((2, ctx.n), dtype='uint8')
+    syms[1, 3] = 1
+    res = sdr_ldpc.decode_B_LDPC_R(ctx, syms, max_iter=5)
+    assert lib_max_iter.value == max_iter0
+    assert list(res.nerr) == [0, 1]
+    assert not np.any(res.syms_dec)
+
+
+def test_binary_check():
+    from types import SimpleNamespace
+    from B2b_HAS_decoder import sdr_ldpc as L
+    rows, cols = L.gen_B_LDPC_idx(274, 548, 23, L.H_IRNV1_SF3_A,
+        L.H_IRNV1_SF3_B, L.H_IRNV1_SF3_C, L.H_IRNV1_SF3_D, L.H_IRNV1_SF3_E,
+        L.H_IRNV1_SF3_T)
+    ctx = SimpleNamespace(rows=rows, cols=cols,
+                          rowp=np.flatnonzero(np.diff(rows, prepend=-1)))
+    H = np.zeros((274, 548), dtype='int64')
+    H[rows, cols] = 1
+    rng = np.random.default_rng(7)
+    dblk = rng.integers(0, 2, (5, 548)).astype('int8')
+    dblk[0] = 0
+    syms = dblk.copy()
+    syms[1, [3, 9]] ^= 1
+    # likelihood ratios of hard decisions syms (libldpc: bit = lratio > 1)
+    ok, nerr = L.check_B_LDPC(ctx, dblk, np.where(syms, 1e5, 1e-5))
+    assert list(ok) == list(~np.any(dblk @ H.T % 2, axis=1))
+    assert ok[0] and list(nerr) == [0, 2, 0, 0, 0]
+
+
+def test_hex_conv():
+    # same as per-bit implementations of the benchmark
+    from bench_sdr_ldpc import read_hex_ref, hex_str_ref
+    rng = np.random.default_rng(3)
+    for n in (0, 4, 12, 486, 992):
+        bits = rng.integers(0, 2, n, dtype='uint8')
+        hex_txt = hex_str_ref(bits)
+        assert sdr_ldpc_test.hex_str(bits) == hex_txt
+        assert np.array_equal(sdr_ldpc_test.read_hex(hex_txt),
+                              bits[:n // 4 * 4])
+        assert np.array_equal(sdr_ldpc_test.read_hex(hex_txt.lower() + 'a'),
+                              read_hex_ref(hex_txt + 'A'))
@@ -0,0 +1,81 @@
+import socket
+import time
+
+import numpy as np
+import pytest
+
+from B2b_HAS_decoder.gnss import id2sat, epoch2time, time2gpst
+from B2b_HAS_decoder.ssr_server import ssr_server, encode_bnc, encode_bin, \
+    decode_bin
+
+
+@pytest.fixture
+def epoch():
+    t = epoch2time([2024, 5, 14, 1, 2, 30])
+    corr = {id2sat('G01'): (45, 0.1234, np.array([0.5, -1.25, 0.0625])),
+            id2sat('C59'): (3, -2.5, np.array([0.0, 0.1, -0.2]))}
+    return t, corr
+
+
+def test_bin_roundtrip(epoch):
+    t, corr = epoch
+    buff = encode_bin(t, 'HAS', corr)
+    t1, src, corr1, n = decode_bin(b'xyz' + buff + b'SS', 3)
+    assert n == len(buff) and src == 'HAS'
+    assert time2gpst(t1) == time2gpst(t)
+    assert list(corr1) == list(corr)
+    for sat, (iode, dclk, dorb) in corr.items():
+        assert corr1[sat][0] == iode
+        assert corr1[sat][1] == pytest.approx(dclk, abs=1e-6)
+        assert np.allclose(corr1[sat][2], dorb, atol=1e-6)
+
+
+def test_bin_invalid(epoch):
+    t, corr = epoch
+    buff = bytearray(encode_bin(t, 'B2B', corr))
+    assert decode_bin(buff[:-1]) is None  # incomplete
+    assert decode_bin(buff[:10]) is None
+    buff[20] ^= 1
+    assert decode_bin(buff) is None  # CRC32 error
+    assert decode_bin(b'XX' + bytes(buff[2:])) is None
+
+
+def test_bnc(epoch):
+    t, corr = epoch
+    s = encode_bnc(t, 'B2B', corr).decode().splitlines()
+    assert s[0].split() == ['>', 'CLOCK', '2024', '05', '14', '01', '02',
+                            '30', '0', '2', 'B2B']
+    assert s[1].split() == ['G01', '45', '0.1234', '0.0000', '0.0000']
+    assert s[3].startswith('> ORBIT')
+    assert s[5].split()[:5] == ['C59', '3', '0.0000', '0.1000', '-0.2000']
+
+
+def recv_msg(sock, n):
+    buff = b''
+    while len(buff) < n:
+        data = sock.recv(n - len(buff))
+        assert data
+        buff += data
+    return buff
+
+
+def test_server(epoch):
+    t, corr = epoch
+    srv = ssr_server('127.0.0.1', port_bin=0, port_bnc=0).start()
+    try:
+        with socket.create_connection(('127.0.0.1', srv.ports['bin']), 5) \
+                as sock_bin, \
+                socket.create_connection(('127.0.0.1', srv.ports['bnc']), 5) \
+                as sock_bnc:
+            tend = time.time() + 5
+            while srv.nsub < 2 and time.time() < tend:  # wait subscription
+                time.sleep(0.01)
+            srv.publish(t, 'B2B', {})  # no corrections not published
+            srv.publish(t, 'B2B', corr)
+            ref = encode_bin(t, 'B2B', corr)
+            assert recv_msg(sock_bin, len(ref)) == ref
+            ref = encode_bnc(t, 'B2B', corr)
+            assert recv_msg(sock_bnc, len(ref)) == ref
+        assert srv.npub == 1
+    finally:
+        srv.stop()
@@ -0,0 +1,72 @@
+import asyncio
+from datetime import datetime
+
+import numpy as np
+
+from B2b_HAS_decoder.sbf import sbf_dtype, sbf_framer
+from B2b_HAS_decoder.stream import nav_stream, iter_stream, iter_days
+from test_sbf import sbf_block, bds_svid, nav_words
+
+
+def bytes_transport(data):
+    """ transport giving data once, then connection refused """
+    sent = []
+
+    async def connect():
+        if sent:
+            raise OSError('connection refused')
+        sent.append(True)
+        reader = asyncio.StreamReader()
+        reader.feed_data(data)
+        reader.feed_eof()
+        return reader, None
+    return connect
+
+
+DATA = b''.join(sbf_block(345600 + k, bds_svid(59), nav_words(k))
+                for k in range(5))
+
+
+def test_handler_error(caplog):
+    tow = []
+
+    def handler(rec):
+        if rec['tow'][0] == 345601.0:
+            raise ValueError('bad frame')
+        tow.extend(rec['tow'])
+
+    for offload in (False, True):
+        tow.clear()
+        st = nav_stream(bytes_transport(DATA), sbf_framer(4242), handler,
+                        nread=len(DATA) // 5, tmin=0.01, maxretry=0,
+                        offload=offload)
+        asyncio.run(asyncio.wait_for(st.run(), 10))
+        # stream not stopped by the exception of handler
+        assert tow == [345600.0, 345602.0, 345603.0, 345604.0]
+        assert st.nchunk == 5 and st.nerr == 1
+        assert st.lasterr == 'ValueError: bad frame'
+        assert 'errors=1' in st.stat_str()
+    # errors of handler logged
+    assert [r.getMessage() for r in caplog.records] == [
+        'stream: handler error: ValueError: bad frame'] * 2
+
+
+def test_iter_stream():
+    rec = list(iter_stream(bytes_transport(DATA), sbf_framer(4242),
+                           nread=100, tmin=0.01, maxretry=0))
+    assert [r for c in rec for r in c['tow']] == [345600.0 + k
+                                                  for k in range(5)]
+
+
+def test_iter_days():
+    # chunks split at the start of days (GPST)
+    v = np.zeros(6, dtype=sbf_dtype())
+    v['wn'] = [2314, 2314, 2314, 2314, 2315, 2315]
+    v['tow'] = [172799.0, 172800.0, 172801.0, 604799.0, 0.0, 1.0]
+    chunks = [v[:2], v[2:2], v[2:5], v[5:]]
+    days = [(d, [list(c['tow']) for c in g]) for d, g in iter_days(chunks)]
+    assert days == [
+        (datetime(2024, 5, 13), [[172799.0]]),
+        (datetime(2024, 5, 14), [[172800.0], [172801.0]]),
+        (datetime(2024, 5, 18), [[604799.0]]),
+        (datetime(2024, 5, 19), [[0.0], [1.0]])]